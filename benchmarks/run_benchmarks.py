@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+"""
+Benchmark the extraction and mapping pipeline on synthetic documents.
+
+Each repetition generates a fresh ``.docx`` and markdown tree (see
+``synthetic_docx.py``), then times every phase: a cold and an unchanged
+(incremental) ``extract_all_images`` with a per-method breakdown,
+``analyze_placeholders`` with a cold and a warm cache, ``suggest_mappings``
+and ``apply_mappings``. Peak traced memory is recorded per phase.
+
+Results are written as JSON so runs on two commits can be compared::
+
+    python benchmarks/run_benchmarks.py --images 500 --output before.json
+    git checkout <other commit>
+    python benchmarks/run_benchmarks.py --images 500 --output after.json --compare before.json
+"""
+
+import argparse
+import contextlib
+import functools
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+BENCHMARK_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCHMARK_DIR.parent))
+sys.path.insert(0, str(BENCHMARK_DIR))
+
+import extract_images  # noqa: E402
+from synthetic_docx import generate_docx, generate_markdown_tree  # noqa: E402
+
+# Extractor methods timed individually; missing ones are skipped so the
+# suite keeps working across refactors
+EXTRACTOR_METHODS = (
+    "_fingerprint_source",
+    "_load_relationships",
+    "_find_drawings",
+    "_extract_media_parts",
+    "_remove_stale_images",
+    "_save_manifest",
+    "_build_image_index",
+    "_generate_extraction_report",
+)
+
+
+class PhaseTimer:
+    """Accumulate wall time and peak traced memory per named phase."""
+
+    def __init__(self, trace_memory: bool = True):
+        self.trace_memory = trace_memory
+        self.phases = {}
+        self.methods = {}
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        if self.trace_memory:
+            tracemalloc.start()
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - started
+            peak = None
+            if self.trace_memory:
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+            entry = self.phases.setdefault(name, {"seconds": [], "peak_bytes": []})
+            entry["seconds"].append(seconds)
+            if peak is not None:
+                entry["peak_bytes"].append(peak)
+
+    def wrap_methods(self, obj, prefix: str, names):
+        """Time each call to the named methods of ``obj``."""
+        for name in names:
+            method = getattr(obj, name, None)
+            if method is not None:
+                setattr(obj, name, self._timed(f"{prefix}.{name}", method))
+
+    def _timed(self, key: str, method: Callable) -> Callable:
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                self.methods[key] = self.methods.get(key, 0.0) + time.perf_counter() - started
+        return wrapper
+
+
+def run_once(workdir: Path, config: Dict, timer: PhaseTimer) -> Dict:
+    """Generate one document and markdown tree and time every phase on it."""
+    docx = workdir / "synthetic.docx"
+    md_dir = workdir / "docs"
+    output_dir = workdir / "extracted_images"
+
+    captions = generate_docx(
+        docx, images=config["images"], image_size=tuple(config["image_size"]),
+        duplicate_ratio=config["duplicate_ratio"], anchored_ratio=config["anchored_ratio"],
+        base64_images=config["base64_images"], stored=config["stored"], seed=config["seed"],
+    )
+    generate_markdown_tree(md_dir, captions, placeholders=config["placeholders"],
+                           files=config["md_files"], seed=config["seed"])
+    counts = {"docx_bytes": docx.stat().st_size}
+
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        extractor = extract_images.EnhancedWordImageExtractor(str(docx), str(output_dir))
+        timer.wrap_methods(extractor, "extract", EXTRACTOR_METHODS)
+        with timer.phase("extract_all_images"):
+            image_mapping = extractor.extract_all_images()
+        counts["images"] = len(image_mapping)
+
+        warm = extract_images.EnhancedWordImageExtractor(str(docx), str(output_dir))
+        with timer.phase("extract_all_images_unchanged"):
+            warm.extract_all_images()
+
+        cache_file = str(output_dir / extract_images.PLACEHOLDER_CACHE_FILE)
+
+        def mapper():
+            return extract_images.MarkdownImageMapper(
+                str(md_dir), image_mapping, extractor.image_sources,
+                extractor.image_index, cache_file=cache_file)
+
+        with timer.phase("analyze_placeholders"):
+            placeholder_map = mapper().analyze_placeholders()
+        with timer.phase("analyze_placeholders_cached"):
+            mapper().analyze_placeholders()
+        counts["placeholders"] = sum(len(p) for p in placeholder_map.values())
+
+        suggesting = mapper()
+        with timer.phase("suggest_mappings"):
+            suggestions = suggesting.suggest_mappings(placeholder_map)
+        counts["suggestions"] = len(suggestions)
+
+        with timer.phase("apply_mappings"):
+            mapper().apply_mappings(suggestions, backup=False, placeholder_map=placeholder_map)
+
+    return counts
+
+
+def summarize(timer: PhaseTimer) -> Dict:
+    phases = {}
+    for name, entry in timer.phases.items():
+        seconds = entry["seconds"]
+        phases[name] = {
+            "seconds": [round(s, 6) for s in seconds],
+            "min": round(min(seconds), 6),
+            "median": round(statistics.median(seconds), 6),
+        }
+        if entry["peak_bytes"]:
+            phases[name]["peak_bytes"] = max(entry["peak_bytes"])
+    return phases
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BENCHMARK_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: Dict, baseline_file: str):
+    """Print the median time of each phase relative to a baseline run."""
+    with open(baseline_file, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+
+    print(f"\nCompared with {baseline_file} ({baseline.get('commit')}):")
+    for name, phase in results["phases"].items():
+        before = baseline.get("phases", {}).get(name)
+        if not before or not before["median"]:
+            print(f"  {name:32} {phase['median']:9.4f}s  (new)")
+            continue
+        ratio = phase["median"] / before["median"]
+        print(f"  {name:32} {before['median']:9.4f}s -> {phase['median']:9.4f}s  x{ratio:.2f}")
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--images", type=int, default=200, help="Media parts in the document")
+    parser.add_argument("--image-size", default="320x240", help="WIDTHxHEIGHT of each image")
+    parser.add_argument("--duplicate-ratio", type=float, default=0.2,
+                        help="Fraction of media parts repeating an earlier image")
+    parser.add_argument("--anchored-ratio", type=float, default=0.3,
+                        help="Fraction of drawings anchored instead of inline")
+    parser.add_argument("--base64-images", type=int, default=0,
+                        help="VML images embedded as base64 data URIs")
+    parser.add_argument("--stored", action="store_true",
+                        help="Store media parts uncompressed instead of deflated")
+    parser.add_argument("--placeholders", type=int, default=200,
+                        help="Image placeholders in the markdown tree")
+    parser.add_argument("--md-files", type=int, default=20, help="Markdown files to generate")
+    parser.add_argument("--repeat", type=int, default=3, help="Repetitions of every phase")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed for the generator")
+    parser.add_argument("--no-memory", action="store_true",
+                        help="Skip tracemalloc, which slows down the timed phases")
+    parser.add_argument("--output", default="benchmark_results.json", help="JSON results file")
+    parser.add_argument("--compare", help="Previous results file to compare against")
+    args = parser.parse_args(argv)
+
+    width, height = (int(v) for v in args.image_size.lower().split("x"))
+    config = {
+        "images": args.images,
+        "image_size": [width, height],
+        "duplicate_ratio": args.duplicate_ratio,
+        "anchored_ratio": args.anchored_ratio,
+        "base64_images": args.base64_images,
+        "stored": args.stored,
+        "placeholders": args.placeholders,
+        "md_files": args.md_files,
+        "repeat": args.repeat,
+        "seed": args.seed,
+    }
+
+    timer = PhaseTimer(trace_memory=not args.no_memory)
+    counts = {}
+    for repetition in range(args.repeat):
+        workdir = Path(tempfile.mkdtemp(prefix="extract_images_bench_"))
+        try:
+            counts = run_once(workdir, config, timer)
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+        print(f"Run {repetition + 1}/{args.repeat}: "
+              + ", ".join(f"{name} {entry['seconds'][-1]:.3f}s"
+                          for name, entry in timer.phases.items()))
+
+    results = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": config,
+        "counts": counts,
+        "phases": summarize(timer),
+        "methods": {name: round(seconds / args.repeat, 6)
+                    for name, seconds in sorted(timer.methods.items())},
+    }
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults saved to: {args.output}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Compare the monolithic search index of a built site with its shards.
+
+The index is sharded into a temporary copy of the site's ``search``
+directory (see ``search_index_hook.SearchIndexSharder``), then for the
+monolithic index, the manifest and every shard the raw, gzip and (if
+installed) brotli sizes are recorded, along with the median ``json.loads``
+time. Pages that are never searched load no index with the shard loader;
+the first search loads the manifest and every shard in parallel, so the
+largest shard bounds the parse time of any single response::
+
+    mkdocs build
+    python benchmarks/search_index_benchmark.py site --output search_bench.json
+"""
+
+import argparse
+import gzip
+import json
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+BENCHMARK_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCHMARK_DIR.parent))
+
+import search_index_hook  # noqa: E402
+
+
+def median_seconds(func: Callable, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings)
+
+
+def measure(data: bytes, repeat: int) -> Dict:
+    """Sizes of one JSON file and the time to parse it."""
+    result = {
+        "bytes": len(data),
+        "gzip_bytes": len(gzip.compress(data, 9, mtime=0)),
+        "parse_seconds": round(median_seconds(lambda: json.loads(data), repeat), 6),
+    }
+    brotli = search_index_hook.optional_brotli()
+    if brotli is not None:
+        result["br_bytes"] = len(brotli.compress(data))
+    return result
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("site_dir", nargs="?", default="site", help="Built MkDocs site")
+    parser.add_argument("--repeat", type=int, default=20, help="Repetitions of every parse")
+    parser.add_argument("--output", default="search_index_benchmark.json",
+                        help="JSON results file")
+    args = parser.parse_args(argv)
+
+    index_file = Path(args.site_dir) / search_index_hook.SEARCH_INDEX_FILE
+    if not index_file.exists():
+        parser.error(f"search index not found: {index_file}")
+
+    workdir = Path(tempfile.mkdtemp(prefix="search_index_bench_"))
+    try:
+        copy = workdir / search_index_hook.SEARCH_INDEX_FILE
+        copy.parent.mkdir(parents=True)
+        shutil.copyfile(index_file, copy)
+        sharder = search_index_hook.SearchIndexSharder(str(workdir))
+        manifest = sharder.shard()
+
+        monolithic = index_file.read_bytes()
+        results = {
+            "site_dir": args.site_dir,
+            "monolithic": measure(monolithic, args.repeat),
+            "manifest": measure(sharder.manifest_file.read_bytes(), args.repeat),
+            "shards": {},
+        }
+        for section, entry in manifest["sections"].items():
+            data = (sharder.shard_dir / Path(entry["path"]).name).read_bytes()
+            results["shards"][section] = {"docs": entry["docs"], **measure(data, args.repeat)}
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    # First search: the manifest plus all shards
+    mono = results["monolithic"]
+    first = {key: results["manifest"][key] + sum(entry[key] for entry in results["shards"].values())
+             for key in mono if key in results["manifest"]}
+    results["first_search"] = first
+
+    print(f"{'':24} {'bytes':>10} {'gzip':>10} {'parse ms':>10}")
+    rows = [("monolithic", mono), ("manifest", results["manifest"]),
+            ("first search", first)]
+    rows += [(f"  {section}", entry) for section, entry in results["shards"].items()]
+    for name, entry in rows:
+        print(f"{name:24} {entry['bytes']:>10} {entry['gzip_bytes']:>10} "
+              f"{entry['parse_seconds'] * 1000:>10.3f}")
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults saved to: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""
+Generate synthetic Word documents and matching markdown trees for benchmarks.
+
+Only the standard library is used: PNGs are encoded with ``zlib`` and the
+package is written with ``zipfile``, so documents of any size can be produced
+locally without Word or python-docx.
+"""
+
+import base64
+import random
+import struct
+import zlib
+from pathlib import Path
+from typing import Dict, List, Tuple
+from zipfile import ZIP_DEFLATED, ZIP_STORED, ZipFile
+from xml.sax.saxutils import escape
+
+CONTENT_TYPES = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">
+<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>
+<Default Extension="xml" ContentType="application/xml"/>
+<Default Extension="png" ContentType="image/png"/>
+<Override PartName="/word/document.xml" ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>
+</Types>"""
+
+PACKAGE_RELS_NS = "http://schemas.openxmlformats.org/package/2006/relationships"
+
+PACKAGE_RELS = f"""<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="{PACKAGE_RELS_NS}">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="word/document.xml"/>
+</Relationships>"""
+
+IMAGE_REL_TYPE = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/image"
+
+DOCUMENT_START = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"'
+    ' xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships"'
+    ' xmlns:wp="http://schemas.openxmlformats.org/drawingml/2006/wordprocessingDrawing"'
+    ' xmlns:a="http://schemas.openxmlformats.org/drawingml/2006/main"'
+    ' xmlns:pic="http://schemas.openxmlformats.org/drawingml/2006/picture"'
+    ' xmlns:v="urn:schemas-microsoft-com:vml"><w:body>'
+)
+DOCUMENT_END = '</w:body></w:document>'
+
+DRAWING = (
+    '<w:r><w:drawing><wp:{kind}><wp:docPr id="{id}" name="Picture {id}" descr="{descr}"/>'
+    '<a:graphic><a:graphicData><pic:pic><pic:blipFill><a:blip r:embed="{rId}"/>'
+    '</pic:blipFill></pic:pic></a:graphicData></a:graphic></wp:{kind}></w:drawing></w:r>'
+)
+
+WORDS = (
+    "agent server install configure service logs windows linux password target "
+    "application planning scheduler process cloud deployment token database "
+    "connection properties folder archive restart status"
+).split()
+
+
+def png_bytes(width: int, height: int, rng: random.Random) -> bytes:
+    """Encode a noisy RGB PNG, so its compressed size tracks its dimensions."""
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return (struct.pack(">I", len(data)) + kind + data
+                + struct.pack(">I", zlib.crc32(kind + data) & 0xffffffff))
+
+    row = width * 3
+    raw = b"".join(b"\x00" + rng.randbytes(row) for _ in range(height))
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header)
+            + chunk(b"IDAT", zlib.compress(raw, 6)) + chunk(b"IEND", b""))
+
+
+def caption_for(number: int, rng: random.Random) -> str:
+    """A short, mostly unique phrase used both in the document and markdown."""
+    return f"Figure {number} " + " ".join(rng.sample(WORDS, 4))
+
+
+def generate_docx(path: Path, images: int = 100, image_size: Tuple[int, int] = (320, 240),
+                  duplicate_ratio: float = 0.2, anchored_ratio: float = 0.3,
+                  base64_images: int = 0, stored: bool = False, seed: int = 0) -> List[str]:
+    """
+    Write a synthetic ``.docx`` to ``path`` and return the figure captions in
+    document order.
+
+    ``duplicate_ratio`` of the ``images`` media parts repeat the bytes of an
+    earlier part under a new name, ``anchored_ratio`` of the drawings use
+    ``wp:anchor`` instead of ``wp:inline``, and ``base64_images`` VML images
+    are embedded as data URIs in ``word/media/vmldata.xml``. With ``stored``
+    the media parts are written uncompressed, as Word does for JPEGs.
+    """
+    rng = random.Random(seed)
+    width, height = image_size
+    captions = []
+    body = []
+    rels = []
+    unique = []
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with ZipFile(path, 'w', ZIP_DEFLATED) as package:
+        package.writestr("[Content_Types].xml", CONTENT_TYPES)
+        package.writestr("_rels/.rels", PACKAGE_RELS)
+
+        for number in range(1, images + 1):
+            if unique and rng.random() < duplicate_ratio:
+                data = rng.choice(unique)
+            else:
+                data = png_bytes(width, height, rng)
+                unique.append(data)
+            package.writestr(f"word/media/image{number}.png", data,
+                             compress_type=ZIP_STORED if stored else ZIP_DEFLATED)
+
+            rId = f"rId{number + 100}"
+            rels.append(f'<Relationship Id="{rId}" Type="{IMAGE_REL_TYPE}" '
+                        f'Target="media/image{number}.png"/>')
+
+            caption = caption_for(number, rng)
+            captions.append(caption)
+            kind = "anchor" if rng.random() < anchored_ratio else "inline"
+            if number % 10 == 1:
+                body.append('<w:p><w:pPr><w:pStyle w:val="Heading1"/></w:pPr>'
+                            f'<w:r><w:t>Section {number // 10 + 1}</w:t></w:r></w:p>')
+            body.append("<w:p><w:r><w:t>" + escape(" ".join(rng.choices(WORDS, k=12)))
+                        + "</w:t></w:r></w:p>")
+            body.append("<w:p>" + DRAWING.format(kind=kind, id=number, rId=rId,
+                                                  descr=escape(caption)) + "</w:p>")
+            body.append('<w:p><w:pPr><w:pStyle w:val="Caption"/></w:pPr>'
+                        f'<w:r><w:t>{escape(caption)}</w:t></w:r></w:p>')
+
+        if base64_images:
+            shapes = "".join(
+                '<v:shape><v:imagedata src="data:image/png;base64,'
+                + base64.b64encode(png_bytes(width, height, rng)).decode("ascii")
+                + '"/></v:shape>'
+                for _ in range(base64_images)
+            )
+            package.writestr("word/media/vmldata.xml",
+                             f'<xml xmlns:v="urn:schemas-microsoft-com:vml">{shapes}</xml>')
+
+        package.writestr("word/document.xml", DOCUMENT_START + "".join(body) + DOCUMENT_END)
+        package.writestr(
+            "word/_rels/document.xml.rels",
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            f'<Relationships xmlns="{PACKAGE_RELS_NS}">' + "".join(rels)
+            + "</Relationships>"
+        )
+
+    return captions
+
+
+def generate_markdown_tree(directory: Path, captions: List[str], placeholders: int = 100,
+                           files: int = 10, seed: int = 0) -> Dict[str, int]:
+    """
+    Write ``files`` markdown pages holding ``placeholders`` image placeholders.
+
+    Placeholders reuse the document captions in order (cycling when there are
+    more placeholders than figures) and alternate between the markdown,
+    ``[IMAGE:...]`` and HTML comment forms. Returns the placeholder count per
+    file.
+    """
+    rng = random.Random(seed)
+    directory.mkdir(parents=True, exist_ok=True)
+    forms = ("![{}](images/placeholder.png)", "[IMAGE:{}]", "<!-- IMAGE: {} -->")
+    counts = {}
+    per_file = max(1, -(-placeholders // max(1, files)))
+
+    for index in range(files):
+        start = index * per_file
+        numbers = range(start, min(start + per_file, placeholders))
+        if not numbers:
+            break
+        lines = [f"# Page {index + 1}", ""]
+        for number in numbers:
+            caption = captions[number % len(captions)] if captions else f"Figure {number + 1}"
+            lines.append(" ".join(rng.choices(WORDS, k=30)))
+            lines.append("")
+            lines.append(forms[number % len(forms)].format(caption))
+            lines.append("")
+        page = directory / f"section_{index // 5}" / f"page_{index + 1}.md"
+        page.parent.mkdir(parents=True, exist_ok=True)
+        page.write_text("\n".join(lines), encoding="utf-8")
+        counts[page.relative_to(directory).as_posix()] = len(numbers)
+
+    return counts
@@ -0,0 +1,221 @@
+"""
+MkDocs hook that extracts the images of a Word document and resolves the
+image placeholders of the pages during the build.
+
+MkDocs loads hooks by path, so nothing needs to be installed. Register the
+hook and configure it under ``extra`` in mkdocs.yml::
+
+    hooks:
+      - docx_images_hook.py
+
+    extra:
+      docx_images:
+        document: EPMware Agent Install.docx   # relative to mkdocs.yml
+        mapping_file: image_mappings.json      # manual_mappings or suggestions
+        cache_dir: .cache/docx_images          # persistent extraction cache
+        images_uri: assets/images/docx         # site path of the mapped images
+        suggest: false                         # suggest images for unmapped placeholders
+        prune_unreferenced: true               # leave unreferenced docs images out
+        shared_cache: false                    # true, or a directory, to share images across guides
+
+Extraction reuses the manifest in ``cache_dir`` as a content-hash cache, so
+an unchanged document is not even opened on rebuilds. ``mkdocs serve`` also
+watches the document and the mapping file and rebuilds when either changes.
+Placeholders are replaced in the page markdown in memory; the sources are
+not rewritten and no ``.md.bak`` backups are made. Only the images that a
+page links to are added to the site.
+"""
+
+import contextlib
+import io
+import logging
+import os
+import posixpath
+from pathlib import Path
+from typing import Dict, Optional, Set
+
+from mkdocs.structure.files import File
+
+import extract_images
+
+log = logging.getLogger(f"mkdocs.plugins.{__name__}")
+
+# Key of the hook configuration in the ``extra`` section of mkdocs.yml
+CONFIG_KEY = "docx_images"
+
+DEFAULT_CACHE_DIR = ".cache/docx_images"
+DEFAULT_IMAGES_URI = "assets/images/docx"
+
+
+class DocxImagesBuild:
+    """State of the hook for one MkDocs configuration."""
+
+    def __init__(self, settings: Dict, project_dir: Path, docs_dir: Path, config_file: str):
+        self.project_dir = project_dir
+        self.docs_dir = docs_dir
+        self.config_file = config_file
+        self.document = project_dir / settings["document"]
+        self.cache_dir = project_dir / settings.get("cache_dir", DEFAULT_CACHE_DIR)
+        mapping_file = settings.get("mapping_file")
+        self.mapping_file = project_dir / mapping_file if mapping_file else None
+        self.images_uri = settings.get("images_uri", DEFAULT_IMAGES_URI).strip('/')
+        self.suggest = settings.get("suggest", False)
+        self.prune_unreferenced = settings.get("prune_unreferenced", False)
+        shared_cache = settings.get("shared_cache")
+        self.shared_cache = None
+        if shared_cache:
+            root = None if shared_cache is True else os.path.expanduser(shared_cache)
+            self.shared_cache = extract_images.SharedImageCache(root)
+        self.image_mapping = {}
+        self.pages = {}
+        self.mapper = extract_images.MarkdownImageMapper(str(docs_dir), {})
+
+    def extract(self):
+        """Bring the extraction cache up to date and resolve the mappings per page."""
+        metrics = extract_images.RunMetrics()
+        # The extractor reports on stdout; only a summary goes to the build log
+        with contextlib.redirect_stdout(io.StringIO()):
+            extractor = extract_images.EnhancedWordImageExtractor(
+                str(self.document), str(self.cache_dir), metrics=metrics,
+                shared_cache=self.shared_cache)
+            self.image_mapping = extractor.extract_all_images()
+            mappings = self._load_mappings(extractor, metrics)
+        for sample in metrics.error_samples:
+            log.warning(f"{sample['where']}: {sample['type']}: {sample['message']}")
+
+        self.pages = {}
+        for key, img_name in mappings.items():
+            md_file, placeholder = extract_images.split_mapping_key(key)
+            if img_name not in self.image_mapping:
+                log.warning(f"Unknown image in mapping for {key}: {img_name}")
+                continue
+            src_uri = self._page_uri(md_file)
+            if src_uri is None:
+                log.warning(f"Mapped page is outside docs_dir: {md_file}")
+                continue
+            self.pages.setdefault(src_uri, {})[placeholder.lower()] = img_name
+
+        state = "unchanged" if metrics.counters.get("document_unchanged") else "extracted"
+        log.info(f"{self.document.name}: {len(self.image_mapping)} images ({state}), "
+                 f"{sum(len(p) for p in self.pages.values())} placeholders mapped "
+                 f"on {len(self.pages)} pages")
+
+    def _load_mappings(self, extractor, metrics: extract_images.RunMetrics) -> Dict[str, str]:
+        """Mappings from the mapping file, completed by suggestions if enabled."""
+        config = {}
+        if self.mapping_file:
+            config = extract_images.load_mapping_file(str(self.mapping_file))
+        mappings = config.get("manual_mappings") or config.get("suggestions") or {}
+        if not self.suggest:
+            return mappings
+
+        mapper = extract_images.MarkdownImageMapper(
+            str(self.docs_dir), self.image_mapping, extractor.image_sources,
+            extractor.image_index,
+            cache_file=str(self.cache_dir / extract_images.PLACEHOLDER_CACHE_FILE),
+            metrics=metrics)
+        placeholder_map = mapper.analyze_placeholders()
+        suggestions = mapper.suggest_mappings(placeholder_map) if placeholder_map else {}
+        # Suggestion keys use the analyzed paths; key both by page to let the file win
+        merged = {}
+        for key, img_name in suggestions.items():
+            md_file, placeholder = extract_images.split_mapping_key(key)
+            merged[(self._page_uri(md_file), placeholder.lower())] = (key, img_name)
+        for key, img_name in mappings.items():
+            md_file, placeholder = extract_images.split_mapping_key(key)
+            merged[(self._page_uri(md_file), placeholder.lower())] = (key, img_name)
+        return dict(merged.values())
+
+    def _page_uri(self, md_file: str) -> Optional[str]:
+        """The docs-relative posix path of a mapped page, whatever its key style."""
+        path = Path(md_file.replace('\\', '/'))
+        if not path.is_absolute():
+            path = self.project_dir / path
+        relative = Path(os.path.relpath(path, self.docs_dir)).as_posix()
+        if relative == '..' or relative.startswith('../'):
+            return None
+        return relative
+
+    def referenced_images(self) -> Set[str]:
+        return {img_name for placeholders in self.pages.values()
+                for img_name in placeholders.values()}
+
+    def update_files(self, files, config):
+        """Add the mapped images to the site and drop unreferenced docs images."""
+        if self.prune_unreferenced:
+            collector = extract_images.ImageGarbageCollector(
+                str(self.docs_dir), config_file=self.config_file)
+            with contextlib.redirect_stdout(io.StringIO()):
+                unreferenced = {os.path.normcase(os.path.abspath(p))
+                                for p in collector.find_unreferenced()}
+            pruned = [f for f in files if f.abs_src_path
+                      and os.path.normcase(os.path.abspath(f.abs_src_path)) in unreferenced]
+            for file in pruned:
+                files.remove(file)
+            if pruned:
+                log.info(f"Left {len(pruned)} unreferenced images out of the site")
+
+        for img_name in sorted(self.referenced_images()):
+            src_uri = posixpath.join(self.images_uri, img_name)
+            existing = files.get_file_from_path(src_uri)
+            if existing is not None:
+                files.remove(existing)
+            files.append(File.generated(config, src_uri,
+                                        abs_src_path=self.image_mapping[img_name]))
+        return files
+
+    def render(self, markdown: str, src_uri: str) -> str:
+        """Replace the mapped placeholders of one page, linking relative to it."""
+        placeholders = self.pages.get(src_uri)
+        if not placeholders:
+            return markdown
+        page_dir = posixpath.dirname(src_uri) or '.'
+        self.mapper.image_mapping = {
+            img_name: posixpath.relpath(posixpath.join(self.images_uri, img_name), page_dir)
+            for img_name in set(placeholders.values())
+        }
+        content, replaced = self.mapper.replace_placeholders(markdown, placeholders)
+        if replaced:
+            log.debug(f"{src_uri}: replaced {replaced} placeholders")
+        return content
+
+
+_build: Optional[DocxImagesBuild] = None
+
+
+def on_config(config):
+    global _build
+    settings = config.extra.get(CONFIG_KEY)
+    if not settings or not settings.get("document"):
+        _build = None
+        return config
+    project_dir = Path(config.config_file_path).resolve().parent
+    _build = DocxImagesBuild(settings, project_dir, Path(config.docs_dir).resolve(),
+                             config.config_file_path)
+    return config
+
+
+def on_serve(server, config, builder):
+    if _build is None:
+        return server
+    for path in (_build.document, _build.mapping_file):
+        if path is not None and path.exists():
+            server.watch(str(path))
+    return server
+
+
+def on_pre_build(config):
+    if _build is not None:
+        _build.extract()
+
+
+def on_files(files, config):
+    if _build is None:
+        return files
+    return _build.update_files(files, config)
+
+
+def on_page_markdown(markdown, page, config, files):
+    if _build is None:
+        return markdown
+    return _build.render(markdown, page.file.src_uri)
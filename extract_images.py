@@ -5,332 +5,1624 @@ Enhanced script to extract ALL images from a Word document and map them to image
 
 import os
 import re
+import math
+import heapq
+import glob
+import time
 import shutil
-from pathlib import Path
-from typing import Dict, List, Tuple
+import sqlite3
+import posixpath
+import sys
+import contextlib
+import errno
+import mmap
+import struct
+import zlib
+import threading
+import tracemalloc
+from pathlib import Path, PurePosixPath
+from functools import lru_cache
+from typing import BinaryIO, Callable, Dict, List, Optional, Set, Tuple
+from urllib.parse import unquote, urlsplit
 import argparse
 import json
-from zipfile import ZipFile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from zipfile import ZIP_STORED, BadZipFile, ZipFile, ZipInfo
+from xml.etree import ElementTree
 import hashlib
 import base64
-from io import BytesIO
+import tempfile
+from io import BytesIO, StringIO
 
-# Required packages: pip install python-docx pillow
-# Optional but recommended: pip install docx2txt
+# Third-party packages are imported on first use so that steps which only
+# read markdown and JSON (analyze, apply, report) start instantly.
+# Required for optimize/responsive/near-duplicate stages: pip install pillow
+# Optional: pip install numpy lxml
 
-try:
-    from docx import Document
-    from PIL import Image
-except ImportError:
-    print("Please install required packages:")
-    print("pip install python-docx pillow")
-    exit(1)
 
-# Try to import optional docx2txt
-try:
-    import docx2txt
-    HAS_DOCX2TXT = True
-except ImportError:
-    HAS_DOCX2TXT = False
-    print("Note: docx2txt not installed. Install with 'pip install docx2txt' for better extraction")
-    print("Continuing with alternative methods...\n")
+def require_pillow():
+    """Import Pillow, exiting with install instructions if it is missing."""
+    try:
+        from PIL import Image
+    except ImportError:
+        print("Please install required packages:")
+        print("pip install pillow")
+        sys.exit(1)
+    return Image
+
+
+@lru_cache(maxsize=None)
+def optional_numpy():
+    """NumPy vectorizes scoring and hashing; None selects the pure-Python fallbacks."""
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+@lru_cache(maxsize=None)
+def iterparse_module():
+    """lxml is faster for the streaming document.xml scan; ElementTree is the fallback."""
+    try:
+        from lxml import etree
+    except ImportError:
+        return ElementTree
+    return etree
+
+
+# Namespaces used when resolving pictures inside the .docx package
+PACKAGE_RELS_NS = "http://schemas.openxmlformats.org/package/2006/relationships"
+DRAWINGML_NS = "http://schemas.openxmlformats.org/drawingml/2006/main"
+OFFICE_RELS_NS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+VML_NS = "urn:schemas-microsoft-com:vml"
+WORDML_NS = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+WP_DRAWING_NS = "http://schemas.openxmlformats.org/drawingml/2006/wordprocessingDrawing"
+
+BLIP_TAG = f"{{{DRAWINGML_NS}}}blip"
+VML_IMAGEDATA_TAG = f"{{{VML_NS}}}imagedata"
+REL_EMBED_ATTR = f"{{{OFFICE_RELS_NS}}}embed"
+REL_LINK_ATTR = f"{{{OFFICE_RELS_NS}}}link"
+REL_ID_ATTR = f"{{{OFFICE_RELS_NS}}}id"
+BODY_TAG = f"{{{WORDML_NS}}}body"
+PARAGRAPH_TAG = f"{{{WORDML_NS}}}p"
+INLINE_TAG = f"{{{WP_DRAWING_NS}}}inline"
+ANCHOR_TAG = f"{{{WP_DRAWING_NS}}}anchor"
+DOC_PR_TAG = f"{{{WP_DRAWING_NS}}}docPr"
+TEXT_TAG = f"{{{WORDML_NS}}}t"
+PARAGRAPH_STYLE_TAG = f"{{{WORDML_NS}}}pStyle"
+OUTLINE_LEVEL_TAG = f"{{{WORDML_NS}}}outlineLvl"
+WORDML_VAL_ATTR = f"{{{WORDML_NS}}}val"
+
+# Media parts are copied in chunks of this size so memory use stays flat
+COPY_CHUNK_SIZE = 1024 * 1024
+
+# Fixed-size part of a ZIP local file header: signature, then the name and
+# extra field lengths at offsets 26 and 28
+LOCAL_HEADER = struct.Struct('<4s22xHH')
+LOCAL_HEADER_SIGNATURE = b'PK\x03\x04'
+
+# copy_file_range/sendfile failures that just mean "not supported here"
+KERNEL_COPY_UNSUPPORTED = (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP,
+                           errno.ENOTSUP, errno.EBADF)
+
+# Written next to extraction_report.txt to make re-runs incremental
+MANIFEST_FILE = "extraction_manifest.json"
+MANIFEST_VERSION = 4
+
+# Document position and text context of each image, reused by later mapping runs
+IMAGE_INDEX_FILE = "image_index.json"
+
+# Placeholder locations per markdown file, keyed by size and mtime
+PLACEHOLDER_CACHE_FILE = "placeholder_cache.json"
+
+# Content-hash cache of the optional web optimization stage
+OPTIMIZATION_CACHE_FILE = "optimization_cache.json"
+OPTIMIZABLE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.bmp', '.tiff', '.tif')
+WEBP_SOURCE_FORMATS = ("PNG", "JPEG", "BMP", "TIFF", "GIF")
+LOSSY_EXTENSIONS = ('.jpg', '.jpeg')
+
+# Downscaled copies used inline by --responsive, cached by content hash
+THUMBNAIL_DIR = "thumbs"
+RESPONSIVE_CACHE_FILE = "responsive_cache.json"
+DEFAULT_THUMBNAIL_WIDTHS = (480, 960)
+
+# Clusters of visually identical images found by --near-duplicates
+NEAR_DUPLICATES_FILE = "near_duplicates.json"
+
+# Background writes: threads, and bytes or jobs queued before producers block
+WRITER_THREADS = 4
+WRITER_MAX_PENDING_BYTES = 64 * 1024 * 1024
+WRITER_MAX_PENDING_JOBS = 256
+
+# Images up to this size are buffered in memory while they are hashed
+SPOOL_MAX_SIZE = 8 * 1024 * 1024
+
+# Machine-readable counters of a run, written as <command>_metrics.json
+METRICS_FILE_TEMPLATE = "{command}_metrics.json"
+PROFILE_FILE = "profile.pstats"
+
+# Mapping files with these suffixes are SQLite mapping stores instead of JSON
+MAPPING_STORE_SUFFIXES = ('.db', '.sqlite', '.sqlite3')
+MAPPING_STORE_VERSION = 1
+
+# Machine-wide image cache shared by every guide (see SharedImageCache)
+SHARED_CACHE_ENV = "EXTRACT_IMAGES_CACHE"
+DEFAULT_SHARED_CACHE_BYTES = 2 * 1024 * 1024 * 1024
+
+# ioctl request that clones the extents of one file into another (Linux FICLONE)
+FICLONE = 0x40049409
+
+# Seconds between two polls of the watched files in watch mode
+DEFAULT_POLL_INTERVAL = 0.25
+
+# Package parts searched for base64 data URIs (VML shapes, legacy drawings)
+XML_PART_EXTENSIONS = ('.xml', '.vml')
+
+# Parts smaller than this are not real images
+MIN_IMAGE_SIZE = 100
+
+# Text context recorded for each drawing and used when matching placeholders
+IMAGE_CONTEXT_FIELDS = ("name", "descr", "heading", "caption", "before", "text", "after")
+
+# placeholder_pattern groups apply_mappings rewrites: markdown alt text,
+# [IMAGE:name] and <!-- IMAGE: name -->
+REPLACEABLE_PLACEHOLDER_GROUPS = (1, 4, 5)
+
+IMAGE_EXTENSIONS = [
+    '.png', '.jpg', '.jpeg', '.gif', '.bmp',
+    '.tiff', '.tif', '.wmf', '.emf', '.svg',
+    '.ico', '.webp', '.jfif', '.pjpeg', '.pjp'
+]
+
+
+def detect_image_extension(file_path: str, header: bytes) -> str:
+    """Use the part extension, falling back to the first bytes of the file."""
+    ext = os.path.splitext(file_path)[1].lower()
+    if ext and ext != '.bin':
+        return ext
+
+    if header[:4] == b'\x89PNG':
+        return '.png'
+    elif header[:2] == b'\xff\xd8':
+        return '.jpg'
+    elif header[:4] == b'GIF8':
+        return '.gif'
+    elif header[:2] == b'BM':
+        return '.bmp'
+    return '.bin'  # Unknown binary
+
+
+def stored_member_offset(mapped: mmap.mmap, info: ZipInfo) -> int:
+    """Return where the data of an uncompressed member starts in the mapped package."""
+    signature, name_length, extra_length = LOCAL_HEADER.unpack_from(mapped, info.header_offset)
+    if signature != LOCAL_HEADER_SIGNATURE:
+        raise BadZipFile(f"Bad local file header for {info.filename}")
+    offset = info.header_offset + LOCAL_HEADER.size + name_length + extra_length
+    if offset + info.file_size > len(mapped):
+        raise BadZipFile(f"Truncated member {info.filename}")
+    return offset
+
+
+def copy_file_region(source_fd: int, target_fd: int, offset: int, size: int, mapped: mmap.mmap):
+    """
+    Append ``size`` bytes at ``offset`` of ``source_fd`` to ``target_fd``.
+
+    The copy is done in the kernel with ``copy_file_range`` (or ``sendfile``
+    on Linux) when available; otherwise, or if the file systems refuse it,
+    the rest is written from slices of ``mapped``, the mapping of
+    ``source_fd``, without intermediate ``bytes`` copies.
+    """
+    position, end = offset, offset + size
+    try:
+        while position < end:
+            if hasattr(os, 'copy_file_range'):
+                copied = os.copy_file_range(source_fd, target_fd, end - position, position)
+            elif sys.platform.startswith('linux'):
+                copied = os.sendfile(target_fd, source_fd, position, end - position)
+            else:
+                break
+            if not copied:
+                break
+            position += copied
+    except OSError as e:
+        if e.errno not in KERNEL_COPY_UNSUPPORTED:
+            raise
+
+    with memoryview(mapped) as view:
+        while position < end:
+            chunk = view[position:min(end, position + COPY_CHUNK_SIZE)]
+            position += os.write(target_fd, chunk)
+            chunk.release()
+
+
+def reflink_file(source: Path, target: Path) -> bool:
+    """
+    Create ``target`` sharing the extents of ``source`` (Btrfs, XFS, ...).
+
+    Returns False when the platform or file system cannot clone; ``target``
+    may then exist empty and should be overwritten.
+    """
+    try:
+        import fcntl
+    except ImportError:
+        return False
+    with open(source, 'rb') as src, open(target, 'wb') as dst:
+        try:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        except OSError:
+            return False
+    return True
+
+
+def default_shared_cache_dir() -> Path:
+    """``$EXTRACT_IMAGES_CACHE``, else ``extract_images`` in ``$XDG_CACHE_HOME`` or ``~/.cache``."""
+    configured = os.environ.get(SHARED_CACHE_ENV)
+    if configured:
+        return Path(configured)
+    return Path(os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache") / "extract_images"
+
+
+class SharedImageCache:
+    """
+    Content-addressed image cache shared by the extractions of every guide
+    on the machine.
+
+    Each object is stored once as ``objects/<2 hex>/<sha256>`` under
+    ``root``. Content that is already cached is materialized into an output
+    directory as a hardlink, a reflink where the file system supports it,
+    or a copy, instead of being written again; newly written images enter
+    the cache the same way. Objects are added with no-clobber links, so
+    when concurrent runs (batch workers, parallel CI jobs) store the same
+    content the first object wins and the others link their output to it.
+
+    The last use of an object is the mtime of an empty marker under
+    ``used/``, not of the object itself, whose hardlinked outputs would
+    change with it. ``evict`` deletes the least recently used objects
+    until the cache fits in ``max_bytes``; objects still linked from an
+    output (link count above one) free no space and are neither counted
+    nor evicted. Outputs may be hardlinks to cache objects, so images must
+    be replaced, never edited in place (as the writer and optimizer
+    already do).
+    """
+
+    def __init__(self, root: Optional[str] = None, max_bytes: int = DEFAULT_SHARED_CACHE_BYTES):
+        self.root = Path(root) if root else default_shared_cache_dir()
+        self.objects_dir = self.root / "objects"
+        self.used_dir = self.root / "used"
+        self.max_bytes = max_bytes
+
+    def object_path(self, digest: str) -> Path:
+        return self.objects_dir / digest[:2] / digest
+
+    def used_path(self, digest: str) -> Path:
+        return self.used_dir / digest[:2] / digest
+
+    def materialize(self, digest: str, target: Path) -> Optional[str]:
+        """
+        Place the cached content with ``digest`` at ``target``.
+
+        Returns how ("hardlink", "reflink" or "copy"), or None on a miss.
+        """
+        source = self.object_path(digest)
+        if not source.exists():
+            return None
+        method = self._place(source, target)
+        if method:
+            self._touch(digest)
+        return method
+
+    def store(self, digest: str, path: Path) -> Optional[str]:
+        """
+        Add the finished image at ``path``; returns how, or None if it was
+        cached already. In that case ``path`` is re-linked to the cached
+        object, which a concurrent run may have stored in the meantime.
+        """
+        target = self.object_path(digest)
+        if not target.exists():
+            target.parent.mkdir(parents=True, exist_ok=True)
+            method = self._place(path, target, replace=False)
+            if method:
+                self._touch(digest)
+                return method
+        with contextlib.suppress(OSError):
+            if not os.path.samefile(target, path):
+                self._place(target, path)
+        self._touch(digest)
+        return None
+
+    def evict(self) -> Tuple[int, int]:
+        """Delete least recently used objects beyond ``max_bytes``; returns their count and size."""
+        entries = []
+        if self.objects_dir.is_dir():
+            for bucket in os.scandir(self.objects_dir):
+                if not bucket.is_dir():
+                    continue
+                for entry in os.scandir(bucket.path):
+                    if entry.name.startswith('.'):
+                        continue
+                    stat = entry.stat()
+                    if stat.st_nlink > 1:
+                        continue  # Still linked from an output; deleting it frees nothing
+                    try:
+                        used = self.used_path(entry.name).stat().st_mtime_ns
+                    except OSError:
+                        used = stat.st_mtime_ns
+                    entries.append((used, stat.st_size, entry.name))
+
+        total = sum(size for _, size, _ in entries)
+        evicted = evicted_bytes = 0
+        for _, size, digest in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            for path in (self.object_path(digest), self.used_path(digest)):
+                with contextlib.suppress(FileNotFoundError):  # Evicted by a concurrent run
+                    os.unlink(path)
+            total -= size
+            evicted += 1
+            evicted_bytes += size
+        return evicted, evicted_bytes
+
+    @staticmethod
+    def _place(source: Path, target: Path, replace: bool = True) -> Optional[str]:
+        """
+        Put ``source``'s content at ``target`` through a temporary file.
+        Without ``replace`` an existing ``target`` is kept and None returned.
+        """
+        temp = target.with_name(f".tmp_{os.getpid()}_{threading.get_ident()}_{target.name}")
+        try:
+            try:
+                os.link(source, temp)
+                method = "hardlink"
+            except OSError:
+                # Another file system, or links unsupported
+                if reflink_file(source, temp):
+                    method = "reflink"
+                else:
+                    shutil.copyfile(source, temp)
+                    method = "copy"
+            if replace:
+                os.replace(temp, target)
+                return method
+            try:
+                os.link(temp, target)
+            except FileExistsError:
+                return None
+            except OSError:
+                # No hardlinks on this file system; a concurrent copy may be replaced
+                os.replace(temp, target)
+            return method
+        except OSError:
+            return None
+        finally:
+            with contextlib.suppress(OSError):
+                os.unlink(temp)
+
+    def _touch(self, digest: str):
+        """Record a use of the object in its marker, leaving the object's mtime alone."""
+        marker = self.used_path(digest)
+        with contextlib.suppress(OSError):
+            marker.parent.mkdir(parents=True, exist_ok=True)
+            with open(marker, 'a'):
+                pass
+            os.utime(marker)
+
+
+def load_image_index(output_dir: str) -> Dict[str, Dict]:
+    """Load the document-position index written by a previous extraction."""
+    index_file = Path(output_dir) / IMAGE_INDEX_FILE
+    if not index_file.exists():
+        return {}
+    with open(index_file, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+class RunMetrics:
+    """
+    In-memory instrumentation of one run: wall time per phase, named
+    counters (bytes read and written, images found, deduplicated and
+    skipped, ...) and errors grouped by exception type.
+
+    Per-image messages go through ``log`` and are only printed with
+    ``verbose``, so large documents do not pay for terminal output.
+    """
+
+    # Error messages kept verbatim; the rest are only counted
+    max_error_samples = 20
+
+    def __init__(self, verbose: bool = False):
+        self.verbose = verbose
+        self.phases = {}
+        self.counters = {}
+        self.errors = {}
+        self.error_samples = []
+        self.skipped = []
+        self.error_collectors = []
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        """Add the wall time of the enclosed block to phase ``name``."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - started
+
+    def count(self, name: str, amount: int = 1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def error(self, where: str, error: Exception):
+        """Count an error by type and report it."""
+        error_type = type(error).__name__
+        self.errors[error_type] = self.errors.get(error_type, 0) + 1
+        if len(self.error_samples) < self.max_error_samples:
+            self.error_samples.append({"where": where, "type": error_type, "message": str(error)})
+        message = f"  {where}: {error_type}: {error}"
+        for collected in self.error_collectors:
+            collected.append(message)
+        print(message)
+
+    @contextlib.contextmanager
+    def collect_errors(self):
+        """Yield a list that receives every error reported in the block, uncapped."""
+        collected = []
+        self.error_collectors.append(collected)
+        try:
+            yield collected
+        finally:
+            self.error_collectors.remove(collected)
+
+    def skip(self, part: str, reason: str):
+        """Record a candidate part that did not produce an image."""
+        self.count(f"skipped_{reason}")
+        self.skipped.append({"part": part, "reason": reason})
+
+    def log(self, message: str):
+        if self.verbose:
+            print(message)
+
+    def to_dict(self) -> Dict:
+        return {
+            "phases": {name: round(seconds, 6) for name, seconds in self.phases.items()},
+            "counters": dict(sorted(self.counters.items())),
+            "errors": self.errors,
+            "error_samples": self.error_samples,
+            "skipped": self.skipped,
+        }
+
+    def write(self, path: Path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+
+class AtomicFileWriter:
+    """
+    Write files on a small thread pool behind a bounded queue, committing
+    them atomically.
+
+    ``submit`` returns as soon as the job is queued, so the caller's CPU
+    work (decompression, hashing, regex rewriting) overlaps with disk I/O;
+    it blocks while more than ``max_pending_bytes`` or ``max_pending_jobs``
+    are in flight. Each job creates and writes a temporary file next to its
+    target on a worker thread, so queued jobs hold no file descriptor.
+    ``commit`` waits for the
+    queue to drain, fsyncs all temporary files in one batch, renames them
+    into place and fsyncs each directory once, so after a crash every file
+    has either its old or its new content, never a partial one.
+    """
+
+    def __init__(self, workers: int = WRITER_THREADS,
+                 max_pending_bytes: int = WRITER_MAX_PENDING_BYTES,
+                 max_pending_jobs: int = WRITER_MAX_PENDING_JOBS, fsync: bool = True):
+        self.max_pending_bytes = max_pending_bytes
+        self.max_pending_jobs = max_pending_jobs
+        self.fsync = fsync
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='writer')
+        self.condition = threading.Condition()
+        self.pending_bytes = 0
+        self.pending_jobs = 0
+        self.jobs = []  # (target, future resolving to the temp path)
+        # mkstemp creates 0600 files; new files get the usual umask-based mode
+        umask = os.umask(0)
+        os.umask(umask)
+        self.file_mode = 0o666 & ~umask
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if exc_type is not None:
+                self.abort()
+                return
+            failures = self.commit()
+            if failures:
+                target, error = failures[0]
+                raise OSError(f"Could not write {target} ({len(failures)} failed writes)") from error
+        finally:
+            self.executor.shutdown()
+
+    def submit(self, target: Path, size: int, produce: Callable, mode: str = 'wb',
+               encoding: Optional[str] = None):
+        """Queue ``produce(f)``, which writes the content of ``target`` to the open file ``f``."""
+        target = Path(target)
+        with self.condition:
+            while self.pending_jobs >= self.max_pending_jobs or (
+                    self.pending_bytes and self.pending_bytes + size > self.max_pending_bytes):
+                self.condition.wait()
+            self.pending_bytes += size
+            self.pending_jobs += 1
+
+        future = self.executor.submit(self._write, target, size, produce, mode, encoding)
+        self.jobs.append((target, future))
+
+    def write_bytes(self, target: Path, data: bytes):
+        self.submit(target, len(data), lambda f: f.write(data))
+
+    def write_text(self, target: Path, text: str, encoding: str = 'utf-8'):
+        self.submit(target, len(text), lambda f: f.write(text), mode='w', encoding=encoding)
+
+    def commit(self) -> List[Tuple[Path, Exception]]:
+        """
+        Wait for every queued write and move the results into place.
+
+        Returns the targets whose write failed, with the error; those keep
+        their previous content.
+        """
+        jobs, self.jobs = self.jobs, []
+        failures = []
+        written = []
+        for target, future in jobs:
+            error = future.exception()
+            if error is None:
+                written.append((target, future.result()))
+            else:
+                failures.append((target, error))
+
+        if self.fsync:
+            for future in [self.executor.submit(self._fsync_path, temp_path)
+                           for _, temp_path in written]:
+                future.result()
+
+        for target, temp_path in written:
+            os.replace(temp_path, target)
+
+        if self.fsync:
+            for directory in {target.parent for target, _ in written}:
+                self._fsync_directory(directory)
+        return failures
+
+    def abort(self):
+        """Discard every queued write."""
+        jobs, self.jobs = self.jobs, []
+        for _, future in jobs:
+            if future.exception() is None:
+                self._remove(future.result())
+
+    def _write(self, target: Path, size: int, produce: Callable, mode: str,
+               encoding: Optional[str]) -> str:
+        """Write one job to a new temporary file next to ``target``; returns its path."""
+        temp_path = None
+        try:
+            fd, temp_path = tempfile.mkstemp(prefix='.tmp_', dir=target.parent)
+            with open(fd, mode, encoding=encoding) as f:
+                produce(f)
+            if target.exists():
+                shutil.copymode(target, temp_path)
+            else:
+                os.chmod(temp_path, self.file_mode)
+            return temp_path
+        except BaseException:
+            if temp_path is not None:
+                self._remove(temp_path)
+            raise
+        finally:
+            with self.condition:
+                self.pending_bytes -= size
+                self.pending_jobs -= 1
+                self.condition.notify_all()
+
+    @staticmethod
+    def _fsync_path(path: str):
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    @staticmethod
+    def _fsync_directory(directory: Path):
+        try:
+            fd = os.open(directory, os.O_RDONLY)
+        except OSError:
+            return  # directories cannot be opened on Windows
+        try:
+            os.fsync(fd)
+        except OSError:
+            pass  # not supported by every file system
+        finally:
+            os.close(fd)
+
+    @staticmethod
+    def _remove(path: str):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+class ContentAddressedImageStore:
+    """
+    Store each unique image exactly once, named after its SHA-256 digest.
+
+    Duplicate detection is a dictionary lookup on the full digest; the
+    filename uses a digest prefix that is lengthened if two different
+    images would ever share it. With a ``SharedImageCache``, new content
+    found in the cache is materialized from it instead of written, and
+    written images are added to it on ``commit``.
+
+    Names record the digest of the image as extracted: ``extract
+    --optimize`` recompresses PNGs in place, after which an ``img_<sha256>``
+    name no longer matches the file's content (the optimization cache maps
+    both digests).
+    """
+
+    def __init__(self, output_dir: Path, prefix_length: int = 16,
+                 writer: Optional[AtomicFileWriter] = None,
+                 cache: Optional[SharedImageCache] = None):
+        self.output_dir = Path(output_dir)
+        self.prefix_length = prefix_length
+        self.writer = writer or AtomicFileWriter()
+        self.cache = cache
+        self.by_digest = {}  # full digest -> image name
+        self.by_name = {}    # image name -> full digest
+        self.queued = []     # names written since the last commit
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.cache_counts = {}
+
+    def __contains__(self, digest: str) -> bool:
+        return digest in self.by_digest
+
+    def __len__(self) -> int:
+        return len(self.by_digest)
+
+    def add(self, data: bytes, source_name: str = '') -> Tuple[Optional[str], bool]:
+        """Store image bytes held in memory; see ``add_stream``."""
+        return self.add_stream(BytesIO(data), source_name)
+
+    def add_stream(self, stream: BinaryIO, source_name: str = '',
+                   min_size: int = 0) -> Tuple[Optional[str], bool]:
+        """
+        Store an image from ``stream`` unless identical content is already present.
+
+        The data is read in ``COPY_CHUNK_SIZE`` chunks and hashed into a
+        spooled buffer (held in memory up to ``SPOOL_MAX_SIZE``, on disk
+        beyond), so memory use does not depend on the image size. New
+        images are handed to the writer; call ``commit`` before reading
+        them. The type is sniffed from the first chunk when ``source_name``
+        has no usable extension.
+
+        Returns the image name (None if the data is not a recognisable image
+        or smaller than ``min_size``) and whether it is newly written.
+        """
+        header = stream.read(COPY_CHUNK_SIZE)
+        ext = detect_image_extension(source_name, header)
+        if ext == '.bin':
+            return None, False
+
+        hasher = hashlib.sha256()
+        size = 0
+        spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE, dir=self.output_dir)
+        try:
+            chunk = header
+            while chunk:
+                hasher.update(chunk)
+                spool.write(chunk)
+                size += len(chunk)
+                chunk = stream.read(COPY_CHUNK_SIZE)
+        except BaseException:
+            spool.close()
+            raise
+
+        digest = hasher.hexdigest()
+        self.bytes_read += size
+        if size < min_size or digest in self.by_digest:
+            spool.close()
+            return (None if size < min_size else self.by_digest[digest]), False
+        image_name = self._materialize(digest, ext)
+        if image_name:
+            spool.close()
+            return image_name, True
+
+        def produce(f):
+            with spool:
+                spool.seek(0)
+                shutil.copyfileobj(spool, f, COPY_CHUNK_SIZE)
+
+        return self._queue(digest, ext, size, produce), True
+
+    def add_mapped(self, mapped: mmap.mmap, source_fd: int, offset: int, size: int,
+                   source_name: str = '', expected_crc: Optional[int] = None,
+                   min_size: int = 0) -> Tuple[Optional[str], bool]:
+        """
+        Store an image lying uncompressed at ``offset`` of a memory-mapped file.
+
+        The data is hashed (and checked against ``expected_crc``) straight
+        from the mapping, duplicates are recognised without writing
+        anything, and new images are copied file-to-file by
+        ``copy_file_region`` on the writer, so the bytes never pass through
+        Python objects. ``mapped`` and ``source_fd`` must stay open until
+        ``commit``. Returns the same as ``add_stream``.
+        """
+        ext = detect_image_extension(source_name, mapped[offset:offset + 16])
+        if ext == '.bin' or size < min_size:
+            return None, False
+
+        with memoryview(mapped) as view, view[offset:offset + size] as data:
+            if expected_crc is not None and zlib.crc32(data) != expected_crc:
+                raise BadZipFile(f"Bad CRC-32 for {source_name}")
+            digest = hashlib.sha256(data).hexdigest()
+        self.bytes_read += size
+        if digest in self.by_digest:
+            return self.by_digest[digest], False
+        image_name = self._materialize(digest, ext)
+        if image_name:
+            return image_name, True
+
+        def produce(f):
+            copy_file_region(source_fd, f.fileno(), offset, size, mapped)
+
+        return self._queue(digest, ext, size, produce), True
+
+    def commit(self) -> List[Tuple[str, Exception]]:
+        """
+        Wait for the queued image writes and move them into place.
+
+        Images whose write failed are forgotten and returned with the error.
+        """
+        failed = []
+        for target, error in self.writer.commit():
+            self.by_name.pop(target.name, None)
+            self.by_digest = {d: name for d, name in self.by_digest.items() if name != target.name}
+            failed.append((target.name, error))
+
+        queued, self.queued = self.queued, []
+        if self.cache is not None and (queued or self.cache_counts.get("hits")):
+            for image_name in queued:
+                if image_name not in self.by_name:
+                    continue  # Write failed
+                if self.cache.store(self.by_name[image_name], self.path_of(image_name)):
+                    self._count_cache("stored")
+            evicted, evicted_bytes = self.cache.evict()
+            self._count_cache("evicted", evicted)
+            self._count_cache("bytes_evicted", evicted_bytes)
+        return failed
+
+    def _queue(self, digest: str, ext: str, size: int, produce: Callable) -> str:
+        image_name = self._name_for(digest, ext)
+        self._index(digest, image_name)
+        self.writer.submit(self.output_dir / image_name, size, produce)
+        self.queued.append(image_name)
+        self.bytes_written += size
+        return image_name
+
+    def _materialize(self, digest: str, ext: str) -> Optional[str]:
+        """Take new content from the shared cache; None if it is not cached."""
+        if self.cache is None:
+            return None
+        image_name = self._name_for(digest, ext)
+        method = self.cache.materialize(digest, self.path_of(image_name))
+        if method is None:
+            return None
+        self._index(digest, image_name)
+        self._count_cache("hits")
+        self._count_cache(method)
+        return image_name
+
+    def _count_cache(self, name: str, amount: int = 1):
+        self.cache_counts[name] = self.cache_counts.get(name, 0) + amount
+
+    def register(self, image_name: str, digest: str):
+        """Index an image that is already present in the output directory."""
+        self._index(digest, image_name)
+
+    def alias(self, digest: str, image_name: str):
+        """Resolve future content with ``digest`` to an existing image."""
+        self.by_digest[digest] = image_name
+
+    def digest_of(self, image_name: str) -> str:
+        return self.by_name[image_name]
+
+    def path_of(self, image_name: str) -> Path:
+        return self.output_dir / image_name
+
+    def _name_for(self, digest: str, ext: str) -> str:
+        length = self.prefix_length
+        image_name = f"img_{digest[:length]}{ext}"
+        while image_name in self.by_name and self.by_name[image_name] != digest:
+            length += 4
+            image_name = f"img_{digest[:length]}{ext}"
+        return image_name
+
+    def _index(self, digest: str, image_name: str):
+        self.by_digest[digest] = image_name
+        self.by_name[image_name] = digest
+
+
+class DocumentXmlScanner:
+    """
+    Stream a WordprocessingML part and report its picture references.
+
+    The part is parsed with ``iterparse`` and every top-level body element is
+    cleared once it has been processed, so memory use stays constant however
+    long the document is. Each reference records the relationship id, whether
+    the drawing is inline, anchored or VML, its position (reference and
+    paragraph ordinal), the ``wp:docPr`` name/description and its text
+    context: the nearest heading above it, the text of its own paragraph,
+    the nearest non-empty paragraphs before and after it, and a caption when
+    the following paragraph uses a caption style.
+    """
+
+    heading_style = re.compile(r'^(heading|title)', re.IGNORECASE)
+    caption_style = re.compile(r'caption', re.IGNORECASE)
+
+    # Context text is truncated to keep the persisted index small
+    max_context_chars = 200
+
+    def __init__(self, part_name: str):
+        self.part_name = part_name
+        self.paragraph_count = 0
+        self.drawing_count = 0
+
+    def scan(self, stream: BinaryIO):
+        """Yield ``(rId, drawing)`` pairs in document order."""
+        depth = 0
+        body = None
+        body_depth = 0
+        containers = []  # enclosing wp:inline / wp:anchor elements
+        paragraphs = []  # open (possibly nested) paragraphs
+        doc_pr = {}
+        heading = ""
+        previous_text = ""
+        awaiting_next = []  # drawings still missing the following paragraph
+
+        for event, element in iterparse_module().iterparse(stream, events=("start", "end")):
+            tag = element.tag
+            if event == "start":
+                depth += 1
+                if depth == 1 or tag == BODY_TAG:
+                    # Blocks sit in w:body, or directly in the root of headers, footers and notes
+                    body, body_depth = element, depth
+                elif tag == PARAGRAPH_TAG:
+                    self.paragraph_count += 1
+                    paragraphs.append({"ordinal": self.paragraph_count, "style": "",
+                                       "text": [], "drawings": []})
+                elif tag == PARAGRAPH_STYLE_TAG and paragraphs:
+                    paragraphs[-1]["style"] = element.get(WORDML_VAL_ATTR, "")
+                elif tag == OUTLINE_LEVEL_TAG and paragraphs:
+                    paragraphs[-1]["style"] = paragraphs[-1]["style"] or "Heading"
+                elif tag == INLINE_TAG or tag == ANCHOR_TAG:
+                    containers.append("inline" if tag == INLINE_TAG else "anchor")
+                    doc_pr = {}
+                elif tag == DOC_PR_TAG:
+                    doc_pr = {"name": element.get("name", ""), "descr": element.get("descr", "")}
+                elif tag == BLIP_TAG or tag == VML_IMAGEDATA_TAG:
+                    if tag == BLIP_TAG:
+                        rId = element.get(REL_EMBED_ATTR) or element.get(REL_LINK_ATTR)
+                        drawing = self._drawing(containers[-1] if containers else "picture", doc_pr)
+                    else:
+                        rId = element.get(REL_ID_ATTR)
+                        drawing = self._drawing("vml", {"name": element.get("title", ""), "descr": ""})
+                    if not rId:
+                        continue
+                    drawing["heading"] = heading
+                    drawing["before"] = previous_text
+                    if paragraphs:
+                        paragraphs[-1]["drawings"].append((rId, drawing))
+                    else:
+                        awaiting_next.append((rId, drawing))
+                continue
+
+            depth -= 1
+            if tag == TEXT_TAG and paragraphs and element.text:
+                paragraphs[-1]["text"].append(element.text)
+            elif tag == PARAGRAPH_TAG and paragraphs:
+                paragraph = paragraphs.pop()
+                text = self._clip("".join(paragraph["text"]))
+                if paragraphs:
+                    # Text of nested paragraphs (text boxes) also belongs to the outer one
+                    paragraphs[-1]["text"].append(" " + text)
+
+                if text:
+                    is_caption = bool(self.caption_style.search(paragraph["style"]))
+                    for rId, drawing in awaiting_next:
+                        drawing["after"] = text
+                        drawing["caption"] = text if is_caption else ""
+                        yield rId, drawing
+                    awaiting_next = []
+                    if self.heading_style.match(paragraph["style"]):
+                        heading = text
+                    previous_text = text
+
+                for rId, drawing in paragraph["drawings"]:
+                    drawing["text"] = text
+                    awaiting_next.append((rId, drawing))
+            elif tag == INLINE_TAG or tag == ANCHOR_TAG:
+                containers.pop()
+                doc_pr = {}
+            if depth == body_depth and body is not None:
+                # Drop finished top-level paragraphs and tables
+                body.clear()
+
+        for rId, drawing in awaiting_next:
+            drawing.setdefault("after", "")
+            drawing.setdefault("caption", "")
+            yield rId, drawing
+
+    def _drawing(self, kind: str, doc_pr: Dict[str, str]) -> Dict:
+        self.drawing_count += 1
+        return {
+            "kind": kind,
+            "index": self.drawing_count,
+            "paragraph": self.paragraph_count,
+            "text": "",
+            **doc_pr,
+        }
+
+    def _clip(self, text: str) -> str:
+        text = " ".join(text.split())
+        return text[:self.max_context_chars]
+
+
+class DataUriScanner:
+    """
+    Find ``data:image/...;base64,`` URIs in a byte stream read in chunks.
+
+    Iterating yields a ``DataUriPayload`` per URI, a file-like object that
+    decodes the payload incrementally as it is read, so neither the part
+    nor an embedded image is ever held in memory as a whole. The last
+    ``overlap`` bytes of each chunk are kept so markers and payloads
+    straddling a chunk boundary are still found. Unread payloads are
+    skipped when iteration continues.
+    """
+
+    marker = re.compile(rb'data:image/([A-Za-z0-9.+-]{1,40});base64,')
+    payload_chars = re.compile(rb'[A-Za-z0-9+/=\s]*')
+
+    # Longer than any marker the pattern can match
+    overlap = 64
+
+    def __init__(self, stream: BinaryIO, chunk_size: int = COPY_CHUNK_SIZE):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.buffer = b''
+        self.position = 0  # next unexamined byte of buffer
+        self.offset = 0    # stream offset of buffer[0]
+
+    def __iter__(self):
+        while True:
+            match = self.marker.search(self.buffer, self.position)
+            if match is None:
+                self.position = max(self.position, len(self.buffer) - self.overlap)
+                if not self.fill():
+                    return
+                continue
+            payload = DataUriPayload(self, match.group(1).decode('ascii'),
+                                     self.offset + match.start())
+            self.position = match.end()
+            yield payload
+            payload.drain()
+
+    def fill(self) -> bool:
+        """Drop the examined part of the buffer and append the next chunk."""
+        chunk = self.stream.read(self.chunk_size)
+        if not chunk:
+            return False
+        self.offset += self.position
+        self.buffer = self.buffer[self.position:] + chunk
+        self.position = 0
+        return True
+
+
+class DataUriPayload:
+    """The base64 payload of one data URI found by ``DataUriScanner``."""
+
+    def __init__(self, scanner: DataUriScanner, subtype: str, start: int):
+        self.scanner = scanner
+        self.subtype = subtype
+        self.start = start  # stream offsets of the whole URI
+        self.end = None
+        self.pending = b''  # base64 characters not yet decoded
+        self.done = False
+
+    def read(self, size: int = -1) -> bytes:
+        """Decode and return at least ``size`` bytes (all if negative), or b'' at the end."""
+        decoded = []
+        decoded_size = 0
+        while not self.done and (size < 0 or decoded_size < size):
+            data = self.pending + self._take()
+            if self.done:
+                data += b'=' * (-len(data) % 4)
+                usable = len(data)
+            else:
+                usable = len(data) - len(data) % 4
+            self.pending = data[usable:]
+            chunk = base64.b64decode(data[:usable], validate=True)
+            decoded.append(chunk)
+            decoded_size += len(chunk)
+        return b''.join(decoded)
+
+    def drain(self):
+        """Skip whatever is left of the payload."""
+        while not self.done:
+            self._take()
+
+    def _take(self) -> bytes:
+        """Consume the next run of payload characters, without whitespace."""
+        scanner = self.scanner
+        match = scanner.payload_chars.match(scanner.buffer, scanner.position)
+        scanner.position = match.end()
+        run = match.group().translate(None, b' \t\r\n\f\v')
+        # A run reaching the end of the buffer may continue in the next chunk
+        if scanner.position < len(scanner.buffer) or not scanner.fill():
+            self.done = True
+            self.end = scanner.offset + scanner.position
+        return run
 
 
 class EnhancedWordImageExtractor:
-    """Extract ALL images from Word documents using multiple methods."""
-    
-    def __init__(self, word_file_path: str, output_dir: str = "extracted_images"):
+    """Extract ALL images from Word documents in a single pass over the package."""
+
+    def __init__(self, word_file_path: str, output_dir: str = "extracted_images",
+                 force: bool = False, metrics: Optional[RunMetrics] = None,
+                 previous_manifest: Optional[Dict] = None,
+                 shared_cache: Optional[SharedImageCache] = None):
         self.word_file_path = Path(word_file_path)
         self.output_dir = Path(output_dir)
-        self.output_dir.mkdir(exist_ok=True)
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.metrics = metrics or RunMetrics()
+        self.store = ContentAddressedImageStore(self.output_dir, cache=shared_cache)
         self.image_mapping = {}
-        self.image_count = 0
-        
+        self.image_sources = {}
+        self.manifest_file = self.output_dir / MANIFEST_FILE
+        # Under force the previous manifest is still read, to remove its stale images
+        self.force = force
+        if previous_manifest is not None:
+            # Handed over by a long-running caller (watch mode) instead of re-read
+            self.previous_manifest = previous_manifest
+        else:
+            self.previous_manifest = self._load_manifest()
+        self.member_manifest = {}
+        self.reused_members = 0
+        self.image_index = {}
+        self.source = {}
+
     def extract_all_images(self) -> Dict[str, str]:
         """
-        Extract all images using multiple methods to ensure we get everything.
+        Extract all images in one pass: the package is opened once, relationships
+        and drawings are resolved first, then each media part is written exactly
+        once with its provenance attached (see ``self.image_sources``).
+
+        Runs are incremental: members whose CRC and size match the manifest of
+        the previous run keep their stored image and are not decompressed, and
+        an unchanged document is not opened at all.
         """
+        metrics = self.metrics
         print(f"Extracting images from: {self.word_file_path}")
         print("=" * 60)
-        
-        # Method 1: Extract using docx2txt (most comprehensive)
-        print("\n[Method 1] Using docx2txt extraction...")
-        self._extract_with_docx2txt()
-        
-        # Method 2: Extract from zip structure (gets embedded images)
-        print("\n[Method 2] Extracting from document ZIP structure...")
-        self._extract_from_zip()
-        
-        # Method 3: Extract inline shapes and pictures
-        print("\n[Method 3] Extracting inline shapes and drawings...")
-        self._extract_inline_shapes()
-        
-        # Method 4: Extract from document relationships
-        print("\n[Method 4] Checking document relationships...")
-        self._extract_from_relationships()
-        
+
+        with metrics.phase("fingerprint"):
+            source = self.source = self._fingerprint_source()
+            reused = self._reuse_previous_run(source)
+        if reused:
+            print(f"Document unchanged since last run; reusing {len(self.image_mapping)} images")
+            metrics.count("images_unique", len(self.image_mapping))
+            metrics.count("document_unchanged")
+            self.image_index = load_image_index(self.output_dir) or self._build_image_index()
+            return self.image_mapping
+
+        try:
+            with open(self.word_file_path, 'rb') as package, ZipFile(package) as zip_file, \
+                    self._map_package(package) as mapped:
+                print("\n[Step 1] Resolving document relationships...")
+                with metrics.phase("relationships"):
+                    relationships = self._load_relationships(zip_file)
+
+                print("\n[Step 2] Locating inline shapes and drawings...")
+                with metrics.phase("drawings"):
+                    drawings = self._find_drawings(zip_file, relationships)
+
+                print("\n[Step 3] Extracting media parts...")
+                with metrics.phase("media"):
+                    try:
+                        self._extract_media_parts(zip_file, relationships, drawings,
+                                                  package, mapped)
+                    finally:
+                        # Queued copies read from the mapping, so finish them before it closes
+                        self._commit_images()
+        except (BadZipFile, OSError) as e:
+            metrics.error(f"Could not read {self.word_file_path.name}", e)
+            # Leave the previous images and manifest alone; the next good run updates them
+            self._keep_previous_images()
+            print(f"\nKept {len(self.image_mapping)} images from the previous run")
+            return self.image_mapping
+
+        metrics.count("images_unique", len(self.image_mapping))
+        metrics.count("bytes_read", self.store.bytes_read)
+        metrics.count("bytes_written", self.store.bytes_written)
+        for name, amount in self.store.cache_counts.items():
+            metrics.count(f"shared_cache_{name}", amount)
+
         print("\n" + "=" * 60)
         print(f"Total unique images extracted: {len(self.image_mapping)}")
-        
-        # Generate a summary report
-        self._generate_extraction_report()
-        
+        if self.reused_members:
+            print(f"Reused {self.reused_members} unchanged parts from the previous run")
+        cache_counts = self.store.cache_counts
+        if cache_counts.get("hits"):
+            methods = ", ".join(f"{cache_counts[m]} {m}" for m in ("hardlink", "reflink", "copy")
+                                if cache_counts.get(m))
+            print(f"Materialized {cache_counts['hits']} images from the shared cache ({methods})")
+
+        with metrics.phase("finalize"):
+            self._remove_stale_images()
+            self._carry_derivatives()
+            self._save_manifest(source)
+            self.image_index = self._build_image_index()
+            self._save_image_index()
+
+            # Generate a summary report
+            self._generate_extraction_report()
+
         return self.image_mapping
-    
-    def _extract_with_docx2txt(self):
-        """Use docx2txt which is very good at extracting all images."""
-        if not HAS_DOCX2TXT:
-            print("  Skipping docx2txt method (package not installed)")
-            return
-            
-        try:
-            # Create a temporary directory for docx2txt
-            temp_dir = self.output_dir / "docx2txt_images"
-            temp_dir.mkdir(exist_ok=True)
-            
-            # Extract text and images
-            text = docx2txt.process(str(self.word_file_path), str(temp_dir))
-            
-            # Move and rename extracted images
-            for img_file in temp_dir.iterdir():
-                if img_file.is_file() and img_file.suffix.lower() in ['.png', '.jpg', '.jpeg', '.gif', '.bmp', '.tiff', '.wmf', '.emf']:
-                    self.image_count += 1
-                    new_name = f"img_{self.image_count:04d}{img_file.suffix}"
-                    new_path = self.output_dir / new_name
-                    shutil.move(str(img_file), str(new_path))
-                    self.image_mapping[new_name] = str(new_path)
-                    print(f"  Extracted: {new_name}")
-            
-            # Clean up temp directory
-            if temp_dir.exists():
-                shutil.rmtree(temp_dir)
-                
-        except Exception as e:
-            print(f"  Note: docx2txt extraction had issues: {e}")
-    
-    def _extract_from_zip(self):
-        """Extract images from the document's ZIP structure - enhanced version."""
+
+    @staticmethod
+    def _map_package(package: BinaryIO):
+        """Memory-map the package for the zero-copy path, if the platform allows it."""
         try:
-            with ZipFile(self.word_file_path, 'r') as zip_file:
-                # Get all files in the zip
-                all_files = zip_file.namelist()
-                
-                # Look for images in multiple locations - EXPANDED LIST
-                image_locations = [
-                    'word/media/', 
-                    'media/', 
-                    'word/embeddings/', 
-                    'embeddings/',
-                    'word/charts/',
-                    'word/drawings/',
-                    'ppt/media/',  # Sometimes PowerPoint content is embedded
-                    'xl/media/',   # Sometimes Excel content is embedded
-                ]
-                
-                # Expanded list of image extensions
-                image_extensions = [
-                    '.png', '.jpg', '.jpeg', '.gif', '.bmp', 
-                    '.tiff', '.tif', '.wmf', '.emf', '.svg',
-                    '.ico', '.webp', '.jfif', '.pjpeg', '.pjp'
-                ]
-                
-                # First, find ALL potential image files
-                print(f"  Searching {len(all_files)} files in document...")
-                image_count_before = len(self.image_mapping)
-                
-                for file_path in all_files:
-                    # Check if this is an image file by extension
-                    is_image = any(file_path.lower().endswith(ext) for ext in image_extensions)
-                    
-                    # Also check if 'image' is in the content type path
-                    has_image_in_path = 'image' in file_path.lower() or 'media' in file_path.lower()
-                    
-                    # Check for base64 encoded images in XML files
-                    is_xml_with_image = file_path.endswith('.xml') and 'media' in file_path.lower()
-                    
-                    if not (is_image or has_image_in_path or is_xml_with_image):
-                        continue
-                    
-                    try:
-                        # Extract the file
-                        file_data = zip_file.read(file_path)
-                        
-                        # Skip if too small to be a real image (< 100 bytes)
-                        if len(file_data) < 100:
-                            continue
-                        
-                        # For XML files, try to extract base64 images
-                        if is_xml_with_image:
-                            # Look for base64 encoded images in XML
-                            base64_pattern = r'<v:imagedata[^>]*src="data:image/[^;]+;base64,([^"]+)"'
-                            matches = re.findall(base64_pattern, file_data.decode('utf-8', errors='ignore'))
-                            for match in matches:
-                                try:
-                                    image_data = base64.b64decode(match)
-                                    self.image_count += 1
-                                    image_name = f"img_{self.image_count:04d}_xmldata.png"
-                                    output_path = self.output_dir / image_name
-                                    with open(output_path, 'wb') as f:
-                                        f.write(image_data)
-                                    self.image_mapping[image_name] = str(output_path)
-                                    print(f"  Extracted base64 image: {image_name}")
-                                except:
-                                    pass
-                            continue
-                        
-                        # Create a hash to check for duplicates
-                        img_hash = hashlib.md5(file_data).hexdigest()[:8]
-                        
-                        # Check if we already have this exact image
-                        already_exists = any(img_hash in existing for existing in self.image_mapping.keys())
-                        if already_exists:
-                            continue
-                        
-                        # Determine file extension
-                        ext = os.path.splitext(file_path)[1].lower()
-                        if not ext or ext == '.bin':
-                            # Try to detect type from file header
-                            if file_data[:4] == b'\x89PNG':
-                                ext = '.png'
-                            elif file_data[:2] == b'\xff\xd8':
-                                ext = '.jpg'
-                            elif file_data[:4] == b'GIF8':
-                                ext = '.gif'
-                            elif file_data[:2] == b'BM':
-                                ext = '.bmp'
-                            else:
-                                ext = '.bin'  # Unknown binary
-                        
-                        # Skip if still unknown
-                        if ext == '.bin':
-                            continue
-                        
-                        # Generate name with source path hint
-                        path_hint = file_path.split('/')[-2] if '/' in file_path else 'root'
-                        self.image_count += 1
-                        image_name = f"img_{self.image_count:04d}_{path_hint}_{img_hash}{ext}"
-                        
-                        # Save the image
-                        output_path = self.output_dir / image_name
-                        with open(output_path, 'wb') as f:
-                            f.write(file_data)
-                        self.image_mapping[image_name] = str(output_path)
-                        print(f"  Extracted: {image_name} (from {file_path})")
-                            
-                    except Exception as e:
-                        print(f"  Could not extract {file_path}: {e}")
-                
-                images_found = len(self.image_mapping) - image_count_before
-                print(f"  Found {images_found} new images in ZIP structure")
-                        
-        except Exception as e:
-            print(f"  Note: ZIP extraction had issues: {e}")
-    
-    def _extract_inline_shapes(self):
-        """Extract inline shapes and pictures using python-docx."""
+            return mmap.mmap(package.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return contextlib.nullcontext()
+
+    def _load_manifest(self) -> Dict:
+        """Load the manifest of the previous run, if it is usable."""
+        if not self.manifest_file.exists():
+            return {}
         try:
-            doc = Document(self.word_file_path)
-            
-            # Extract from inline shapes
-            for shape in doc.inline_shapes:
-                try:
-                    # Get the image data
-                    if hasattr(shape, '_inline') and hasattr(shape._inline, 'graphic'):
-                        # Try to get the image rId
-                        rId = shape._inline.graphic.graphicData.pic.blipFill.blip.embed
-                        
-                        # Get the image part
-                        image_part = doc.part.related_parts[rId]
-                        
-                        # Get image bytes
-                        image_bytes = image_part.blob
-                        
-                        # Determine extension from content type
-                        content_type = image_part.content_type
-                        ext_map = {
-                            'image/png': '.png',
-                            'image/jpeg': '.jpg',
-                            'image/gif': '.gif',
-                            'image/bmp': '.bmp',
-                            'image/tiff': '.tiff'
+            with open(self.manifest_file, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError) as e:
+            self.metrics.error(f"Ignoring unreadable manifest {self.manifest_file}", e)
+            return {}
+        if manifest.get("version") != MANIFEST_VERSION:
+            return {}
+        return manifest
+
+    def _fingerprint_source(self) -> Dict:
+        """Describe the .docx by size and mtime, hashing it only if those changed."""
+        stat = self.word_file_path.stat()
+        source = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": None}
+
+        previous = self.previous_manifest.get("source", {})
+        if not self.force and previous.get("size") == source["size"] \
+                and previous.get("mtime_ns") == source["mtime_ns"]:
+            source["sha256"] = previous.get("sha256")
+            return source
+
+        hasher = hashlib.sha256()
+        with open(self.word_file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(COPY_CHUNK_SIZE), b''):
+                hasher.update(chunk)
+        source["sha256"] = hasher.hexdigest()
+        return source
+
+    def _reuse_previous_run(self, source: Dict) -> bool:
+        """Adopt the previous results wholesale when the document did not change."""
+        previous = self.previous_manifest
+        if self.force or not previous or previous.get("source", {}).get("sha256") != source["sha256"]:
+            return False
+
+        images = previous.get("images", {})
+        if not all(self.store.path_of(name).exists() for name in images):
+            return False
+
+        for image_name, provenance in images.items():
+            self.store.register(image_name, provenance["sha256"])
+            self.image_mapping[image_name] = str(self.store.path_of(image_name))
+            self.image_sources[image_name] = provenance
+        self.member_manifest = previous.get("members", {})
+
+        # Keep the fast size/mtime check working after a touch or re-download
+        if previous["source"].get("mtime_ns") != source["mtime_ns"]:
+            self._save_manifest(source)
+        return True
+
+    def _keep_previous_images(self):
+        """Fall back to the images of the previous run that are still on disk."""
+        self.image_mapping.clear()
+        self.image_sources.clear()
+        for image_name, provenance in self.previous_manifest.get("images", {}).items():
+            path = self.store.path_of(image_name)
+            if path.exists():
+                self.image_mapping[image_name] = str(path)
+                self.image_sources[image_name] = provenance
+        self.image_index = load_image_index(self.output_dir)
+
+    def _reuse_member(self, file_path: str, info) -> Optional[List[str]]:
+        """
+        Return the images a member produced last run if its CRC and size are
+        unchanged and those images still exist, None otherwise.
+        """
+        if self.force:
+            return None
+        previous = self.previous_manifest.get("members", {}).get(file_path)
+        if not previous or previous["crc"] != info.CRC or previous["size"] != info.file_size:
+            return None
+
+        previous_images = self.previous_manifest.get("images", {})
+        for image_name in previous["images"]:
+            if image_name not in previous_images or not self.store.path_of(image_name).exists():
+                return None
+        for image_name in previous["images"]:
+            self.store.register(image_name, previous_images[image_name]["sha256"])
+        return previous["images"]
+
+    def _remove_stale_images(self):
+        """Delete images written by the previous run that no part produces any more."""
+        for image_name, provenance in self.previous_manifest.get("images", {}).items():
+            if image_name in self.image_mapping:
+                continue
+            self._remove_derivatives(provenance)
+            stale_path = self.store.path_of(image_name)
+            if stale_path.exists():
+                stale_path.unlink()
+                self.metrics.count("images_removed_stale")
+                self.metrics.log(f"  Removed stale image: {image_name}")
+
+    def record_derivatives(self, derivatives: Dict[str, List[str]]):
+        """
+        Record the files generated from each image (WebP variants, PNG
+        conversions) in the manifest, so they are removed along with it.
+        """
+        for image_name, paths in derivatives.items():
+            provenance = self.image_sources.get(image_name)
+            if provenance is None:
+                continue
+            names = sorted({Path(path).name for path in paths})
+            if names:
+                provenance["derivatives"] = names
+            else:
+                provenance.pop("derivatives", None)
+        self._save_manifest(self.source)
+
+    def _carry_derivatives(self):
+        """Keep the derivatives the previous run recorded for images it still produces."""
+        previous_images = self.previous_manifest.get("images", {})
+        for image_name, provenance in self.image_sources.items():
+            previous = previous_images.get(image_name, {}).get("derivatives")
+            if previous and "derivatives" not in provenance:
+                kept = [name for name in previous if (self.output_dir / name).exists()]
+                if kept:
+                    provenance["derivatives"] = kept
+
+    def _remove_derivatives(self, provenance: Dict):
+        for name in provenance.get("derivatives", []):
+            path = self.output_dir / name
+            if name not in self.image_mapping and path.exists():
+                path.unlink()
+                self.metrics.count("derivatives_removed")
+
+    def collapse_images(self, aliases: Dict[str, str]):
+        """
+        Fold each near-duplicate image into its canonical image.
+
+        The duplicate file is deleted, its provenance is merged into the
+        canonical image, and the manifest records the canonical image for
+        the duplicate's parts so later runs do not extract it again.
+        """
+        for duplicate, canonical in aliases.items():
+            if duplicate not in self.image_sources or canonical not in self.image_sources:
+                continue
+            source = self.image_sources.pop(duplicate)
+            self.image_mapping.pop(duplicate)
+            for key in ("media_paths", "relationships", "drawings"):
+                self.image_sources[canonical].setdefault(key, []).extend(source.get(key, []))
+            self.image_sources[canonical].setdefault("aliases", []).append(source["sha256"])
+            self.store.alias(source["sha256"], canonical)
+
+            self._remove_derivatives(source)
+            duplicate_path = self.store.path_of(duplicate)
+            if duplicate_path.exists():
+                duplicate_path.unlink()
+
+        for member in self.member_manifest.values():
+            member["images"] = list(dict.fromkeys(aliases.get(name, name) for name in member["images"]))
+
+        self._save_manifest(self.source)
+        self.image_index = self._build_image_index()
+        self._save_image_index()
+        print(f"Collapsed {len(aliases)} near-duplicate images")
+
+    def _build_image_index(self) -> Dict[str, Dict]:
+        """
+        Place each image at its first drawing in document order (the main
+        document before headers, footers and notes) with that drawing's
+        heading and surrounding text.
+        """
+        first_drawings = {}
+        for image_name, source in self.image_sources.items():
+            drawings = source.get("drawings", [])
+            if drawings:
+                first_drawings[image_name] = min(drawings, key=self._document_position)
+
+        index = {}
+        ranked = sorted(first_drawings.items(), key=lambda item: self._document_position(item[1]))
+        for order, (image_name, drawing) in enumerate(ranked, start=1):
+            index[image_name] = {
+                "order": order,
+                "part": drawing["part"],
+                "paragraph": drawing.get("paragraph", 0),
+                **{key: drawing.get(key, "") for key in IMAGE_CONTEXT_FIELDS},
+            }
+        return index
+
+    @staticmethod
+    def _document_position(drawing: Dict) -> Tuple[bool, str, int]:
+        return (drawing["part"] != "word/document.xml", drawing["part"], drawing["index"])
+
+    def _save_image_index(self):
+        with open(self.output_dir / IMAGE_INDEX_FILE, 'w', encoding='utf-8') as f:
+            json.dump(self.image_index, f, indent=2)
+
+    def manifest(self) -> Dict:
+        """What each member produced, as saved for the next run."""
+        return {
+            "version": MANIFEST_VERSION,
+            "source": {"path": str(self.word_file_path), **self.source},
+            "members": self.member_manifest,
+            "images": self.image_sources,
+        }
+
+    def _save_manifest(self, source: Dict):
+        """Persist what each member produced so the next run can skip it."""
+        self.source = source
+        with open(self.manifest_file, 'w', encoding='utf-8') as f:
+            json.dump(self.manifest(), f, indent=2)
+
+    def _load_relationships(self, zip_file: ZipFile) -> Dict[str, List[Dict[str, str]]]:
+        """
+        Parse every ``*/_rels/*.rels`` part and index internal targets.
+
+        Returns a dictionary mapping the resolved target part name (e.g.
+        ``word/media/image1.png``) to the relationships pointing at it.
+        """
+        relationships = {}
+
+        for rels_file in zip_file.namelist():
+            if not rels_file.endswith('.rels'):
+                continue
+
+            # word/_rels/document.xml.rels describes word/document.xml
+            rels_dir, rels_name = posixpath.split(rels_file)
+            base_dir = posixpath.dirname(rels_dir)
+            source_part = posixpath.join(base_dir, rels_name[:-len('.rels')]) or '/'
+
+            data = zip_file.read(rels_file)
+            self.metrics.count("bytes_read", len(data))
+            self.metrics.count("xml_parts_parsed")
+            try:
+                root = ElementTree.fromstring(data)
+            except ElementTree.ParseError as e:
+                self.metrics.error(f"Could not parse {rels_file}", e)
+                continue
+
+            for rel in root.iter(f"{{{PACKAGE_RELS_NS}}}Relationship"):
+                if rel.get('TargetMode') == 'External':
+                    continue
+                target = rel.get('Target', '')
+                if target.startswith('/'):
+                    target_part = target.lstrip('/')
+                else:
+                    target_part = posixpath.normpath(posixpath.join(base_dir, target))
+
+                relationships.setdefault(target_part, []).append({
+                    "source": source_part,
+                    "rId": rel.get('Id', ''),
+                    "type": rel.get('Type', '').rsplit('/', 1)[-1],
+                })
+
+        rel_count = sum(len(rels) for rels in relationships.values())
+        print(f"  Resolved {rel_count} internal relationships to {len(relationships)} parts")
+        return relationships
+
+    def _find_drawings(self, zip_file: ZipFile,
+                       relationships: Dict[str, List[Dict[str, str]]]) -> Dict[Tuple[str, str], List[Dict]]:
+        """
+        Find picture references (``a:blip`` and VML ``v:imagedata``) in every
+        part that owns relationships, streaming each part through
+        ``DocumentXmlScanner``.
+
+        Returns a dictionary mapping ``(source part, rId)`` to the drawings
+        that reference it, in document order.
+        """
+        drawings = {}
+        source_parts = {rel["source"] for rels in relationships.values() for rel in rels}
+
+        for part_name in sorted(source_parts):
+            if not part_name.endswith('.xml') or part_name not in zip_file.NameToInfo:
+                continue
+            scanner = DocumentXmlScanner(part_name)
+            self.metrics.count("bytes_read", zip_file.NameToInfo[part_name].file_size)
+            self.metrics.count("xml_parts_parsed")
+            try:
+                with zip_file.open(part_name) as part:
+                    for rId, drawing in scanner.scan(part):
+                        drawings.setdefault((part_name, rId), []).append(drawing)
+            except (ElementTree.ParseError, SyntaxError) as e:
+                # lxml's XMLSyntaxError derives from SyntaxError
+                self.metrics.error(f"Could not parse {part_name}", e)
+
+        reference_count = sum(len(d) for d in drawings.values())
+        self.metrics.count("picture_references", reference_count)
+        print(f"  Found {reference_count} picture references")
+        return drawings
+
+    def _extract_media_parts(self, zip_file: ZipFile,
+                             relationships: Dict[str, List[Dict[str, str]]],
+                             drawings: Dict[Tuple[str, str], List[Dict]],
+                             package: Optional[BinaryIO] = None,
+                             mapped: Optional[mmap.mmap] = None):
+        """
+        Write each image part of the package exactly once.
+
+        Members stored without compression (Word's default for PNG and JPEG)
+        are hashed and copied straight from ``mapped``, the memory-mapped
+        ``package``; deflated members are streamed through ``zipfile``.
+        """
+        metrics = self.metrics
+        all_files = zip_file.namelist()
+        metrics.count("package_members", len(all_files))
+        print(f"  Searching {len(all_files)} files in document...")
+        image_count_before = len(self.image_mapping)
+
+        for file_path in all_files:
+            # Check if this is an image file by extension
+            is_image = any(file_path.lower().endswith(ext) for ext in IMAGE_EXTENSIONS)
+
+            # Also check if 'image' is in the content type path
+            has_image_in_path = 'image' in file_path.lower() or 'media' in file_path.lower()
+
+            # Every XML part may hold base64 encoded images
+            is_xml_part = file_path.lower().endswith(XML_PART_EXTENSIONS)
+
+            if not (is_image or has_image_in_path or is_xml_part):
+                continue
+            metrics.count("xml_parts_scanned" if is_xml_part else "parts_candidate")
+
+            try:
+                info = zip_file.getinfo(file_path)
+
+                # Skip if too small to be a real image
+                if info.file_size < MIN_IMAGE_SIZE:
+                    if not is_xml_part:
+                        metrics.skip(file_path, "too_small")
+                    continue
+
+                reused = self._reuse_member(file_path, info)
+                if reused is not None:
+                    self.reused_members += 1
+                    metrics.count("parts_reused")
+                    image_names = reused
+                elif is_xml_part:
+                    with zip_file.open(file_path) as part:
+                        image_names = self._extract_base64_images(file_path, part)
+                    metrics.count("bytes_read", info.file_size)
+                else:
+                    if mapped is not None and info.compress_type == ZIP_STORED \
+                            and not info.flag_bits & 0x1:
+                        image_name, is_new = self.store.add_mapped(
+                            mapped, package.fileno(), stored_member_offset(mapped, info),
+                            info.file_size, file_path, expected_crc=info.CRC)
+                        metrics.count("parts_zero_copy")
+                    else:
+                        with zip_file.open(file_path) as member:
+                            image_name, is_new = self.store.add_stream(member, file_path)
+                    image_names = [image_name] if image_name else []
+                    if is_new:
+                        metrics.count("images_written")
+                        metrics.log(f"  Extracted: {image_name} (from {file_path})")
+                    elif image_name:
+                        metrics.count("images_deduplicated")
+                        metrics.log(f"  Duplicate of {image_name}: {file_path}")
+                    else:
+                        metrics.skip(file_path, "unknown_type")
+                metrics.count("images_found", len(image_names))
+
+                self.member_manifest[file_path] = {
+                    "crc": info.CRC, "size": info.file_size, "images": image_names
+                }
+                for image_name in image_names:
+                    if is_xml_part:
+                        provenance = {
+                            "media_paths": [file_path], "relationships": [], "drawings": [],
+                            "encoding": "base64",
                         }
-                        ext = ext_map.get(content_type, '.png')
-                        
-                        # Save the image
-                        self.image_count += 1
-                        img_hash = hashlib.md5(image_bytes).hexdigest()[:8]
-                        image_name = f"img_{self.image_count:04d}_shape_{img_hash}{ext}"
-                        output_path = self.output_dir / image_name
-                        
-                        if not output_path.exists():
-                            with open(output_path, 'wb') as f:
-                                f.write(image_bytes)
-                            self.image_mapping[image_name] = str(output_path)
-                            print(f"  Extracted inline shape: {image_name}")
-                            
-                except Exception as e:
-                    pass  # Silent fail for individual shapes
-                    
-            # Also check paragraphs for embedded images
-            for paragraph in doc.paragraphs:
-                for run in paragraph.runs:
-                    if 'graphicData' in run._element.xml:
-                        print(f"  Found embedded graphic in paragraph")
-                        
-        except Exception as e:
-            print(f"  Note: Inline shape extraction had issues: {e}")
-    
-    def _extract_from_relationships(self):
-        """Extract images from document relationships."""
-        try:
-            with ZipFile(self.word_file_path, 'r') as zip_file:
-                # Check for relationship files
-                rels_files = [f for f in zip_file.namelist() if f.endswith('.rels')]
-                
-                for rels_file in rels_files:
-                    rels_content = zip_file.read(rels_file).decode('utf-8', errors='ignore')
-                    
-                    # Find image relationships
-                    image_patterns = [
-                        r'Target="([^"]*\.(png|jpg|jpeg|gif|bmp|tiff|wmf|emf))"',
-                        r'Target="media/([^"]*)"'
-                    ]
-                    
-                    for pattern in image_patterns:
-                        matches = re.findall(pattern, rels_content, re.IGNORECASE)
-                        for match in matches:
-                            if isinstance(match, tuple):
-                                image_path = match[0]
-                            else:
-                                image_path = match
-                            
-                            # Try to extract this image
-                            full_path = f"word/{image_path}" if not image_path.startswith('word/') else image_path
-                            
-                            try:
-                                if full_path in zip_file.namelist():
-                                    image_data = zip_file.read(full_path)
-                                    
-                                    # Save if not duplicate
-                                    img_hash = hashlib.md5(image_data).hexdigest()[:8]
-                                    ext = os.path.splitext(image_path)[1] or '.png'
-                                    
-                                    self.image_count += 1
-                                    image_name = f"img_{self.image_count:04d}_rel_{img_hash}{ext}"
-                                    output_path = self.output_dir / image_name
-                                    
-                                    if not output_path.exists():
-                                        with open(output_path, 'wb') as f:
-                                            f.write(image_data)
-                                        self.image_mapping[image_name] = str(output_path)
-                                        print(f"  Extracted from relationship: {image_name}")
-                                        
-                            except:
-                                pass
-                                
-        except Exception as e:
-            print(f"  Note: Relationship extraction had issues: {e}")
-    
+                    else:
+                        provenance = self._describe_provenance(file_path, relationships, drawings)
+                    self._record_image(image_name, provenance)
+
+            except Exception as e:
+                # One unreadable part must not abort the rest of the document
+                metrics.error(f"Could not extract {file_path}", e)
+
+        images_found = len(self.image_mapping) - image_count_before
+        print(f"  Found {images_found} new images in ZIP structure")
+
+    def _extract_base64_images(self, file_path: str, stream: BinaryIO) -> List[str]:
+        """
+        Extract the base64 ``data:image`` URIs of an XML part (VML shapes in
+        the document, headers, footers, notes or media parts), decoding them
+        straight into the image store.
+        """
+        image_names = []
+        for payload in DataUriScanner(stream):
+            try:
+                image_name, is_new = self.store.add_stream(
+                    payload, f"xmldata.{payload.subtype.split('+')[0]}", min_size=MIN_IMAGE_SIZE)
+            except ValueError as e:
+                # binascii.Error (invalid base64) is a ValueError
+                self.metrics.error(f"Could not decode base64 image in {file_path}", e)
+                continue
+            if image_name is None:
+                self.metrics.skip(f"{file_path}@{payload.start}", "unknown_type")
+                continue
+            image_names.append(image_name)
+            self.metrics.count("base64_images")
+            if is_new:
+                self.metrics.count("images_written")
+                self.metrics.log(f"  Extracted base64 image: {image_name}")
+            else:
+                self.metrics.count("images_deduplicated")
+        return image_names
+
+    @staticmethod
+    def _describe_provenance(file_path: str,
+                             relationships: Dict[str, List[Dict[str, str]]],
+                             drawings: Dict[Tuple[str, str], List[Dict]]) -> Dict:
+        """Collect everything known about where a media part is used."""
+        rels = relationships.get(file_path, [])
+        shapes = []
+        for rel in rels:
+            for drawing in drawings.get((rel["source"], rel["rId"]), []):
+                shapes.append({"part": rel["source"], "rId": rel["rId"], **drawing})
+
+        return {
+            "media_paths": [file_path],
+            "relationships": rels,
+            "drawings": shapes,
+        }
+
+    def _commit_images(self):
+        """Wait for this run's image writes; forget the images whose write failed."""
+        for image_name, error in self.store.commit():
+            self.metrics.error(f"Could not write {image_name}", error)
+            self.image_mapping.pop(image_name, None)
+            self.image_sources.pop(image_name, None)
+            # Forget the parts that produced it so the next run retries them
+            self.member_manifest = {part: member for part, member in self.member_manifest.items()
+                                    if image_name not in member["images"]}
+
+    def _record_image(self, image_name: str, provenance: Dict):
+        """Register an image, merging provenance when the content was seen before."""
+        existing = self.image_sources.get(image_name)
+        if existing is None:
+            self.image_mapping[image_name] = str(self.store.path_of(image_name))
+            self.image_sources[image_name] = {
+                "sha256": self.store.digest_of(image_name), **provenance
+            }
+            return
+
+        for key in ("media_paths", "relationships", "drawings"):
+            existing.setdefault(key, []).extend(provenance.get(key, []))
+
     def _generate_extraction_report(self):
         """Generate a detailed report of the extraction."""
         report_file = self.output_dir / "extraction_report.txt"
@@ -346,49 +1638,580 @@ class EnhancedWordImageExtractor:
             f.write("-" * 50 + "\n")
             for img_name in sorted(self.image_mapping.keys()):
                 f.write(f"  {img_name}\n")
-                
-            # Check for potential issues
+                source = self.image_sources.get(img_name, {})
+                if source.get("sha256"):
+                    f.write(f"      sha256: {source['sha256']}\n")
+                for media_path in source.get("media_paths", []):
+                    f.write(f"      media: {media_path}\n")
+                for rel in source.get("relationships", []):
+                    f.write(f"      relationship: {rel['source']}#{rel['rId']}\n")
+                for drawing in source.get("drawings", []):
+                    f.write(f"      drawing: {drawing['kind']} #{drawing['index']} in {drawing['part']}, "
+                            f"paragraph {drawing['paragraph']}\n")
+
+            # Diagnostics come from the counters of this run; the package
+            # is not reopened
+            metrics = self.metrics
+            counters = metrics.counters
             f.write(f"\n\nDiagnostics:\n")
             f.write("-" * 50 + "\n")
-            
-            # Check document structure
-            try:
-                with ZipFile(self.word_file_path, 'r') as zip_file:
-                    all_files = zip_file.namelist()
-                    media_files = [f for f in all_files if 'media' in f.lower()]
-                    f.write(f"Files with 'media' in path: {len(media_files)}\n")
-                    
-                    # List all potential image files
-                    img_extensions = ['.png', '.jpg', '.jpeg', '.gif', '.bmp', '.tiff', '.wmf', '.emf']
-                    potential_images = [f for f in all_files if any(f.lower().endswith(ext) for ext in img_extensions)]
-                    f.write(f"Potential image files in document: {len(potential_images)}\n")
-                    
-                    if len(potential_images) > len(self.image_mapping):
-                        f.write(f"\nWARNING: Found {len(potential_images)} potential images but only extracted {len(self.image_mapping)}\n")
-                        f.write("Some images might be duplicates or failed to extract.\n")
-                        f.write("\nAll potential image paths in document:\n")
-                        for img_path in potential_images:
-                            f.write(f"  - {img_path}\n")
-                            
-            except Exception as e:
-                f.write(f"Could not analyze document structure: {e}\n")
-                
+            f.write(f"Package members: {counters.get('package_members', 0)}\n")
+            f.write(f"Candidate image parts: {counters.get('parts_candidate', 0)}\n")
+            f.write(f"Parts reused from previous run: {counters.get('parts_reused', 0)}\n")
+            f.write(f"Picture references: {counters.get('picture_references', 0)}\n")
+            f.write(f"Images found: {counters.get('images_found', 0)} "
+                    f"({counters.get('images_deduplicated', 0)} duplicates)\n")
+            f.write(f"Bytes read: {counters.get('bytes_read', 0)}, "
+                    f"written: {counters.get('bytes_written', 0)}\n")
+
+            if metrics.skipped:
+                f.write(f"\nSkipped parts ({len(metrics.skipped)}):\n")
+                for skipped in metrics.skipped:
+                    f.write(f"  - {skipped['part']} ({skipped['reason']})\n")
+
+            if metrics.errors:
+                f.write(f"\nWARNING: {sum(metrics.errors.values())} errors: "
+                        + ", ".join(f"{name} x{n}" for name, n in metrics.errors.items()) + "\n")
+                for sample in metrics.error_samples:
+                    f.write(f"  - {sample['where']}: {sample['type']}: {sample['message']}\n")
+
         print(f"\nExtraction report saved to: {report_file}")
         print("Check this report for diagnostic information about missing images.")
 
 
+def file_sha256(path: Path) -> str:
+    """Hash a file in ``COPY_CHUNK_SIZE`` chunks."""
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(COPY_CHUNK_SIZE), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def _map_images(func: Callable[[Dict], Dict], jobs: List[Dict], workers: Optional[int],
+                chunksize: int = 1) -> List[Dict]:
+    """Run ``func`` over ``jobs`` in order, across a process pool unless one worker suffices."""
+    if workers == 1 or len(jobs) < 2:
+        return [func(job) for job in jobs]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(func, jobs, chunksize=chunksize))
+
+
+def _load_json_cache(path: Path) -> Dict[str, Dict]:
+    """A per-image results cache; missing or unreadable caches start empty."""
+    if not path.exists():
+        return {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_json_cache(path: Path, cache: Dict[str, Dict]):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(cache, f, indent=2)
+
+
+def _optimize_image(task: Dict) -> Dict:
+    """
+    Optimize one image; executed in a worker process.
+
+    PNGs are recompressed losslessly and replaced only if smaller, BMP/TIFF
+    are converted to PNG, and a WebP variant is written next to the image
+    (lossless for screenshots, quality 85 for JPEG photos).
+    """
+    Image = require_pillow()
+    path = Path(task["path"])
+    result = {
+        "name": task["name"],
+        "source_digest": task["digest"],
+        "web_path": str(path),
+        "webp": None,
+        "bytes_before": path.stat().st_size,
+        "error": None,
+    }
+
+    try:
+        with Image.open(path) as img:
+            img.load()
+            image_format = img.format
+            save_args = {key: img.info[key] for key in ("icc_profile", "dpi") if key in img.info}
+            animated = getattr(img, "is_animated", False)
+
+            if image_format == "PNG":
+                candidate = path.with_name(f".opt_{path.name}")
+                img.save(candidate, "PNG", optimize=True, **save_args)
+                if candidate.stat().st_size < result["bytes_before"]:
+                    os.replace(candidate, path)
+                else:
+                    candidate.unlink()
+            elif image_format in ("BMP", "TIFF"):
+                web_path = path.with_suffix(".png")
+                img.save(web_path, "PNG", optimize=True, **save_args)
+                result["web_path"] = str(web_path)
+
+            if task["webp"] and not animated and image_format in WEBP_SOURCE_FORMATS:
+                webp_path = path.with_suffix(".webp")
+                if image_format == "JPEG":
+                    img.save(webp_path, "WEBP", quality=85, method=4)
+                else:
+                    img.save(webp_path, "WEBP", lossless=True, method=4)
+                result["webp"] = str(webp_path)
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+
+    result["bytes_after"] = Path(result["web_path"]).stat().st_size
+    result["digest"] = file_sha256(Path(result["web_path"]))
+    return result
+
+
+class ImageOptimizer:
+    """
+    Optimize extracted images for the web across a process pool.
+
+    Results are cached by content hash in ``optimization_cache.json``: both
+    the digest of the image as extracted and the digest of the optimized
+    file point at the result, so an image is never optimized twice.
+    """
+
+    def __init__(self, output_dir: str, workers: Optional[int] = None, webp: bool = True):
+        self.output_dir = Path(output_dir)
+        self.workers = workers
+        self.webp = webp
+        self.cache_file = self.output_dir / OPTIMIZATION_CACHE_FILE
+
+    def optimize(self, image_mapping: Dict[str, str]) -> Dict[str, Dict]:
+        """
+        Optimize every image in ``image_mapping`` that is not already optimized.
+
+        Returns the optimization result per image name; ``web_path`` is the
+        file pages should reference (a PNG for converted BMP/TIFF images).
+        """
+        print("\nOptimizing images...")
+        cache = _load_json_cache(self.cache_file)
+        results = {}
+        tasks = []
+
+        for img_name, img_path in image_mapping.items():
+            if Path(img_path).suffix.lower() not in OPTIMIZABLE_EXTENSIONS:
+                continue
+            digest = file_sha256(Path(img_path))
+            cached = cache.get(digest)
+            if cached and self._outputs_exist(cached) and (cached["webp"] or not self.webp) \
+                    and self._web_digest(cached, img_path, digest) == cached["digest"]:
+                results[img_name] = cached
+                continue
+            tasks.append({"name": img_name, "path": img_path, "digest": digest, "webp": self.webp})
+
+        completed = _map_images(_optimize_image, tasks, self.workers)
+
+        saved = 0
+        for result in completed:
+            results[result["name"]] = result
+            if result["error"]:
+                print(f"  Could not optimize {result['name']}: {result['error']}")
+                continue
+            cache[result["source_digest"]] = result
+            cache[result["digest"]] = result
+            saved += result["bytes_before"] - result["bytes_after"]
+
+        print(f"  Optimized {len(tasks)} images ({len(results) - len(tasks)} already optimized), "
+              f"saved {saved / 1024:.1f} KB")
+        _save_json_cache(self.cache_file, cache)
+        return results
+
+    @staticmethod
+    def _outputs_exist(result: Dict) -> bool:
+        paths = [result["web_path"]] + ([result["webp"]] if result["webp"] else [])
+        return all(Path(p).exists() for p in paths)
+
+    @staticmethod
+    def _web_digest(result: Dict, img_path: str, digest: str) -> str:
+        """
+        Digest of the file pages reference; a re-extraction may have put the
+        unoptimized image back in place of an optimized PNG.
+        """
+        if os.path.abspath(result["web_path"]) == os.path.abspath(img_path):
+            return digest
+        return file_sha256(Path(result["web_path"]))
+
+
+def _build_derivatives(task: Dict) -> Dict:
+    """Write the downscaled thumbnails of one image; executed in a worker process."""
+    Image = require_pillow()
+    path = Path(task["path"])
+    thumbs_dir = path.parent / THUMBNAIL_DIR
+    thumbs_dir.mkdir(exist_ok=True)
+    result = {"name": task["name"], "digest": task["digest"], "thumbnails": [], "error": None}
+
+    try:
+        with Image.open(path) as img:
+            result["width"], result["height"] = img.size
+            ext = path.suffix.lower() if img.format in ("PNG", "JPEG", "WEBP") else ".png"
+            for width in sorted(task["widths"]):
+                if width >= img.width:
+                    continue
+                height = max(1, round(img.height * width / img.width))
+                thumb_path = thumbs_dir / f"{task['digest'][:16]}_w{width}{ext}"
+                thumb = img.resize((width, height), Image.LANCZOS)
+                if ext in ('.jpg', '.jpeg') and thumb.mode not in ("RGB", "L"):
+                    thumb = thumb.convert("RGB")
+                thumb.save(thumb_path, optimize=True)
+                result["thumbnails"].append({"width": width, "height": height, "path": str(thumb_path)})
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    return result
+
+
+class ResponsiveImageBuilder:
+    """
+    Generate downscaled thumbnails of mapped images for lazy-loaded pages.
+
+    Thumbnails are named after the image's content digest and cached in
+    ``responsive_cache.json``, so rebuilds only process new or changed images.
+    """
+
+    def __init__(self, output_dir: str, widths: Tuple[int, ...] = DEFAULT_THUMBNAIL_WIDTHS,
+                 workers: Optional[int] = None):
+        self.output_dir = Path(output_dir)
+        self.widths = tuple(widths)
+        self.workers = workers
+        self.cache_file = self.output_dir / RESPONSIVE_CACHE_FILE
+
+    def build(self, image_paths: Dict[str, str]) -> Dict[str, Dict]:
+        """
+        Make sure every image in ``image_paths`` has its thumbnails.
+
+        Returns, per image name, its original ``width``/``height`` and the
+        generated ``thumbnails`` (smallest first; none for images narrower
+        than the smallest width).
+        """
+        print("\nBuilding responsive thumbnails...")
+        cache = _load_json_cache(self.cache_file)
+        results = {}
+        tasks = []
+
+        for img_name, img_path in image_paths.items():
+            if Path(img_path).suffix.lower() not in OPTIMIZABLE_EXTENSIONS:
+                continue
+            digest = file_sha256(Path(img_path))
+            key = f"{digest}:{','.join(map(str, self.widths))}"
+            cached = cache.get(key)
+            if cached and all(Path(t["path"]).exists() for t in cached["thumbnails"]):
+                results[img_name] = cached
+                continue
+            tasks.append({"name": img_name, "path": img_path, "digest": digest,
+                          "widths": self.widths, "key": key})
+
+        completed = _map_images(_build_derivatives, tasks, self.workers)
+
+        for task, result in zip(tasks, completed):
+            if result["error"]:
+                print(f"  Could not build thumbnails for {result['name']}: {result['error']}")
+                continue
+            cache[task["key"]] = result
+            results[result["name"]] = result
+
+        print(f"  Built thumbnails for {len(tasks)} images ({len(results) - len(tasks)} cached)")
+        _save_json_cache(self.cache_file, cache)
+        return results
+
+
+def _dct_matrix(np, size: int):
+    """Orthonormal DCT-II basis used by the perceptual hash."""
+    n = np.arange(size)
+    matrix = np.cos(np.pi * (2 * n[None, :] + 1) * n[:, None] / (2 * size))
+    matrix[0] /= np.sqrt(2)
+    return matrix * np.sqrt(2 / size)
+
+
+def _perceptual_hashes(task: Dict) -> Dict:
+    """
+    Compute the 64-bit dHash and pHash of one image; executed in a worker process.
+
+    dHash compares horizontally adjacent pixels of a 9x8 grayscale reduction;
+    pHash keeps the low-frequency 8x8 block of the DCT of a 32x32 reduction
+    and compares it with its median. pHash needs NumPy and is None without it.
+    """
+    Image = require_pillow()
+    np = optional_numpy()
+    result = {"name": task["name"], "dhash": None, "phash": None, "area": 0, "error": None}
+    try:
+        with Image.open(task["path"]) as img:
+            result["area"] = img.width * img.height
+            gray = img.convert("L")
+            small = gray.resize((9, 8), Image.LANCZOS)
+            if np is not None:
+                pixels = np.asarray(small, dtype=np.int16)
+                bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+                result["dhash"] = int("".join("1" if b else "0" for b in bits), 2)
+
+                reduced = np.asarray(gray.resize((32, 32), Image.LANCZOS), dtype=np.float64)
+                dct = _dct_matrix(np, 32)
+                low = (dct @ reduced @ dct.T)[:8, :8].flatten()
+                bits = low > np.median(low[1:])
+                result["phash"] = int("".join("1" if b else "0" for b in bits), 2)
+            else:
+                pixels = list(small.getdata())
+                bits = [pixels[row * 9 + col + 1] > pixels[row * 9 + col]
+                        for row in range(8) for col in range(8)]
+                result["dhash"] = int("".join("1" if b else "0" for b in bits), 2)
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    return result
+
+
+class BKTree:
+    """Burkhard-Keller tree over 64-bit hashes with Hamming distance."""
+
+    def __init__(self):
+        self.root = None  # [hash, item, {distance: child}]
+
+    def add(self, value: int, item):
+        if self.root is None:
+            self.root = [value, item, {}]
+            return
+        node = self.root
+        while True:
+            distance = bin(value ^ node[0]).count("1")
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [value, item, {}]
+                return
+            node = child
+
+    def search(self, value: int, max_distance: int) -> List:
+        """Items whose hash is within ``max_distance`` of ``value``."""
+        found = []
+        stack = [self.root] if self.root else []
+        while stack:
+            node = stack.pop()
+            distance = bin(value ^ node[0]).count("1")
+            if distance <= max_distance:
+                found.append(node[1])
+            # Triangle inequality: only children in this band can match
+            for child_distance, child in node[2].items():
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    stack.append(child)
+        return found
+
+
+class NearDuplicateDetector:
+    """
+    Cluster visually identical images (re-compressed, slightly cropped copies).
+
+    Perceptual hashes are computed across a process pool, candidate pairs
+    come from a BK-tree search on the dHash, and are confirmed against the
+    pHash when it is available. Clusters are formed with union-find; the
+    canonical image of a cluster is the one with the most pixels, then the
+    largest file, preferring lossless formats.
+    """
+
+    def __init__(self, output_dir: str, threshold: int = 6, workers: Optional[int] = None):
+        self.output_dir = Path(output_dir)
+        self.threshold = threshold
+        self.workers = workers
+
+    def find_clusters(self, image_mapping: Dict[str, str]) -> List[List[str]]:
+        """Return clusters of two or more images, canonical image first."""
+        print("\nDetecting near-duplicate images...")
+        tasks = [{"name": name, "path": path} for name, path in image_mapping.items()
+                 if Path(path).suffix.lower() in OPTIMIZABLE_EXTENSIONS]
+
+        hashes = _map_images(_perceptual_hashes, tasks, self.workers, chunksize=16)
+        hashes = {h["name"]: h for h in hashes if not h["error"]}
+        parent = {name: name for name in hashes}
+
+        def find(name):
+            while parent[name] != name:
+                parent[name] = parent[parent[name]]
+                name = parent[name]
+            return name
+
+        tree = BKTree()
+        for name, h in hashes.items():
+            for other in tree.search(h["dhash"], self.threshold):
+                other_phash = hashes[other]["phash"]
+                if h["phash"] is not None and other_phash is not None:
+                    if bin(h["phash"] ^ other_phash).count("1") > self.threshold:
+                        continue
+                parent[find(name)] = find(other)
+            tree.add(h["dhash"], name)
+
+        groups = {}
+        for name in hashes:
+            groups.setdefault(find(name), []).append(name)
+
+        clusters = []
+        for members in groups.values():
+            if len(members) < 2:
+                continue
+            members.sort(key=lambda n: (-hashes[n]["area"],
+                                        Path(n).suffix.lower() in LOSSY_EXTENSIONS,
+                                        -Path(image_mapping[n]).stat().st_size, n))
+            clusters.append(members)
+        clusters.sort()
+
+        print(f"  Found {len(clusters)} clusters covering "
+              f"{sum(len(c) for c in clusters)} of {len(hashes)} images")
+        return clusters
+
+    def write_report(self, clusters: List[List[str]], image_mapping: Dict[str, str]) -> Path:
+        report_file = self.output_dir / NEAR_DUPLICATES_FILE
+        report = {
+            "threshold": self.threshold,
+            "clusters": [
+                {
+                    "canonical": cluster[0],
+                    "duplicates": cluster[1:],
+                    "bytes_reclaimable": sum(Path(image_mapping[n]).stat().st_size for n in cluster[1:]),
+                }
+                for cluster in clusters
+            ],
+        }
+        with open(report_file, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"  Near-duplicate report saved to: {report_file}")
+        return report_file
+
+
+class ImageMatchIndex:
+    """
+    TF-IDF index over the text describing each extracted image.
+
+    The index is built once; ``query`` then scores every placeholder against
+    every image and returns the top-k images per placeholder. With NumPy the
+    image weights are kept as one row per token, and each query token adds
+    its row to the scores of the placeholders containing it, so the sparse
+    placeholder vectors are never expanded over the vocabulary; without
+    NumPy the same is done through an inverted index.
+    """
+
+    token_pattern = re.compile(r'[a-z0-9]+')
+
+    def __init__(self, documents: Dict[str, str]):
+        self.np = optional_numpy()
+        self.image_names = list(documents)
+        tokenized = [self.tokenize(documents[name]) for name in self.image_names]
+
+        document_frequency = {}
+        for tokens in tokenized:
+            for token in set(tokens):
+                document_frequency[token] = document_frequency.get(token, 0) + 1
+
+        count = len(self.image_names)
+        self.vocabulary = {token: i for i, token in enumerate(sorted(document_frequency))}
+        self.idf = {
+            token: math.log((1 + count) / (1 + df)) + 1.0
+            for token, df in document_frequency.items()
+        }
+
+        vectors = [self._vectorize(tokens) for tokens in tokenized]
+        if self.np is not None:
+            self.token_weights = self._to_token_rows(vectors)
+        else:
+            self.postings = {}
+            for image_idx, vector in enumerate(vectors):
+                for token, weight in vector.items():
+                    self.postings.setdefault(token, []).append((image_idx, weight))
+
+    @classmethod
+    def tokenize(cls, text: str) -> List[str]:
+        return cls.token_pattern.findall(text.lower())
+
+    def query(self, texts: List[str], top_k: int = 5) -> List[List[Tuple[str, float]]]:
+        """Return the ``top_k`` (image name, cosine score) pairs for each text."""
+        vectors = [self._vectorize(self.tokenize(text)) for text in texts]
+        if not self.image_names or not vectors:
+            return [[] for _ in texts]
+
+        if self.np is not None:
+            np = self.np
+            scores = self._score(vectors)
+            k = min(top_k, scores.shape[1])
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            top_scores = np.take_along_axis(scores, top, axis=1)
+            # Rank only the k candidates of each row
+            order = np.argsort(-top_scores, axis=1, kind='stable')
+            top = np.take_along_axis(top, order, axis=1).tolist()
+            top_scores = np.take_along_axis(top_scores, order, axis=1).tolist()
+            return [[(self.image_names[idx], score) for idx, score in zip(row, row_scores)
+                     if score > 0]
+                    for row, row_scores in zip(top, top_scores)]
+
+        results = []
+        for vector in vectors:
+            scores = {}
+            for token, weight in vector.items():
+                for image_idx, image_weight in self.postings.get(token, ()):
+                    scores[image_idx] = scores.get(image_idx, 0.0) + weight * image_weight
+            ranked = heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
+            results.append([(self.image_names[idx], score) for idx, score in ranked])
+        return results
+
+    def _vectorize(self, tokens: List[str]) -> Dict[str, float]:
+        """L2-normalized TF-IDF weights; tokens unknown to the index are dropped."""
+        weights = {}
+        for token in tokens:
+            if token in self.idf:
+                weights[token] = weights.get(token, 0.0) + self.idf[token]
+        norm = math.sqrt(sum(w * w for w in weights.values()))
+        return {token: w / norm for token, w in weights.items()} if norm else {}
+
+    def _to_token_rows(self, vectors: List[Dict[str, float]]):
+        """Image weights as a vocabulary x images matrix (one row per token)."""
+        matrix = self.np.zeros((len(self.vocabulary), len(vectors)), dtype=self.np.float32)
+        for column, vector in enumerate(vectors):
+            for token, weight in vector.items():
+                matrix[self.vocabulary[token], column] = weight
+        return matrix
+
+    def _score(self, vectors: List[Dict[str, float]]):
+        """Placeholders x images cosine scores, accumulated one query token at a time."""
+        np = self.np
+        postings = {}  # token -> (query rows, query weights)
+        for row, vector in enumerate(vectors):
+            for token, weight in vector.items():
+                rows, weights = postings.setdefault(token, ([], []))
+                rows.append(row)
+                weights.append(weight)
+
+        scores = np.zeros((len(vectors), len(self.image_names)), dtype=np.float32)
+        for token, (rows, weights) in postings.items():
+            # A token occurs once per query vector, so the rows are distinct
+            scores[rows] += (np.asarray(weights, dtype=np.float32)[:, None]
+                             * self.token_weights[self.vocabulary[token]])
+        return scores
+
+
 class MarkdownImageMapper:
     """Map extracted images to markdown placeholders."""
     
-    def __init__(self, md_directory: str, image_mapping: Dict[str, str]):
+    def __init__(self, md_directory: str, image_mapping: Dict[str, str],
+                 image_sources: Optional[Dict[str, Dict]] = None,
+                 image_index: Optional[Dict[str, Dict]] = None,
+                 cache_file: Optional[str] = None, workers: Optional[int] = None,
+                 metrics: Optional[RunMetrics] = None):
         self.md_directory = Path(md_directory)
         self.image_mapping = image_mapping
+        self.metrics = metrics or RunMetrics()
+        self.image_sources = image_sources or {}
+        self.image_index = image_index or {}
+        self.cache_file = Path(cache_file) if cache_file else None
+        self.workers = workers
+        self.candidates = {}
+        self.responsive = {}
+        self._match_index = None
         self.placeholder_pattern = re.compile(
             r'!\[([^\]]*)\]\(([^\)]*)\)|'  # Standard markdown images
             r'<img[^>]*src=["\']([^"\']*)["\'][^>]*>|'  # HTML img tags
             r'\[IMAGE:([^\]]*)\]|'  # Custom placeholder format [IMAGE:name]
             r'<!-- *IMAGE: *([^-]*) *-->'  # HTML comment placeholder
         )
+        # Markup added around an image by a previous responsive apply_mappings
+        self.attribute_list_pattern = re.compile(r'\{ loading=lazy [^}\n]*\}')
+        self.image_link_suffix_pattern = re.compile(r'\]\([^)\s]*\)\{ \.glightbox \}')
         
     def find_markdown_files(self) -> List[Path]:
         """Find all markdown files in the directory."""
@@ -401,136 +2224,752 @@ class MarkdownImageMapper:
         """
         placeholder_map = {}
         
-        md_files = self.find_markdown_files()
-        print(f"\nAnalyzing {len(md_files)} markdown files...")
-        
-        for md_file in md_files:
-            with open(md_file, 'r', encoding='utf-8') as f:
-                content = f.read()
-                
-            matches = self.placeholder_pattern.finditer(content)
-            placeholders = []
-            
-            for match in matches:
-                # Extract the placeholder text depending on which group matched
-                for group_idx, group in enumerate(match.groups()):
-                    if group:
-                        placeholders.append((group, match.start(), match.end()))
-                        break
-            
-            if placeholders:
-                placeholder_map[str(md_file)] = placeholders
-                print(f"  Found {len(placeholders)} placeholders in: {md_file.name}")
-        
+        with self.metrics.phase("analyze"):
+            md_files = self.find_markdown_files()
+            print(f"\nAnalyzing {len(md_files)} markdown files...")
+
+            found = dict(self.iter_placeholders(md_files))
+
+            # Keep the map in file-discovery order regardless of completion order
+            for md_file in md_files:
+                placeholders = found.get(str(md_file))
+                if placeholders:
+                    placeholder_map[str(md_file)] = placeholders
+
+        placeholder_count = sum(len(p) for p in placeholder_map.values())
+        self.metrics.count("markdown_files", len(md_files))
+        self.metrics.count("placeholders", placeholder_count)
+        print(f"  Found {placeholder_count} placeholders in {len(placeholder_map)} files")
         return placeholder_map
+
+    def iter_placeholders(self, md_files: List[Path]):
+        """
+        Yield ``(file path, placeholders)`` for each file as soon as it is known.
+
+        Files whose size and mtime match the scan cache are answered from it;
+        the rest are read and scanned concurrently on a thread pool and
+        yielded as they complete. The cache is saved once all files are done.
+        """
+        cache = self._load_scan_cache()
+        fresh_cache = {}
+        pending = []
+
+        for md_file in md_files:
+            stat = md_file.stat()
+            entry = cache.get(str(md_file))
+            if entry and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+                fresh_cache[str(md_file)] = entry
+                self.metrics.count("markdown_files_cached")
+                yield str(md_file), [tuple(p) for p in entry["placeholders"]]
+            else:
+                pending.append((md_file, stat))
+
+        if pending:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                futures = {executor.submit(self._scan_file, md_file): (md_file, stat)
+                           for md_file, stat in pending}
+                for future in as_completed(futures):
+                    md_file, stat = futures[future]
+                    placeholders = future.result()
+                    fresh_cache[str(md_file)] = {
+                        "size": stat.st_size,
+                        "mtime_ns": stat.st_mtime_ns,
+                        "placeholders": placeholders,
+                    }
+                    self.metrics.count("bytes_read", stat.st_size)
+                    if placeholders:
+                        self.metrics.log(f"  Found {len(placeholders)} placeholders in: {md_file.name}")
+                    yield str(md_file), placeholders
+
+        if self.cache_file and (pending or len(fresh_cache) != len(cache)):
+            self._save_scan_cache(fresh_cache)
+
+    def _scan_file(self, md_file: Path) -> List[Tuple[str, int, int]]:
+        """Read one markdown file and return its placeholder locations."""
+        with open(md_file, 'r', encoding='utf-8') as f:
+            content = f.read()
+
+        placeholders = []
+        for match in self.placeholder_pattern.finditer(content):
+            # Extract the placeholder text depending on which group matched
+            placeholder_text = self._placeholder_text(match)
+            if placeholder_text:
+                placeholders.append((placeholder_text, match.start(), match.end()))
+        return placeholders
+
+    def _load_scan_cache(self) -> Dict[str, Dict]:
+        if not self.cache_file or not self.cache_file.exists():
+            return {}
+        try:
+            with open(self.cache_file, 'r', encoding='utf-8') as f:
+                cache = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if cache.get("pattern") != self.placeholder_pattern.pattern:
+            return {}
+        return cache.get("files", {})
+
+    def _save_scan_cache(self, files: Dict[str, Dict]):
+        Path(self.cache_file).parent.mkdir(parents=True, exist_ok=True)
+        with open(self.cache_file, 'w', encoding='utf-8') as f:
+            json.dump({"pattern": self.placeholder_pattern.pattern, "files": files}, f)
     
-    def suggest_mappings(self, placeholder_map: Dict[str, List[Tuple[str, int]]]) -> Dict[str, str]:
+    def suggest_mappings(self, placeholder_map: Dict[str, List[Tuple[str, int]]],
+                         top_k: int = 5, min_score: float = 0.3) -> Dict[str, str]:
         """
         Suggest mappings between placeholders and extracted images.
-        Uses fuzzy matching based on placeholder text.
+
+        All placeholders are scored at once against an ``ImageMatchIndex``
+        built from each image's name, provenance and document context (see
+        ``image_index``). The ``top_k`` candidates per placeholder are kept
+        in ``self.candidates``. Within each markdown file, candidates above
+        ``min_score`` are then aligned so that images follow the document
+        order of the placeholders; placeholders left out of that alignment
+        fall back to their best candidate.
         """
+        with self.metrics.phase("suggest"):
+            suggestions = self._suggest(placeholder_map, top_k, min_score)
+        self.metrics.count("suggestions", len(suggestions))
+        print(f"  Suggested images for {len(suggestions)} placeholders")
+        return suggestions
+
+    def _suggest(self, placeholder_map: Dict[str, List[Tuple[str, int]]],
+                 top_k: int, min_score: float) -> Dict[str, str]:
         suggestions = {}
         
         print("\nSuggesting image mappings...")
-        
+
+        keys = []
+        texts = []
         for md_file, placeholders in placeholder_map.items():
             for placeholder_text, start, end in placeholders:
-                # Clean the placeholder text
-                clean_text = placeholder_text.lower().strip()
-                clean_text = re.sub(r'[^a-z0-9\s]', '', clean_text)
-                
-                # Try to match with extracted images
-                best_match = None
-                best_score = 0
-                
-                for img_name in self.image_mapping.keys():
-                    # Simple scoring based on common words
-                    score = self._calculate_similarity(clean_text, img_name.lower())
-                    if score > best_score:
-                        best_score = score
-                        best_match = img_name
-                
-                if best_match and best_score > 0.3:  # Threshold for match confidence
-                    suggestion_key = f"{md_file}:{placeholder_text}"
-                    suggestions[suggestion_key] = best_match
-                    print(f"  Suggested: '{placeholder_text}' -> {best_match}")
+                keys.append(f"{md_file}:{placeholder_text}")
+                texts.append(placeholder_text)
+
+        index = self.match_index()
+        ranked_by_key = {}
+        for key, ranked in zip(keys, index.query(texts, top_k)):
+            ranked_by_key[key] = [(img_name, score) for img_name, score in ranked if score > min_score]
+            self.candidates[key] = [[img_name, round(score, 4)] for img_name, score in ranked]
+
+        for md_file, placeholders in placeholder_map.items():
+            file_keys = [f"{md_file}:{placeholder_text}" for placeholder_text, _, _ in placeholders]
+            aligned = self._align_in_document_order(file_keys, ranked_by_key)
+            for key in file_keys:
+                best_match = aligned.get(key)
+                if best_match is None and ranked_by_key[key]:
+                    best_match = ranked_by_key[key][0][0]
+                if best_match and key not in suggestions:
+                    suggestions[key] = best_match
+                    self.metrics.log(f"  Suggested: '{key.split(':', 1)[1]}' -> {best_match}")
         
         return suggestions
+
+    def match_index(self) -> ImageMatchIndex:
+        """The ``ImageMatchIndex`` of the images, built on first use."""
+        if self._match_index is None:
+            self._match_index = ImageMatchIndex(self._describe_images())
+        return self._match_index
+
+    def set_images(self, image_mapping: Dict[str, str], image_sources: Dict[str, Dict],
+                   image_index: Dict[str, Dict]):
+        """Switch to a new extraction, dropping the match index built for the old one."""
+        self.image_mapping = image_mapping
+        self.image_sources = image_sources
+        self.image_index = image_index
+        self._match_index = None
+
+    def _align_in_document_order(self, keys: List[str],
+                                 ranked_by_key: Dict[str, List[Tuple[str, float]]]) -> Dict[str, str]:
+        """
+        Pick at most one candidate per placeholder so that the chosen images
+        appear in increasing document order and the summed score is maximal.
+
+        This is a weighted longest-increasing-subsequence over the candidates,
+        solved with a prefix-maximum Fenwick tree keyed by document order, so
+        it costs O(placeholders * top_k * log images).
+        """
+        size = len(self.image_index)
+        if not size:
+            return {}
+
+        # tree[i] holds (best chain score, chain tail) over orders covered by i
+        tree = [(0.0, None)] * (size + 1)
+
+        def best_before(order: int):
+            best = (0.0, None)
+            while order > 0:
+                if tree[order][0] > best[0]:
+                    best = tree[order]
+                order -= order & -order
+            return best
+
+        def record(order: int, entry):
+            while order <= size:
+                if entry[0] > tree[order][0]:
+                    tree[order] = entry
+                order += order & -order
+
+        for key in keys:
+            updates = []
+            for img_name, score in ranked_by_key.get(key, []):
+                position = self.image_index.get(img_name)
+                if not position:
+                    continue
+                order = position["order"]
+                chain_score, tail = best_before(order - 1)
+                updates.append((order, (chain_score + score, (key, img_name, tail))))
+            # Apply after scoring so a placeholder never chains with itself
+            for order, entry in updates:
+                record(order, entry)
+
+        aligned = {}
+        tail = best_before(size)[1]
+        while tail is not None:
+            key, img_name, tail = tail
+            aligned[key] = img_name
+        return aligned
+
+    def _describe_images(self) -> Dict[str, str]:
+        """Build the searchable text for each image from its name, provenance and context."""
+        documents = {}
+        for img_name in self.image_mapping:
+            parts = [os.path.splitext(img_name)[0].replace('_', ' ')]
+            source = self.image_sources.get(img_name, {})
+            for media_path in source.get("media_paths", []):
+                parts.append(posixpath.splitext(posixpath.basename(media_path))[0])
+
+            position = self.image_index.get(img_name)
+            if position:
+                parts.extend(position.get(field, "") for field in IMAGE_CONTEXT_FIELDS)
+            else:
+                for drawing in source.get("drawings", []):
+                    parts.extend(drawing.get(field, "") for field in IMAGE_CONTEXT_FIELDS)
+            documents[img_name] = " ".join(p for p in parts if p)
+        return documents
     
-    def _calculate_similarity(self, text1: str, text2: str) -> float:
-        """Calculate similarity between two strings."""
-        words1 = set(text1.split())
-        words2 = set(text2.split())
-        
-        if not words1 or not words2:
-            return 0.0
-        
-        intersection = words1 & words2
-        union = words1 | words2
-        
-        return len(intersection) / len(union) if union else 0.0
-    
-    def apply_mappings(self, mappings: Dict[str, str], backup: bool = True):
+    def apply_mappings(self, mappings: Dict[str, str], backup: bool = True,
+                       placeholder_map: Optional[Dict[str, List[Tuple[str, int, int]]]] = None,
+                       responsive: Optional[Dict[str, Dict]] = None):
         """
         Apply the image mappings to markdown files.
+
+        Each file is rewritten in a single pass: the placeholder offsets
+        recorded by ``analyze_placeholders`` (``placeholder_map``, or the
+        "placeholders" section of the mapping file) are checked against the
+        current content and the replacements are spliced in order. If any
+        offset no longer matches, the file is re-scanned once instead.
+
+        Images present in ``responsive`` (from ``ResponsiveImageBuilder``) are
+        written as a lazy-loaded thumbnail with explicit width/height that
+        links to the original, which glightbox then opens.
         
         Args:
             mappings: Dictionary mapping placeholder keys to image names
             backup: Whether to create backup files before modifying
+            placeholder_map: Placeholder locations per file from analyze_placeholders
+            responsive: Thumbnail information per image name
+        """
+        with self.metrics.phase("apply"):
+            self._apply(mappings, backup, placeholder_map, responsive)
+        print(f"  Updated {self.metrics.counters.get('markdown_files_updated', 0)} files "
+              f"({self.metrics.counters.get('placeholders_replaced', 0)} placeholders)")
+
+    def _apply(self, mappings: Dict[str, str], backup: bool,
+               placeholder_map: Optional[Dict[str, List[Tuple[str, int, int]]]],
+               responsive: Optional[Dict[str, Dict]]):
+        print("\nApplying mappings to markdown files...")
+        placeholder_map = placeholder_map or {}
+        self.responsive = responsive or {}
+        
+        # Group mappings by file
+        file_mappings = {}
+        for key, img_name in mappings.items():
+            md_file, placeholder = split_mapping_key(key)
+            if md_file not in file_mappings:
+                file_mappings[md_file] = {}
+            file_mappings[md_file][placeholder.lower()] = img_name
+
+        with AtomicFileWriter() as writer:
+            for md_file_path, placeholders in file_mappings.items():
+                self._apply_file(Path(md_file_path), placeholders,
+                                 placeholder_map.get(md_file_path, []), backup, writer)
+            for md_file, error in writer.commit():
+                self.metrics.error(f"Could not write {md_file.name}", error)
+                self.metrics.count("markdown_files_updated", -1)
+
+    def _apply_file(self, md_file: Path, placeholders: Dict[str, str],
+                    locations: List[Tuple[str, int, int]], backup: bool,
+                    writer: AtomicFileWriter):
+        """Queue the rewritten content of one markdown file on ``writer``."""
+        # Read the file
+        with open(md_file, 'r', encoding='utf-8') as f:
+            content = f.read()
+
+        matches = self._verified_matches(content, locations)
+        if matches is None:
+            if locations:
+                self.metrics.count("markdown_rescans")
+                self.metrics.log(f"  {md_file.name} changed since analysis; re-scanning placeholders")
+            matches = self.placeholder_pattern.finditer(content)
+
+        content, replaced = self._splice_replacements(content, matches, placeholders)
+        if not replaced:
+            self.metrics.log(f"  No mapped placeholders found in: {md_file.name}")
+            return
+
+        # Create backup if requested
+        if backup:
+            backup_file = md_file.with_suffix('.md.bak')
+            shutil.copy2(md_file, backup_file)
+            self.metrics.log(f"  Created backup: {backup_file.name}")
+
+        # Written to a temporary file and renamed into place on commit
+        writer.write_text(md_file, content)
+        
+        self.metrics.count("markdown_files_updated")
+        self.metrics.count("placeholders_replaced", replaced)
+        self.metrics.log(f"  Updated: {md_file.name} ({replaced} placeholders)")
+
+    def externalize_data_uris(self, store: ContentAddressedImageStore,
+                              backup: bool = True) -> Dict[str, List[str]]:
+        """
+        Move inline ``data:image`` URIs out of the markdown files.
+
+        Each file is scanned in chunks with ``DataUriScanner``; payloads are
+        decoded straight into ``store`` (so an image already extracted from
+        the document is reused) and each URI is replaced by the relative
+        path of the stored image. Returns the images referenced per file.
+        """
+        print("\nExternalizing inline data URIs...")
+        externalized = {}
+        with AtomicFileWriter() as writer:
+            for md_file in self.find_markdown_files():
+                replacements = self._externalize_file(md_file, store, writer, backup)
+                if replacements:
+                    externalized[str(md_file)] = replacements
+            for md_file, error in writer.commit():
+                self.metrics.error(f"Could not write {md_file.name}", error)
+                externalized.pop(str(md_file), None)
+
+        print(f"  Externalized {self.metrics.counters.get('data_uris_externalized', 0)} "
+              f"data URIs in {len(externalized)} files")
+        return externalized
+
+    def _externalize_file(self, md_file: Path, store: ContentAddressedImageStore,
+                          writer: AtomicFileWriter, backup: bool) -> List[str]:
+        """Queue the rewrite of one file's data URIs; return the images it now links to."""
+        replacements = []
+        with open(md_file, 'rb') as f:
+            for payload in DataUriScanner(f):
+                try:
+                    image_name, _ = store.add_stream(
+                        payload, f"inline.{payload.subtype.split('+')[0]}", min_size=MIN_IMAGE_SIZE)
+                except ValueError as e:
+                    self.metrics.error(f"Could not decode data URI in {md_file.name}", e)
+                    continue
+                if image_name:
+                    payload.drain()
+                    replacements.append((payload.start, payload.end, image_name))
+
+        # The markdown may only link to images that made it to disk
+        failed = set()
+        for image_name, error in store.commit():
+            self.metrics.error(f"Could not write {image_name}", error)
+            failed.add(image_name)
+        replacements = [r for r in replacements if r[2] not in failed]
+        if not replacements:
+            return []
+
+        if backup:
+            shutil.copy2(md_file, md_file.with_suffix('.md.bak'))
+        content = md_file.read_bytes()
+        pieces = []
+        position = 0
+        for start, end, image_name in replacements:
+            link = Path(os.path.relpath(store.path_of(image_name), md_file.parent)).as_posix()
+            pieces.extend((content[position:start], link.encode('utf-8')))
+            position = end
+        pieces.append(content[position:])
+        writer.write_bytes(md_file, b''.join(pieces))
+
+        self.metrics.count("data_uris_externalized", len(replacements))
+        self.metrics.log(f"  Externalized {len(replacements)} data URIs in: {md_file.name}")
+        return [image_name for _, _, image_name in replacements]
+
+    def _verified_matches(self, content: str, locations: List[Tuple[str, int, int]]):
+        """
+        Re-match the placeholder pattern at each recorded offset.
+
+        Returns the matches in file order, or None if no locations were
+        recorded for the file or any recorded location no longer holds the
+        same placeholder (the file was edited).
+        """
+        if not locations:
+            return None
+        matches = []
+        for placeholder_text, start, end in sorted(locations, key=lambda loc: loc[1]):
+            match = self.placeholder_pattern.match(content, start)
+            if match is None or match.end() != end or self._placeholder_text(match) != placeholder_text:
+                return None
+            matches.append(match)
+        return matches
+
+    def replace_placeholders(self, content: str, placeholders: Dict[str, str]) -> Tuple[str, int]:
+        """
+        Replace the placeholders of ``content`` in memory.
+
+        ``placeholders`` maps lower-cased placeholder text to image names;
+        images are linked through ``image_mapping``. Returns the new content
+        and the number of placeholders replaced.
+        """
+        return self._splice_replacements(content, self.placeholder_pattern.finditer(content),
+                                         placeholders)
+
+    def _splice_replacements(self, content: str, matches, placeholders: Dict[str, str]) -> Tuple[str, int]:
+        """Build the new content from the original in one left-to-right pass."""
+        pieces = []
+        position = 0
+        replaced = 0
+        for match in matches:
+            group_index, placeholder_text = self._placeholder_group(match)
+            if group_index not in REPLACEABLE_PLACEHOLDER_GROUPS:
+                continue
+            img_name = placeholders.get(placeholder_text.lower())
+            if img_name is None:
+                continue
+            start, end = self._replacement_span(content, match, position)
+            pieces.append(content[position:start])
+            pieces.append(self._image_markdown(placeholder_text, img_name))
+            position = end
+            replaced += 1
+        pieces.append(content[position:])
+        return ''.join(pieces), replaced
+
+    def _replacement_span(self, content: str, match, position: int) -> Tuple[int, int]:
+        """
+        The span to replace for a placeholder, widened to cover the attribute
+        list and thumbnail link written by an earlier responsive run so that
+        re-applying mappings does not nest them.
+        """
+        start, end = match.start(), match.end()
+        attributes = self.attribute_list_pattern.match(content, end)
+        if attributes:
+            end = attributes.end()
+        if start > position and content[start - 1] == '[':
+            link = self.image_link_suffix_pattern.match(content, end)
+            if link:
+                start, end = start - 1, link.end()
+        return start, end
+
+    def _image_markdown(self, alt_text: str, img_name: str) -> str:
+        """Markdown for one mapped image, using its thumbnail when there is one."""
+        img_path = self.image_mapping[img_name]
+        derivatives = self.responsive.get(img_name)
+        if not derivatives:
+            return f'![{alt_text}]({img_path})'
+
+        thumbnails = derivatives["thumbnails"]
+        if not thumbnails:
+            return (f'![{alt_text}]({img_path})'
+                    f'{{ loading=lazy width={derivatives["width"]} height={derivatives["height"]} }}')
+
+        inline = thumbnails[-1]
+        srcset = ", ".join(f'{t["path"]} {t["width"]}w' for t in thumbnails)
+        return (f'[![{alt_text}]({inline["path"]})'
+                f'{{ loading=lazy width={inline["width"]} height={inline["height"]} '
+                f'srcset="{srcset}, {img_path} {derivatives["width"]}w" }}]'
+                f'({img_path}){{ .glightbox }}')
+
+    @staticmethod
+    def _placeholder_group(match) -> Tuple[int, Optional[str]]:
+        """The index and text of whichever placeholder group matched."""
+        for group_index, group in enumerate(match.groups(), start=1):
+            if group:
+                return group_index, group
+        return 0, None
+
+    def _placeholder_text(self, match) -> Optional[str]:
+        return self._placeholder_group(match)[1]
+
+
+def split_mapping_key(key: str) -> Tuple[str, str]:
+    """Split a ``file:placeholder`` mapping key; the file may start with a drive letter."""
+    drive = 2 if re.match(r'[A-Za-z]:[\\/]', key) else 0
+    md_file, placeholder = key[drive:].split(':', 1)
+    return key[:drive] + md_file, placeholder
+
+
+def is_mapping_store(mapping_file: str) -> bool:
+    return Path(mapping_file).suffix.lower() in MAPPING_STORE_SUFFIXES
+
+
+class MappingStore:
+    """
+    Placeholders, candidate images, suggestions and manual overrides in an
+    indexed SQLite database, as an alternative to ``image_mappings.json``.
+
+    Pages are stored by their posix path relative to the markdown directory,
+    so keys written on Windows (``docs\\index.md``) and POSIX agree, and the
+    placeholder is a separate column rather than part of a ``file:text``
+    key. ``save_analysis`` only rewrites the pages whose placeholders changed
+    and the images of the document being saved, and queries such as
+    ``unmapped_placeholders`` or ``images_for_page`` run against indexes
+    instead of loading everything. ``as_config`` returns the same structure
+    as a JSON mapping file, so ``apply`` and ``report`` work on either.
+    """
+
+    schema = """
+        CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+        CREATE TABLE IF NOT EXISTS images (
+            name TEXT PRIMARY KEY, path TEXT NOT NULL, sha256 TEXT, document TEXT);
+        CREATE INDEX IF NOT EXISTS images_document ON images (document);
+        CREATE INDEX IF NOT EXISTS images_sha256 ON images (sha256);
+        CREATE TABLE IF NOT EXISTS pages (page TEXT PRIMARY KEY, signature TEXT NOT NULL);
+        CREATE TABLE IF NOT EXISTS placeholders (
+            page TEXT NOT NULL, position INTEGER NOT NULL, text TEXT NOT NULL,
+            key TEXT NOT NULL, start_offset INTEGER, end_offset INTEGER,
+            PRIMARY KEY (page, position));
+        CREATE INDEX IF NOT EXISTS placeholders_key ON placeholders (page, key);
+        CREATE TABLE IF NOT EXISTS candidates (
+            page TEXT NOT NULL, key TEXT NOT NULL, rank INTEGER NOT NULL,
+            image TEXT NOT NULL, score REAL, PRIMARY KEY (page, key, rank));
+        CREATE TABLE IF NOT EXISTS suggestions (
+            page TEXT NOT NULL, key TEXT NOT NULL, text TEXT NOT NULL,
+            image TEXT NOT NULL, score REAL, PRIMARY KEY (page, key));
+        CREATE INDEX IF NOT EXISTS suggestions_image ON suggestions (image);
+        CREATE TABLE IF NOT EXISTS manual_mappings (
+            page TEXT NOT NULL, key TEXT NOT NULL, text TEXT NOT NULL,
+            image TEXT NOT NULL, PRIMARY KEY (page, key));
+        CREATE INDEX IF NOT EXISTS manual_mappings_image ON manual_mappings (image);
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        with self.connection:
+            self.connection.executescript(self.schema)
+            self.connection.execute("INSERT OR IGNORE INTO meta VALUES ('version', ?)",
+                                    (str(MAPPING_STORE_VERSION),))
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    @property
+    def md_directory(self) -> Optional[str]:
+        row = self.connection.execute("SELECT value FROM meta WHERE key = 'md_directory'").fetchone()
+        return row[0] if row else None
+
+    def page_of(self, md_file: str, md_directory: Optional[str] = None) -> str:
+        """The posix path of ``md_file`` relative to the markdown directory."""
+        page = PurePosixPath(md_file.replace('\\', '/'))
+        base = (md_directory or self.md_directory or '.').replace('\\', '/')
+        try:
+            return page.relative_to(PurePosixPath(base)).as_posix()
+        except ValueError:
+            return page.as_posix()
+
+    def file_of(self, page: str) -> str:
+        """The path of ``page`` as the mapper opens it."""
+        return str(Path(self.md_directory or '.') / page)
+
+    def save_analysis(self, placeholder_map: Dict, suggestions: Optional[Dict] = None,
+                      candidates: Optional[Dict] = None, images: Optional[Dict[str, str]] = None,
+                      md_directory: Optional[str] = None, document: Optional[str] = None,
+                      image_sources: Optional[Dict[str, Dict]] = None) -> Tuple[int, int]:
+        """
+        Record an analysis. Pages whose placeholders are unchanged keep their
+        rows, pages missing from ``placeholder_map`` are dropped (their manual
+        mappings are kept), and suggestions and candidates are replaced only
+        when given. ``images`` replace the images of ``document`` alone.
+        Returns the number of pages rewritten and left unchanged.
         """
-        print("\nApplying mappings to markdown files...")
-        
-        # Group mappings by file
-        file_mappings = {}
-        for key, img_name in mappings.items():
-            md_file, placeholder = key.split(':', 1)
-            if md_file not in file_mappings:
-                file_mappings[md_file] = {}
-            file_mappings[md_file][placeholder] = img_name
-        
-        for md_file_path, placeholders in file_mappings.items():
-            md_file = Path(md_file_path)
-            
-            # Create backup if requested
-            if backup:
-                backup_file = md_file.with_suffix('.md.bak')
-                shutil.copy2(md_file, backup_file)
-                print(f"  Created backup: {backup_file.name}")
-            
-            # Read the file
-            with open(md_file, 'r', encoding='utf-8') as f:
-                content = f.read()
-            
-            # Replace placeholders
-            for placeholder, img_name in placeholders.items():
-                img_path = self.image_mapping[img_name]
-                
-                # Create different replacement patterns
-                patterns = [
-                    (f'![{placeholder}]([^)]*)', f'![{placeholder}]({img_path})'),
-                    (f'\\[IMAGE:{placeholder}\\]', f'![{placeholder}]({img_path})'),
-                    (f'<!-- *IMAGE: *{re.escape(placeholder)} *-->', 
-                     f'![{placeholder}]({img_path})'),
-                ]
-                
-                for pattern, replacement in patterns:
-                    content = re.sub(pattern, replacement, content, flags=re.IGNORECASE)
-            
-            # Write the updated content
-            with open(md_file, 'w', encoding='utf-8') as f:
-                f.write(content)
-            
-            print(f"  Updated: {md_file.name}")
+        connection = self.connection
+        md_directory = str(md_directory) if md_directory else self.md_directory
+        pages = {self.page_of(md_file, md_directory): placeholders
+                 for md_file, placeholders in placeholder_map.items()}
+        updated = unchanged = 0
+
+        with connection:
+            if md_directory:
+                connection.execute("INSERT OR REPLACE INTO meta VALUES ('md_directory', ?)",
+                                   (md_directory,))
+            if images is not None:
+                sources = image_sources or {}
+                connection.execute("DELETE FROM images WHERE document IS ?", (document,))
+                connection.executemany(
+                    "INSERT OR REPLACE INTO images VALUES (?, ?, ?, ?)",
+                    [(name, str(path), sources.get(name, {}).get("sha256"), document)
+                     for name, path in images.items()])
+
+            signatures = dict(connection.execute("SELECT page, signature FROM pages"))
+            for page in set(signatures) - set(pages):
+                for table in ("pages", "placeholders", "candidates", "suggestions"):
+                    connection.execute(f"DELETE FROM {table} WHERE page = ?", (page,))
+
+            for page, placeholders in pages.items():
+                rows = [tuple(p) for p in placeholders]
+                signature = hashlib.sha256(json.dumps(rows).encode('utf-8')).hexdigest()
+                if signatures.get(page) == signature:
+                    unchanged += 1
+                    continue
+                updated += 1
+                connection.execute("INSERT OR REPLACE INTO pages VALUES (?, ?)", (page, signature))
+                connection.execute("DELETE FROM placeholders WHERE page = ?", (page,))
+                connection.executemany(
+                    "INSERT INTO placeholders VALUES (?, ?, ?, ?, ?, ?)",
+                    [(page, position, text, text.lower(), start, end)
+                     for position, (text, start, end) in enumerate(rows)])
 
+            if candidates is not None:
+                connection.execute("DELETE FROM candidates")
+                connection.executemany(
+                    "INSERT OR REPLACE INTO candidates VALUES (?, ?, ?, ?, ?)",
+                    [(page, text.lower(), rank, img_name, score)
+                     for page, text, ranked in self._split_keys(candidates, md_directory)
+                     for rank, (img_name, score) in enumerate(ranked)])
+            if suggestions is not None:
+                scores = {(page, text.lower()): dict(map(tuple, ranked))
+                          for page, text, ranked in self._split_keys(candidates or {}, md_directory)}
+                connection.execute("DELETE FROM suggestions")
+                connection.executemany(
+                    "INSERT OR REPLACE INTO suggestions VALUES (?, ?, ?, ?, ?)",
+                    [(page, text.lower(), text, img_name,
+                      scores.get((page, text.lower()), {}).get(img_name))
+                     for page, text, img_name in self._split_keys(suggestions, md_directory)])
+        return updated, unchanged
 
-def create_mapping_file(placeholder_map: Dict, suggestions: Dict, output_file: str = "image_mappings.json"):
+    def _split_keys(self, mappings: Dict, md_directory: Optional[str]):
+        for key, value in mappings.items():
+            md_file, text = split_mapping_key(key)
+            yield self.page_of(md_file, md_directory), text, value
+
+    def set_manual(self, md_file: str, placeholder: str, img_name: Optional[str]):
+        """Override the image of one placeholder, or remove the override with ``None``."""
+        page = self.page_of(md_file)
+        with self.connection:
+            if img_name is None:
+                self.connection.execute("DELETE FROM manual_mappings WHERE page = ? AND key = ?",
+                                        (page, placeholder.lower()))
+            else:
+                self.connection.execute("INSERT OR REPLACE INTO manual_mappings VALUES (?, ?, ?, ?)",
+                                        (page, placeholder.lower(), placeholder, img_name))
+
+    def knows_image(self, img_name: str) -> bool:
+        """Whether ``img_name`` is a stored image (any name passes while none are stored)."""
+        query = "SELECT EXISTS (SELECT 1 FROM images WHERE name = ?), EXISTS (SELECT 1 FROM images)"
+        known, any_images = self.connection.execute(query, (img_name,)).fetchone()
+        return bool(known or not any_images)
+
+    def unmapped_placeholders(self) -> List[Tuple[str, str]]:
+        """``(page, placeholder)`` of every placeholder without a manual mapping or suggestion."""
+        return self.connection.execute("""
+            SELECT p.page, p.text FROM placeholders p
+            WHERE NOT EXISTS (SELECT 1 FROM manual_mappings m WHERE m.page = p.page AND m.key = p.key)
+              AND NOT EXISTS (SELECT 1 FROM suggestions s WHERE s.page = p.page AND s.key = p.key)
+            ORDER BY p.page, p.position
+        """).fetchall()
+
+    def images_for_page(self, md_file: str) -> List[Tuple[str, str, str]]:
+        """``(placeholder, image, "manual" or "suggested")`` for the mapped placeholders of a page."""
+        return self.connection.execute("""
+            SELECT p.text, COALESCE(m.image, s.image),
+                   CASE WHEN m.image IS NOT NULL THEN 'manual' ELSE 'suggested' END
+            FROM placeholders p
+            LEFT JOIN manual_mappings m ON m.page = p.page AND m.key = p.key
+            LEFT JOIN suggestions s ON s.page = p.page AND s.key = p.key
+            WHERE p.page = ? AND COALESCE(m.image, s.image) IS NOT NULL
+            ORDER BY p.position
+        """, (self.page_of(md_file),)).fetchall()
+
+    def pages_for_image(self, img_name: str) -> List[Tuple[str, str, str]]:
+        """``(page, placeholder, "manual" or "suggested")`` wherever an image is mapped."""
+        return self.connection.execute("""
+            SELECT page, text, 'manual' FROM manual_mappings WHERE image = ?
+            UNION ALL
+            SELECT s.page, s.text, 'suggested' FROM suggestions s WHERE s.image = ?
+              AND NOT EXISTS (SELECT 1 FROM manual_mappings m WHERE m.page = s.page AND m.key = s.key)
+            ORDER BY 1, 2
+        """, (img_name, img_name)).fetchall()
+
+    def as_config(self) -> Dict:
+        """The contents of the store in the layout of a JSON mapping file."""
+        connection = self.connection
+        placeholders = {}
+        for page, text, start, end in connection.execute(
+                "SELECT page, text, start_offset, end_offset FROM placeholders "
+                "ORDER BY page, position"):
+            placeholders.setdefault(self.file_of(page), []).append([text, start, end])
+        candidates = {}
+        for page, key, img_name, score, text in connection.execute("""
+                SELECT c.page, c.key, c.image, c.score, COALESCE(p.text, c.key) FROM candidates c
+                LEFT JOIN placeholders p ON p.page = c.page AND p.key = c.key
+                GROUP BY c.page, c.key, c.rank ORDER BY c.page, c.key, c.rank"""):
+            candidates.setdefault(f"{self.file_of(page)}:{text}", []).append([img_name, score])
+        return {
+            "md_directory": self.md_directory,
+            "images": dict(connection.execute("SELECT name, path FROM images ORDER BY name")),
+            "placeholders": placeholders,
+            "suggestions": {f"{self.file_of(page)}:{text}": img_name for page, text, img_name in
+                            connection.execute("SELECT page, text, image FROM suggestions")},
+            "candidates": candidates,
+            "manual_mappings": {f"{self.file_of(page)}:{text}": img_name for page, text, img_name in
+                                connection.execute("SELECT page, text, image FROM manual_mappings")},
+        }
+
+    def import_config(self, config: Dict):
+        """Load a JSON mapping file, normalizing its keys."""
+        md_directory = config.get("md_directory")
+        self.save_analysis(config.get("placeholders", {}), config.get("suggestions", {}),
+                           config.get("candidates", {}), config.get("images", {}), md_directory)
+        for page, text, img_name in self._split_keys(config.get("manual_mappings", {}), md_directory):
+            self.set_manual(page, text, img_name)
+
+
+def load_mapping_file(mapping_file: str) -> Dict:
+    """Load a mapping configuration file, or an empty one if it does not exist."""
+    if not os.path.exists(mapping_file):
+        return {}
+    if is_mapping_store(mapping_file):
+        with MappingStore(mapping_file) as store:
+            return store.as_config()
+    with open(mapping_file, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def create_mapping_file(placeholder_map: Dict, suggestions: Dict, output_file: str = "image_mappings.json",
+                        candidates: Optional[Dict] = None, images: Optional[Dict[str, str]] = None,
+                        md_directory: Optional[str] = None, document: Optional[str] = None,
+                        image_sources: Optional[Dict[str, Dict]] = None):
     """
     Create a mapping configuration file that can be manually edited.
+
+    Manual mappings already present in ``output_file`` are preserved. A
+    ``.db`` output file is a ``MappingStore``, updated incrementally.
     """
+    if is_mapping_store(output_file):
+        with MappingStore(output_file) as store:
+            updated, unchanged = store.save_analysis(placeholder_map, suggestions, candidates,
+                                                     images, md_directory, document, image_sources)
+        print(f"\nMapping store saved to: {output_file} "
+              f"({updated} pages updated, {unchanged} unchanged)")
+        print("Use the 'mappings' command to query it and set manual mappings")
+        return
+
+    existing = load_mapping_file(output_file)
     config = {
+        "md_directory": md_directory or existing.get("md_directory"),
+        "images": images if images is not None else existing.get("images", {}),
         "placeholders": placeholder_map,
         "suggestions": suggestions,
-        "manual_mappings": {},
+        "candidates": candidates or {},
+        "manual_mappings": existing.get("manual_mappings", {}),
         "instructions": (
             "Edit the 'manual_mappings' section to override suggestions. "
             "Format: {'file:placeholder': 'image_name'}"
@@ -541,92 +2980,999 @@ def create_mapping_file(placeholder_map: Dict, suggestions: Dict, output_file: s
         json.dump(config, f, indent=2)
     
     print(f"\nMapping configuration saved to: {output_file}")
-    print("Edit this file to adjust mappings, then run with --apply-mappings flag")
+    print("Edit this file to adjust mappings, then run the 'apply' command")
+
+
+def load_extraction(output_dir: str) -> Tuple[Dict[str, str], Dict[str, Dict], Dict[str, Dict]]:
+    """
+    Load the results of a previous extraction without touching the .docx.
+
+    Returns the image mapping (pointing at the optimized web file when the
+    optimization stage converted an image), the image provenance and the
+    document-position index.
+    """
+    output_dir = Path(output_dir)
+    manifest_file = output_dir / MANIFEST_FILE
+    if not manifest_file.exists():
+        return {}, {}, {}
+    with open(manifest_file, 'r', encoding='utf-8') as f:
+        image_sources = json.load(f).get("images", {})
+
+    optimized = {}
+    optimization_cache = output_dir / OPTIMIZATION_CACHE_FILE
+    if optimization_cache.exists():
+        with open(optimization_cache, 'r', encoding='utf-8') as f:
+            optimized = json.load(f)
+
+    image_mapping = {}
+    for img_name, source in image_sources.items():
+        result = optimized.get(source.get("sha256"))
+        image_mapping[img_name] = result["web_path"] if result else str(output_dir / img_name)
+    return image_mapping, image_sources, load_image_index(output_dir)
+
+
+def suggest_for_directory(md_directory: str, output_dir: str, mapping_file: str,
+                          image_mapping: Dict[str, str], image_sources: Dict[str, Dict],
+                          image_index: Dict[str, Dict], metrics: Optional[RunMetrics] = None,
+                          document: Optional[str] = None) -> Dict:
+    """Analyze a markdown tree, suggest mappings and write the mapping file."""
+    result = {"placeholders": 0, "suggestions": 0}
+    mapper = MarkdownImageMapper(md_directory, image_mapping, image_sources, image_index,
+                                 cache_file=str(Path(output_dir) / PLACEHOLDER_CACHE_FILE),
+                                 metrics=metrics)
+    placeholder_map = mapper.analyze_placeholders()
+    result["placeholders"] = sum(len(p) for p in placeholder_map.values())
+
+    if not placeholder_map:
+        print("\nNo image placeholders found in markdown files.")
+        return result
+
+    suggestions = mapper.suggest_mappings(placeholder_map)
+    result["suggestions"] = len(suggestions)
+    create_mapping_file(placeholder_map, suggestions, mapping_file, mapper.candidates,
+                        images=image_mapping, md_directory=str(md_directory), document=document,
+                        image_sources=image_sources)
+
+    print("\nNext steps:")
+    print(f"1. Review and edit the mapping file: {mapping_file}")
+    print("2. Run the 'apply' command to apply the mappings")
+    return result
+
+
+def run_pipeline(word_file: str, md_directory: Optional[str] = None,
+                 output_dir: str = "extracted_images", mapping_file: str = "image_mappings.json",
+                 force: bool = False, optimize: bool = False, workers: Optional[int] = None,
+                 near_duplicates: bool = False, collapse_duplicates: bool = False,
+                 hamming_threshold: int = 6, externalize_data_uris: bool = False,
+                 shared_cache: Optional[SharedImageCache] = None,
+                 metrics: Optional[RunMetrics] = None) -> Dict:
+    """
+    Extract images from one Word document and, when ``md_directory`` is
+    given, suggest mappings to its markdown files.
+
+    Returns a summary of the run (image, placeholder and suggestion counts).
+    Timings and counters of every stage are added to ``metrics``.
+    """
+    metrics = metrics or RunMetrics()
+    result = {
+        "document": str(word_file),
+        "md_directory": str(md_directory) if md_directory else None,
+        "output_dir": str(output_dir),
+        "mapping_file": str(mapping_file),
+        "images": 0,
+        "placeholders": 0,
+        "suggestions": 0,
+    }
+
+    # Step 1: Extract images from Word document
+    extractor = EnhancedWordImageExtractor(word_file, output_dir, force=force, metrics=metrics,
+                                           shared_cache=shared_cache)
+    image_mapping = extractor.extract_all_images()
+    result["images"] = len(image_mapping)
+
+    if not image_mapping:
+        print("\nNo images found in the Word document.")
+        print("This is unusual. Please check the extraction_report.txt for details.")
+        return result
+
+    print(f"\n{'=' * 60}")
+    print(f"Successfully extracted {len(image_mapping)} images to: {output_dir}")
+    print(f"Check extraction_report.txt for detailed information")
+    print(f"{'=' * 60}")
+
+    if near_duplicates or collapse_duplicates:
+        with metrics.phase("near_duplicates"):
+            detector = NearDuplicateDetector(output_dir, threshold=hamming_threshold, workers=workers)
+            clusters = detector.find_clusters(image_mapping)
+            detector.write_report(clusters, image_mapping)
+            result["near_duplicate_clusters"] = len(clusters)
+            metrics.count("near_duplicate_clusters", len(clusters))
+            if collapse_duplicates and clusters:
+                extractor.collapse_images({duplicate: cluster[0]
+                                           for cluster in clusters for duplicate in cluster[1:]})
+                result["images"] = len(image_mapping)
+
+    if optimize:
+        with metrics.phase("optimize"):
+            optimizer = ImageOptimizer(output_dir, workers=workers)
+            derivatives = {}
+            for img_name, optimized in optimizer.optimize(image_mapping).items():
+                original = extractor.store.path_of(img_name)
+                derivatives[img_name] = [path for path in (optimized["web_path"], optimized["webp"])
+                                         if path and Path(path) != original]
+                image_mapping[img_name] = optimized["web_path"]
+            extractor.record_derivatives(derivatives)
+
+    # Step 2: Analyze markdown files and suggest mappings
+    if md_directory and externalize_data_uris:
+        with metrics.phase("data_uris"):
+            mapper = MarkdownImageMapper(md_directory, image_mapping, metrics=metrics)
+            mapper.externalize_data_uris(extractor.store)
+
+    if md_directory:
+        result.update(suggest_for_directory(md_directory, output_dir, mapping_file, image_mapping,
+                                            extractor.image_sources, extractor.image_index,
+                                            metrics=metrics, document=str(word_file)))
+
+    return result
+
+
+class WatchSession:
+    """
+    Keep the extraction and mapping file of one document up to date while
+    the document and its markdown pages are edited.
+
+    The document and the markdown files under ``md_directory`` are polled
+    by size and mtime; a change is handled once a poll finds the files
+    unchanged again, so a document Word is still saving is not read
+    half-written. Everything stays in memory between changes: the extractor
+    is handed the previous manifest and re-extracts only members whose CRC
+    or size changed, only changed pages are re-scanned and re-suggested,
+    and the image match index is rebuilt only when the images change. The
+    markdown is never rewritten; the mapping file is. When it is also the
+    ``mapping_file`` of the docx_images hook, ``mkdocs serve`` rebuilds on
+    each rewrite (the hook watches it from ``on_serve`` if it exists when
+    the server starts).
+    """
+
+    def __init__(self, word_file: str, md_directory: Optional[str] = None,
+                 output_dir: str = "extracted_images", mapping_file: str = "image_mappings.json",
+                 interval: float = DEFAULT_POLL_INTERVAL, metrics: Optional[RunMetrics] = None,
+                 shared_cache: Optional[SharedImageCache] = None):
+        self.word_file = Path(word_file)
+        self.md_directory = Path(md_directory) if md_directory else None
+        self.output_dir = output_dir
+        self.mapping_file = mapping_file
+        self.interval = interval
+        self.metrics = metrics or RunMetrics()
+        self.shared_cache = shared_cache
+        self.manifest = None
+        self.image_mapping = {}
+        self.mapper = None
+        self.placeholder_map = {}
+        self.suggestions = {}
+
+    def snapshot(self) -> Dict[str, Tuple[int, int]]:
+        """``(mtime_ns, size)`` of every watched file."""
+        paths = [self.word_file]
+        if self.md_directory:
+            paths.extend(self.md_directory.rglob("*.md"))
+        snapshot = {}
+        for path in paths:
+            try:
+                stat = path.stat()
+            except OSError:
+                continue  # Removed between listing and stat
+            snapshot[str(path)] = (stat.st_mtime_ns, stat.st_size)
+        return snapshot
+
+    def run(self, max_polls: Optional[int] = None):
+        """Process everything once, then poll until interrupted (or for ``max_polls`` polls)."""
+        current = self.snapshot()
+        self.update(set(current), set())
+        watched = f" and {self.md_directory}" if self.md_directory else ""
+        print(f"Watching {self.word_file}{watched} every {self.interval}s (Ctrl+C to stop)")
+
+        pending = None
+        polls = 0
+        try:
+            while max_polls is None or polls < max_polls:
+                time.sleep(self.interval)
+                polls += 1
+                latest = self.snapshot()
+                if latest == current:
+                    pending = None
+                    continue
+                if latest != pending:
+                    # Still changing; wait for a quiet poll
+                    pending = latest
+                    continue
+                changed = {path for path, state in latest.items() if current.get(path) != state}
+                self.update(changed, set(current) - set(latest))
+                current, pending = latest, None
+        except KeyboardInterrupt:
+            print("\nStopped watching")
+
+    def update(self, changed: Set[str], removed: Set[str]):
+        """Re-extract and re-map after ``changed`` and ``removed`` files."""
+        started = time.perf_counter()
+        document_changed = str(self.word_file) in changed or self.manifest is None
+        changed_pages = [Path(path) for path in sorted(changed) if path != str(self.word_file)]
+
+        # Full per-image output is for one-off runs; print a line per change instead
+        with contextlib.redirect_stdout(StringIO()), self.metrics.collect_errors() as errors:
+            if document_changed:
+                self._extract()
+            if self.md_directory:
+                self._remap(changed_pages, removed, document_changed)
+
+        for message in errors:
+            print(message)
+        what = ["document"] if document_changed else []
+        if changed_pages or removed:
+            what.append(f"{len(changed_pages) + len(removed)} pages")
+        print(f"[{time.strftime('%H:%M:%S')}] {' and '.join(what) or 'nothing'} changed: "
+              f"{len(self.image_mapping)} images, "
+              f"{sum(len(p) for p in self.placeholder_map.values())} placeholders, "
+              f"{len(self.suggestions)} suggestions ({time.perf_counter() - started:.2f}s)")
+
+    def _extract(self):
+        extractor = EnhancedWordImageExtractor(str(self.word_file), self.output_dir,
+                                               metrics=self.metrics,
+                                               previous_manifest=self.manifest,
+                                               shared_cache=self.shared_cache)
+        self.image_mapping = extractor.extract_all_images()
+        self.manifest = extractor.manifest()
+        self.metrics.count("watch_extractions")
+        if self.mapper is None:
+            self.mapper = MarkdownImageMapper(str(self.md_directory or '.'), self.image_mapping,
+                                              extractor.image_sources, extractor.image_index,
+                                              metrics=self.metrics)
+        else:
+            self.mapper.set_images(self.image_mapping, extractor.image_sources,
+                                   extractor.image_index)
+
+    def _remap(self, changed_pages: List[Path], removed: Set[str], document_changed: bool):
+        mapper = self.mapper
+        for md_file, placeholders in mapper.iter_placeholders(changed_pages):
+            if placeholders:
+                self.placeholder_map[md_file] = placeholders
+            else:
+                self.placeholder_map.pop(md_file, None)
+        for md_file in removed:
+            self.placeholder_map.pop(md_file, None)
+        self.metrics.count("watch_pages_analyzed", len(changed_pages))
+
+        # New images change every suggestion; otherwise only the edited pages'
+        if document_changed:
+            stale = set(self.placeholder_map) | removed
+        else:
+            stale = {str(md_file) for md_file in changed_pages} | removed
+        for mappings in (self.suggestions, mapper.candidates):
+            for key in [key for key in mappings if split_mapping_key(key)[0] in stale]:
+                del mappings[key]
+        targets = {md_file: placeholders for md_file, placeholders in self.placeholder_map.items()
+                   if md_file in stale}
+        if targets and self.image_mapping:
+            self.suggestions.update(mapper.suggest_mappings(targets))
+
+        create_mapping_file(self.placeholder_map, self.suggestions, self.mapping_file,
+                            mapper.candidates, images=self.image_mapping,
+                            md_directory=str(self.md_directory), document=str(self.word_file),
+                            image_sources=mapper.image_sources)
+
+
+def apply_mapping_file(mapping_file: str, output_dir: str = "extracted_images",
+                       backup: bool = True, responsive: bool = False,
+                       thumbnail_widths: Optional[Tuple[int, ...]] = None,
+                       workers: Optional[int] = None, metrics: Optional[RunMetrics] = None) -> int:
+    """
+    Apply an (edited) mapping file to the markdown files it describes.
+
+    Only the mapping file is read: the placeholder offsets and image paths
+    recorded in it are used, and the .docx is never opened. Returns the
+    number of mappings applied.
+    """
+    config = load_mapping_file(mapping_file)
+    if not config:
+        print(f"Mapping file not found: {mapping_file}")
+        return 0
+
+    # Use manual mappings if available, otherwise use suggestions
+    mappings = config.get("manual_mappings", {})
+    if not mappings:
+        mappings = config.get("suggestions", {})
+    if not mappings:
+        print("No mappings found in configuration file.")
+        return 0
+
+    image_mapping = config.get("images") or load_extraction(output_dir)[0]
+    missing = sorted(set(mappings.values()) - set(image_mapping))
+    if missing:
+        print(f"Unknown images in mapping file: {', '.join(missing)}")
+        return 0
+
+    metrics = metrics or RunMetrics()
+    derivatives = None
+    if responsive:
+        with metrics.phase("responsive"):
+            mapped_images = {img: image_mapping[img] for img in set(mappings.values())}
+            builder = ResponsiveImageBuilder(output_dir,
+                                             thumbnail_widths or DEFAULT_THUMBNAIL_WIDTHS,
+                                             workers=workers)
+            derivatives = builder.build(mapped_images)
+
+    mapper = MarkdownImageMapper(config.get("md_directory") or ".", image_mapping, metrics=metrics)
+    mapper.apply_mappings(mappings, backup=backup, placeholder_map=config.get("placeholders", {}),
+                          responsive=derivatives)
+    print("\nMapping complete!")
+    return len(mappings)
+
+
+def print_report(output_dir: str, mapping_file: str):
+    """Summarize the last extraction and the state of the mapping file."""
+    manifest_file = Path(output_dir) / MANIFEST_FILE
+    if manifest_file.exists():
+        with open(manifest_file, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        source = manifest.get("source", {})
+        images = manifest.get("images", {})
+        total_bytes = sum(p.stat().st_size for p in Path(output_dir).glob("img_*") if p.is_file())
+        print(f"Document: {source.get('path')}")
+        print(f"  sha256: {source.get('sha256')}")
+        print(f"  Images: {len(images)} ({total_bytes / 1024:.1f} KB in {output_dir})")
+        print(f"  Parts tracked: {len(manifest.get('members', {}))}")
+    else:
+        print(f"No extraction found in {output_dir}")
+
+    metrics_file = Path(output_dir) / METRICS_FILE_TEMPLATE.format(command="extract")
+    if metrics_file.exists():
+        with open(metrics_file, 'r', encoding='utf-8') as f:
+            metrics = json.load(f)
+        phases = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in metrics["phases"].items())
+        print(f"  Last run: {phases}")
+        errors = metrics.get("errors", {})
+        if errors:
+            print("  Errors: " + ", ".join(f"{name} x{count}" for name, count in errors.items()))
+
+    config = load_mapping_file(mapping_file)
+    if not config:
+        print(f"No mapping file at {mapping_file}")
+        return
+
+    keys = {f"{md_file}:{placeholder[0]}"
+            for md_file, placeholders in config.get("placeholders", {}).items()
+            for placeholder in placeholders}
+    manual = config.get("manual_mappings", {})
+    suggested = config.get("suggestions", {})
+    mapped = keys & (set(manual) | set(suggested))
+    print(f"Mapping file: {mapping_file}")
+    print(f"  Placeholders: {len(keys)} in {len(config.get('placeholders', {}))} files")
+    print(f"  Manual mappings: {len(manual)}, suggestions: {len(suggested)}")
+    print(f"  Unmapped placeholders: {len(keys - mapped)}")
+    for key in sorted(keys - mapped):
+        print(f"    - {key}")
+
+
+class ImageGarbageCollector:
+    """
+    Find images in the docs tree that nothing references (mark and sweep).
+
+    The mark phase collects every path referenced by the markdown pages (the
+    ``MarkdownImageMapper`` placeholder scanner plus ordinary links, so a
+    full-size image linked from a thumbnail counts), HTML overrides, CSS
+    ``url()`` values and ``mkdocs.yml``. ``mkdocs.yml`` is scanned with a
+    regex rather than parsed, since it uses ``!!python`` tags. The sweep
+    phase lists the images under ``images_dir`` outside that set. An
+    extracted image and the derivatives its extraction manifest records
+    (WebP variants, PNG conversions) are kept or removed together.
+    """
+
+    link_pattern = re.compile(
+        r'\]\(\s*<?([^)\s>]+)|'                         # markdown links and images
+        r'(?:src|href|data-src|poster)=["\']([^"\']+)["\']|'  # HTML attributes
+        r'^\s*\[[^\]]+\]:\s*<?([^\s>]+)',                  # reference definitions
+        re.MULTILINE
+    )
+    srcset_pattern = re.compile(r'srcset=["\']([^"\']+)["\']')
+    css_url_pattern = re.compile(r'url\(\s*["\']?([^"\')]+)')
+    config_path_pattern = re.compile(
+        r'[\w./%-]+\.(?:png|jpe?g|gif|svg|ico|webp|bmp|tiff?|emf|wmf)\b', re.IGNORECASE)
+
+    def __init__(self, docs_dir: str = "docs", images_dir: Optional[str] = None,
+                 config_file: Optional[str] = "mkdocs.yml", metrics: Optional[RunMetrics] = None):
+        self.docs_dir = Path(docs_dir)
+        self.images_dir = Path(images_dir) if images_dir else self.docs_dir / "assets" / "images"
+        self.config_file = Path(config_file) if config_file else None
+        self.metrics = metrics or RunMetrics()
+        self.mapper = MarkdownImageMapper(str(self.docs_dir), {}, metrics=self.metrics)
+
+    def referenced_paths(self) -> Set[str]:
+        """Mark: the normalized absolute paths of everything referenced."""
+        referenced = set()
+        for md_file in self.mapper.find_markdown_files():
+            referenced.update(self._markdown_references(md_file))
+        for html_file in self.docs_dir.rglob("*.html"):
+            text = html_file.read_text(encoding='utf-8', errors='replace')
+            referenced.update(self._resolve(html_file.parent, self._link_targets(text)))
+        for css_file in self.docs_dir.rglob("*.css"):
+            text = css_file.read_text(encoding='utf-8', errors='replace')
+            referenced.update(self._resolve(css_file.parent, self.css_url_pattern.findall(text)))
+        if self.config_file and self.config_file.exists():
+            # Theme paths (logo, favicon, extra_css, ...) are relative to docs_dir
+            text = self.config_file.read_text(encoding='utf-8')
+            referenced.update(self._resolve(self.docs_dir, self.config_path_pattern.findall(text)))
+        return referenced
+
+    def find_unreferenced(self) -> List[Path]:
+        """Sweep: the images under ``images_dir`` that are not referenced."""
+        referenced = self.referenced_paths()
+        image_extensions = set(IMAGE_EXTENSIONS)
+        candidates = sorted(p for p in self.images_dir.rglob("*")
+                            if p.is_file() and p.suffix.lower() in image_extensions)
+        self.metrics.count("gc_images_scanned", len(candidates))
+        units = self._derivative_units()
+        return [p for p in candidates
+                if not any(path in referenced
+                           for path in units.get(self._normalize(p), (self._normalize(p),)))]
+
+    def _derivative_units(self) -> Dict[str, Set[str]]:
+        """Map each file of an image with recorded derivatives to all files of that image."""
+        units = {}
+        for manifest_file in self.images_dir.rglob(MANIFEST_FILE):
+            try:
+                with open(manifest_file, 'r', encoding='utf-8') as f:
+                    images = json.load(f).get("images", {})
+            except (OSError, ValueError) as e:
+                self.metrics.error(f"Could not read {manifest_file}", e)
+                continue
+            for image_name, provenance in images.items():
+                names = [image_name] + provenance.get("derivatives", [])
+                if len(names) == 1:
+                    continue
+                unit = {self._normalize(manifest_file.parent / name) for name in names}
+                for path in unit:
+                    units[path] = unit
+        return units
+
+    def collect(self, move_to: Optional[str] = None, delete: bool = False) -> Tuple[int, int]:
+        """
+        Report the unreferenced images and, with ``move_to`` or ``delete``,
+        move them aside (keeping their path below ``images_dir``) or delete
+        them. Returns the number of images and their total size.
+        """
+        unreferenced = self.find_unreferenced()
+        total_bytes = 0
+        for image in unreferenced:
+            size = image.stat().st_size
+            total_bytes += size
+            relative = image.relative_to(self.images_dir)
+            if move_to:
+                target = Path(move_to) / relative
+                target.parent.mkdir(parents=True, exist_ok=True)
+                shutil.move(str(image), str(target))
+            elif delete:
+                image.unlink()
+            self.metrics.log(f"  {relative} ({size / 1024:.1f} KB)")
+
+        self.metrics.count("gc_images_unreferenced", len(unreferenced))
+        self.metrics.count("gc_bytes_unreferenced", total_bytes)
+        action = f"Moved to {move_to}" if move_to else "Deleted" if delete else "Would remove"
+        print(f"{action}: {len(unreferenced)} unreferenced images in {self.images_dir} "
+              f"({total_bytes / (1024 * 1024):.2f} MB)")
+        if not (move_to or delete) and unreferenced:
+            print("Dry run; use --move-to DIR or --delete to remove them (--verbose lists them)")
+        return len(unreferenced), total_bytes
+
+    def _markdown_references(self, md_file: Path) -> Set[str]:
+        with open(md_file, 'r', encoding='utf-8') as f:
+            content = f.read()
+        targets = [match.group(2) or match.group(3)
+                   for match in self.mapper.placeholder_pattern.finditer(content)
+                   if match.group(2) or match.group(3)]
+        targets.extend(self._link_targets(content))
+        return self._resolve(md_file.parent, targets)
+
+    def _link_targets(self, text: str) -> List[str]:
+        targets = [next(group for group in match.groups() if group)
+                   for match in self.link_pattern.finditer(text)]
+        for srcset in self.srcset_pattern.findall(text):
+            targets.extend(candidate.split()[0] for candidate in srcset.split(',') if candidate.strip())
+        return targets
+
+    def _resolve(self, base_dir: Path, targets: List[str]) -> Set[str]:
+        """Resolve local targets (ignoring URLs, anchors and query strings)."""
+        resolved = set()
+        for target in targets:
+            parts = urlsplit(target.strip())
+            if parts.scheme or parts.netloc or not parts.path:
+                continue
+            path = unquote(parts.path)
+            if path.startswith('/'):
+                full_path = self.docs_dir / path.lstrip('/')
+            else:
+                full_path = base_dir / path
+            resolved.add(self._normalize(full_path))
+        return resolved
+
+    @staticmethod
+    def _normalize(path: Path) -> str:
+        return os.path.normcase(os.path.abspath(path))
+
+
+def find_batch_documents(source: str) -> List[Path]:
+    """Resolve a directory or glob pattern to the .docx files it contains."""
+    source_path = Path(source)
+    if source_path.is_dir():
+        candidates = source_path.glob("*.docx")
+    else:
+        candidates = (Path(p) for p in glob.glob(source))
+
+    # Skip Word's "~$name.docx" lock files
+    return sorted(p for p in candidates
+                  if p.suffix.lower() == '.docx' and not p.name.startswith('~$'))
+
+
+def _run_batch_job(job: Dict) -> Dict:
+    """Run the pipeline for one document of a batch; executed in a worker process."""
+    output_dir = Path(job["output_dir"])
+    output_dir.mkdir(parents=True, exist_ok=True)
+    log = StringIO()
+    started = time.perf_counter()
+
+    metrics = RunMetrics(verbose=job["verbose"])
+    try:
+        with contextlib.redirect_stdout(log):
+            result = run_pipeline(job["word_file"], job["md_directory"], str(output_dir),
+                                  job["mapping_file"], workers=1, metrics=metrics, **job["options"])
+        result["error"] = None
+    except Exception as e:
+        # Report the failure in batch_report.json and carry on with the other documents
+        metrics.error("Pipeline failed", e)
+        result = {"document": job["word_file"], "output_dir": str(output_dir),
+                  "error": f"{type(e).__name__}: {e}"}
+
+    result["seconds"] = round(time.perf_counter() - started, 3)
+    result["errors"] = metrics.errors
+    metrics.write(output_dir / METRICS_FILE_TEMPLATE.format(command="extract"))
+    (output_dir / "extraction.log").write_text(log.getvalue(), encoding='utf-8')
+    return result
+
+
+def run_batch(source: str, md_root: Optional[str], output_root: str, mapping_file_name: str,
+              workers: Optional[int] = None, verbose: bool = False, **options) -> Dict:
+    """
+    Process every .docx matched by ``source`` across a process pool.
+
+    Each document ``<stem>.docx`` gets its own output directory
+    ``<output_root>/<stem>`` (holding the images, report, log and mapping
+    file). When ``md_root`` is given, mappings are suggested against
+    ``<md_root>/<stem>`` if that exists, ``md_root`` otherwise. Remaining
+    keyword ``options`` are passed to ``run_pipeline``. An aggregate
+    ``batch_report.json`` is written to ``output_root``.
+    """
+    documents = find_batch_documents(source)
+    output_root = Path(output_root)
+    output_root.mkdir(parents=True, exist_ok=True)
+
+    jobs = []
+    for document in documents:
+        md_directory = None
+        if md_root:
+            md_directory = Path(md_root) / document.stem
+            if not md_directory.is_dir():
+                md_directory = Path(md_root)
+        doc_output = output_root / document.stem
+        jobs.append({
+            "word_file": str(document),
+            "md_directory": str(md_directory) if md_directory else None,
+            "output_dir": str(doc_output),
+            "mapping_file": str(doc_output / Path(mapping_file_name).name),
+            "verbose": verbose,
+            "options": options,
+        })
+
+    print(f"Processing {len(jobs)} documents with {workers or os.cpu_count()} workers...")
+    started = time.perf_counter()
+    results = []
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(_run_batch_job, job): job for job in jobs}
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            if result["error"]:
+                print(f"  FAILED {Path(result['document']).name}: {result['error']}")
+            else:
+                print(f"  {Path(result['document']).name}: {result['images']} images, "
+                      f"{result['placeholders']} placeholders ({result['seconds']}s)")
+
+    results.sort(key=lambda r: r["document"])
+    report = {
+        "documents": len(results),
+        "failed": sum(1 for r in results if r["error"]),
+        "images": sum(r.get("images", 0) for r in results),
+        "placeholders": sum(r.get("placeholders", 0) for r in results),
+        "seconds": round(time.perf_counter() - started, 3),
+        "results": results,
+    }
+
+    report_file = output_root / "batch_report.json"
+    with open(report_file, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+
+    print(f"\nBatch report saved to: {report_file}")
+    return report
+
+
+def shared_cache_from_args(args) -> Optional[SharedImageCache]:
+    """The shared cache selected by --shared-cache or $EXTRACT_IMAGES_CACHE, if any."""
+    if not (args.shared_cache or args.shared_cache_dir or os.environ.get(SHARED_CACHE_ENV)):
+        return None
+    return SharedImageCache(args.shared_cache_dir,
+                            max_bytes=int(args.shared_cache_size * 1024 * 1024))
+
+
+def cmd_extract(args, metrics: RunMetrics):
+    options = {
+        "force": args.force,
+        "optimize": args.optimize,
+        "near_duplicates": args.near_duplicates,
+        "collapse_duplicates": args.collapse_duplicates,
+        "hamming_threshold": args.hamming_threshold,
+        "externalize_data_uris": args.externalize_data_uris,
+        "shared_cache": shared_cache_from_args(args),
+    }
+    if args.watch:
+        if args.batch:
+            print("--watch follows a single document; it cannot be combined with --batch")
+            return
+        WatchSession(args.word_file, args.md_directory, args.output_dir, args.mapping_file,
+                     interval=args.poll_interval, metrics=metrics,
+                     shared_cache=options["shared_cache"]).run()
+    elif args.batch:
+        with metrics.phase("batch"):
+            report = run_batch(args.word_file, args.md_directory, args.output_dir,
+                               args.mapping_file, workers=args.workers,
+                               verbose=metrics.verbose, **options)
+        metrics.count("documents", report["documents"])
+        metrics.count("documents_failed", report["failed"])
+    else:
+        run_pipeline(args.word_file, args.md_directory, args.output_dir, args.mapping_file,
+                     workers=args.workers, metrics=metrics, **options)
+
+
+def cmd_analyze(args, metrics: RunMetrics):
+    mapper = MarkdownImageMapper(args.md_directory, {},
+                                 cache_file=str(Path(args.output_dir) / PLACEHOLDER_CACHE_FILE),
+                                 metrics=metrics)
+    placeholder_map = mapper.analyze_placeholders()
+    if is_mapping_store(args.mapping_file):
+        # Suggestions and candidates of unchanged pages stay in the store
+        create_mapping_file(placeholder_map, None, args.mapping_file,
+                            md_directory=args.md_directory)
+        return
+    config = load_mapping_file(args.mapping_file)
+    create_mapping_file(placeholder_map, config.get("suggestions", {}), args.mapping_file,
+                        config.get("candidates"), md_directory=args.md_directory)
+
+
+def cmd_suggest(args, metrics: RunMetrics):
+    image_mapping, image_sources, image_index = load_extraction(args.output_dir)
+    if not image_mapping:
+        print(f"No extracted images in {args.output_dir}; run the 'extract' command first.")
+        return
+    suggest_for_directory(args.md_directory, args.output_dir, args.mapping_file,
+                          image_mapping, image_sources, image_index, metrics=metrics)
+
+
+def cmd_apply(args, metrics: RunMetrics):
+    apply_mapping_file(args.mapping_file, args.output_dir, backup=not args.no_backup,
+                       responsive=args.responsive,
+                       thumbnail_widths=tuple(int(w) for w in args.thumbnail_widths.split(',')),
+                       workers=args.workers, metrics=metrics)
+
+
+def cmd_report(args, metrics: RunMetrics):
+    print_report(args.output_dir, args.mapping_file)
+
+
+def cmd_gc(args, metrics: RunMetrics):
+    collector = ImageGarbageCollector(args.docs_dir, args.images_dir, args.config_file,
+                                      metrics=metrics)
+    collector.collect(move_to=args.move_to, delete=args.delete)
+
+
+def cmd_mappings(args, metrics: RunMetrics):
+    if not is_mapping_store(args.mapping_file) and args.action in ("set", "unset", "import"):
+        print(f"{args.mapping_file} is not a mapping store; "
+              f"use --mapping-file with one of: {', '.join(MAPPING_STORE_SUFFIXES)}")
+        return
+
+    if is_mapping_store(args.mapping_file):
+        store = MappingStore(args.mapping_file)
+    else:
+        # Query a JSON mapping file through a temporary in-memory store
+        store = MappingStore(":memory:")
+        store.import_config(load_mapping_file(args.mapping_file))
+
+    with store:
+        if args.action == "import":
+            with open(args.arguments[0], 'r', encoding='utf-8') as f:
+                store.import_config(json.load(f))
+            print(f"Imported {args.arguments[0]} into {args.mapping_file}")
+        elif args.action == "export":
+            with open(args.arguments[0], 'w', encoding='utf-8') as f:
+                json.dump(store.as_config(), f, indent=2)
+            print(f"Exported {args.mapping_file} to {args.arguments[0]}")
+        elif args.action in ("set", "unset"):
+            md_file, placeholder = args.arguments[:2]
+            if args.action == "set" and not store.knows_image(args.arguments[2]):
+                print(f"Unknown image: {args.arguments[2]}")
+                return
+            store.set_manual(md_file, placeholder,
+                             args.arguments[2] if args.action == "set" else None)
+        elif args.action == "unmapped":
+            rows = store.unmapped_placeholders()
+            for page, placeholder in rows:
+                print(f"{page}: {placeholder}")
+            print(f"{len(rows)} unmapped placeholders")
+        elif args.action == "page":
+            for placeholder, img_name, origin in store.images_for_page(args.arguments[0]):
+                print(f"{placeholder} -> {img_name} ({origin})")
+        elif args.action == "image":
+            for page, placeholder, origin in store.pages_for_image(args.arguments[0]):
+                print(f"{page}: {placeholder} ({origin})")
+
+
+def run_profiled(func, args, metrics: RunMetrics, output_dir: Path, top: int = 25):
+    """
+    Run a command under cProfile and tracemalloc, save the profile to
+    ``profile.pstats`` in ``output_dir`` and print the hottest functions.
+    """
+    import cProfile
+    import pstats
+
+    profiler = cProfile.Profile()
+    tracemalloc.start()
+    try:
+        profiler.runcall(func, args, metrics)
+    finally:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    metrics.count("peak_traced_bytes", peak)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    profile_file = output_dir / PROFILE_FILE
+    profiler.dump_stats(str(profile_file))
+
+    print(f"\nPeak traced memory: {peak / (1024 * 1024):.1f} MiB")
+    print(f"Profile saved to: {profile_file} (top {top} by cumulative time)")
+    pstats.Stats(profiler).sort_stats("cumulative").print_stats(top)
 
 
 def main():
     parser = argparse.ArgumentParser(
         description="Extract ALL images from Word document and map to markdown placeholders"
     )
-    parser.add_argument(
-        "word_file",
-        help="Path to the Word document (Logic Builder Guide.docx)"
-    )
-    parser.add_argument(
-        "md_directory",
-        help="Directory containing markdown files"
-    )
-    parser.add_argument(
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument(
         "--output-dir",
         default="extracted_images",
         help="Directory to save extracted images (default: extracted_images)"
     )
-    parser.add_argument(
+    common.add_argument(
         "--mapping-file",
         default="image_mappings.json",
         help="Path to mapping configuration file"
     )
-    parser.add_argument(
-        "--apply-mappings",
+    common.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Number of worker processes for parallel stages (default: CPU count)"
+    )
+    common.add_argument(
+        "--verbose",
+        action="store_true",
+        help="Log every extracted image, placeholder and updated file"
+    )
+    common.add_argument(
+        "--profile",
+        action="store_true",
+        help=f"Run under cProfile/tracemalloc and save {PROFILE_FILE} to the output directory"
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    extract = subparsers.add_parser(
+        "extract", parents=[common],
+        help="Extract images from a Word document (optionally suggesting mappings)"
+    )
+    extract.set_defaults(func=cmd_extract)
+    extract.add_argument(
+        "word_file",
+        help="Path to the Word document (Logic Builder Guide.docx), "
+             "or a directory/glob of documents with --batch"
+    )
+    extract.add_argument(
+        "--md-directory",
+        help="Also analyze this markdown directory and write suggested mappings"
+    )
+    extract.add_argument(
+        "--force",
         action="store_true",
-        help="Apply mappings from the configuration file"
+        help="Ignore the extraction manifest and re-extract every image"
     )
-    parser.add_argument(
+    extract.add_argument(
+        "--optimize",
+        action="store_true",
+        help="Recompress PNGs losslessly, convert BMP/TIFF to PNG and write WebP variants"
+    )
+    extract.add_argument(
+        "--near-duplicates",
+        action="store_true",
+        help="Report clusters of visually identical images (perceptual hashing)"
+    )
+    extract.add_argument(
+        "--collapse-duplicates",
+        action="store_true",
+        help="Like --near-duplicates, but keep only the canonical image of each cluster"
+    )
+    extract.add_argument(
+        "--hamming-threshold",
+        type=int,
+        default=6,
+        help="Maximum perceptual hash distance (of 64 bits) for near duplicates (default: 6)"
+    )
+    extract.add_argument(
+        "--externalize-data-uris",
+        action="store_true",
+        help="Replace base64 data:image URIs in the --md-directory files with links to "
+             "stored images (backups are written as .md.bak)"
+    )
+    extract.add_argument(
+        "--shared-cache",
+        action="store_true",
+        help="Share extracted images with other guides through a machine-wide cache, "
+             f"hardlinking (or reflinking, or copying) them into --output-dir; also "
+             f"enabled by ${SHARED_CACHE_ENV}"
+    )
+    extract.add_argument(
+        "--shared-cache-dir",
+        help=f"Shared cache directory (default: ${SHARED_CACHE_ENV}, else "
+             "$XDG_CACHE_HOME/extract_images or ~/.cache/extract_images)"
+    )
+    extract.add_argument(
+        "--shared-cache-size",
+        type=float,
+        default=DEFAULT_SHARED_CACHE_BYTES / (1024 * 1024),
+        help="Size limit of the shared cache in MB; least recently used images are "
+             "evicted beyond it (default: %(default)d)"
+    )
+    extract.add_argument(
+        "--watch",
+        action="store_true",
+        help="Keep running: re-extract when the document changes and re-suggest mappings "
+             "for edited pages of --md-directory (markdown files are not modified)"
+    )
+    extract.add_argument(
+        "--poll-interval",
+        type=float,
+        default=DEFAULT_POLL_INTERVAL,
+        help="Seconds between checks of the watched files with --watch (default: %(default)s)"
+    )
+    extract.add_argument(
+        "--batch",
+        action="store_true",
+        help="Process every .docx in word_file (a directory or glob) in parallel; "
+             "each document writes to <output-dir>/<name> and uses "
+             "<md-directory>/<name> when present"
+    )
+
+    for name, func, help_text in (
+        ("analyze", cmd_analyze, "Record the image placeholders of a markdown directory"),
+        ("suggest", cmd_suggest, "Suggest mappings from previously extracted images"),
+    ):
+        subparser = subparsers.add_parser(name, parents=[common], help=help_text)
+        subparser.set_defaults(func=func)
+        subparser.add_argument(
+            "md_directory",
+            help="Directory containing markdown files"
+        )
+
+    apply = subparsers.add_parser(
+        "apply", parents=[common],
+        help="Apply the mapping file to the markdown files (never opens the .docx)"
+    )
+    apply.set_defaults(func=cmd_apply)
+    apply.add_argument(
         "--no-backup",
         action="store_true",
         help="Don't create backup files when applying mappings"
     )
-    
+    apply.add_argument(
+        "--responsive",
+        action="store_true",
+        help="Reference lazy-loaded thumbnails that link to the full image"
+    )
+    apply.add_argument(
+        "--thumbnail-widths",
+        default=",".join(map(str, DEFAULT_THUMBNAIL_WIDTHS)),
+        help="Comma-separated thumbnail widths for --responsive (default: %(default)s)"
+    )
+
+    report = subparsers.add_parser(
+        "report", parents=[common],
+        help="Summarize the last extraction and unmapped placeholders"
+    )
+    report.set_defaults(func=cmd_report)
+
+    gc = subparsers.add_parser(
+        "gc", parents=[common],
+        help="Find images in the docs tree that no page, CSS file or mkdocs.yml references"
+    )
+    gc.set_defaults(func=cmd_gc)
+    gc.add_argument(
+        "docs_dir",
+        nargs="?",
+        default="docs",
+        help="MkDocs docs directory (default: docs)"
+    )
+    gc.add_argument(
+        "--images-dir",
+        help="Directory to prune (default: <docs_dir>/assets/images)"
+    )
+    gc.add_argument(
+        "--config-file",
+        default="mkdocs.yml",
+        help="MkDocs configuration scanned for logo/favicon/CSS paths (default: mkdocs.yml)"
+    )
+    removal = gc.add_mutually_exclusive_group()
+    removal.add_argument(
+        "--move-to",
+        help="Move unreferenced images into this directory (keep it outside docs_dir); "
+             "without --move-to or --delete nothing is changed"
+    )
+    removal.add_argument(
+        "--delete",
+        action="store_true",
+        help="Delete unreferenced images"
+    )
+
+    # Arguments of each mappings action
+    mapping_actions = {
+        "unmapped": [],
+        "page": ["PAGE"],
+        "image": ["IMAGE"],
+        "set": ["PAGE", "PLACEHOLDER", "IMAGE"],
+        "unset": ["PAGE", "PLACEHOLDER"],
+        "import": ["JSON_FILE"],
+        "export": ["JSON_FILE"],
+    }
+    mappings = subparsers.add_parser(
+        "mappings", parents=[common],
+        help="Query or edit a mapping store (--mapping-file ending in .db); queries also "
+             "accept a JSON mapping file",
+        description="Actions: " + "; ".join(f"{action} {' '.join(names)}".strip()
+                                            for action, names in mapping_actions.items())
+    )
+    mappings.set_defaults(func=cmd_mappings)
+    mappings.add_argument("action", choices=sorted(mapping_actions))
+    mappings.add_argument("arguments", nargs="*", help="Arguments of the action")
+
     args = parser.parse_args()
-    
-    # Step 1: Extract images from Word document
-    extractor = EnhancedWordImageExtractor(args.word_file, args.output_dir)
-    image_mapping = extractor.extract_all_images()
-    
-    if not image_mapping:
-        print("\nNo images found in the Word document.")
-        print("This is unusual. Please check the extraction_report.txt for details.")
-        return
-    
-    print(f"\n{'=' * 60}")
-    print(f"Successfully extracted {len(image_mapping)} images to: {args.output_dir}")
-    print(f"Check extraction_report.txt for detailed information")
-    print(f"{'=' * 60}")
-    
-    # Step 2: Analyze markdown files
-    mapper = MarkdownImageMapper(args.md_directory, image_mapping)
-    placeholder_map = mapper.analyze_placeholders()
-    
-    if not placeholder_map:
-        print("\nNo image placeholders found in markdown files.")
-        print("The images have been extracted successfully though.")
-        return
-    
-    # Step 3: Create or load mappings
-    if args.apply_mappings and os.path.exists(args.mapping_file):
-        # Load existing mappings
-        with open(args.mapping_file, 'r') as f:
-            config = json.load(f)
-        
-        # Use manual mappings if available, otherwise use suggestions
-        mappings = config.get("manual_mappings", {})
-        if not mappings:
-            mappings = config.get("suggestions", {})
-        
-        if mappings:
-            mapper.apply_mappings(mappings, backup=not args.no_backup)
-            print("\nMapping complete!")
-        else:
-            print("No mappings found in configuration file.")
+    if args.command == "mappings" and len(args.arguments) != len(mapping_actions[args.action]):
+        mappings.error(f"{args.action} takes: {' '.join(mapping_actions[args.action]) or 'no arguments'}")
+    metrics = RunMetrics(verbose=args.verbose)
+    output_dir = Path(args.output_dir)
+    if args.profile:
+        run_profiled(args.func, args, metrics, output_dir)
     else:
-        # Generate suggestions and save configuration
-        suggestions = mapper.suggest_mappings(placeholder_map)
-        create_mapping_file(placeholder_map, suggestions, args.mapping_file)
-        
-        print("\nNext steps:")
-        print(f"1. Review and edit the mapping file: {args.mapping_file}")
-        print("2. Run again with --apply-mappings flag to apply the mappings")
+        args.func(args, metrics)
+
+    if args.command != "report" and output_dir.is_dir():
+        metrics.write(output_dir / METRICS_FILE_TEMPLATE.format(command=args.command))
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
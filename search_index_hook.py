@@ -0,0 +1,215 @@
+"""
+MkDocs hook that splits the search index into per-section shards after the
+build and loads the shards in the browser in place of the monolithic index.
+
+Hooks run after the configured plugins, so ``search/search_index.json`` has
+been written by the search plugin by the time ``on_post_build`` is called.
+Configure it under ``extra`` in mkdocs.yml::
+
+    hooks:
+      - search_index_hook.py
+
+    extra:
+      search_shards: true
+
+Material requests the index with an XMLHttpRequest as soon as a page loads.
+``search_shards.js`` (next to this hook) is added to the site and included
+before Material's bundle; it holds that request back until the search is
+first used, then fetches ``search/manifest.json`` and the shards it lists
+and answers the request with their documents. Pages that are never searched
+download no index at all. If the manifest or a shard can't be loaded, the
+request goes out unchanged and the monolithic index is used.
+
+Run this file directly to shard the index of an already built site::
+
+    python search_index_hook.py site
+"""
+
+import argparse
+import contextlib
+import gzip
+import io
+import json
+import logging
+import posixpath
+import re
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Optional
+
+from mkdocs.structure.files import File
+from mkdocs.utils import get_relative_url
+
+from extract_images import AtomicFileWriter, RunMetrics
+
+log = logging.getLogger(f"mkdocs.plugins.{__name__}")
+
+# Key of the hook configuration in the ``extra`` section of mkdocs.yml
+CONFIG_KEY = "search_shards"
+
+# Search index written by the MkDocs search plugin, and the shards made from it
+SEARCH_INDEX_FILE = "search/search_index.json"
+SEARCH_SHARD_DIR = "search/shards"
+SEARCH_MANIFEST_FILE = "search/manifest.json"
+SEARCH_MANIFEST_VERSION = 2
+ROOT_SEARCH_SECTION = "index"
+
+# Client-side shard loader, and where it is published in the site
+LOADER_FILE = Path(__file__).resolve().with_name("search_shards.js")
+LOADER_URI = "search/search_shards.js"
+
+# Script tag of Material's bundle; the loader must run before it
+BUNDLE_SCRIPT = re.compile(r'<script src="[^"]*assets/javascripts/bundle\.[0-9a-f]+\.min\.js">')
+
+
+@lru_cache(maxsize=None)
+def optional_brotli():
+    """Brotli adds .br variants of the search shards; None writes gzip only."""
+    try:
+        import brotli
+    except ImportError:
+        return None
+    return brotli
+
+
+class SearchIndexSharder:
+    """
+    Split the search index of a built MkDocs site into one shard per section.
+
+    The section of an entry is the first component of its location
+    (``configuration/start_stop_agent/#...`` is in ``configuration``); pages
+    at the site root form the ``index`` section. Each shard is written as
+    JSON with a gzip variant, plus a brotli variant when brotli is installed,
+    for servers that serve pre-compressed files. Shards hold documents only:
+    Material's worker builds one lunr index from the merged documents.
+    ``manifest.json`` lists the shards with their sizes. The monolithic ``search_index.json`` is left in place
+    as the fallback of the loader.
+    """
+
+    def __init__(self, site_dir: str = "site", metrics: Optional[RunMetrics] = None):
+        self.site_dir = Path(site_dir)
+        self.index_file = self.site_dir / SEARCH_INDEX_FILE
+        self.shard_dir = self.site_dir / SEARCH_SHARD_DIR
+        self.manifest_file = self.site_dir / SEARCH_MANIFEST_FILE
+        self.metrics = metrics or RunMetrics()
+
+    @staticmethod
+    def section_of(location: str) -> str:
+        """The shard name of a search entry location."""
+        path = location.split('#', 1)[0]
+        section = path.split('/', 1)[0] if '/' in path else ''
+        return re.sub(r'[^A-Za-z0-9_.-]', '_', section) or ROOT_SEARCH_SECTION
+
+    def shard(self) -> Dict:
+        """Write the shards and the manifest; returns the manifest."""
+        if not self.index_file.exists():
+            print(f"Search index not found: {self.index_file}")
+            return {}
+        with self.metrics.phase("search_load"):
+            with open(self.index_file, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+
+        sections = {}
+        for doc in index.get("docs", []):
+            sections.setdefault(self.section_of(doc.get("location", "")), []).append(doc)
+
+        search_config = index.get("config", {})
+        brotli = optional_brotli()
+        manifest = {
+            "version": SEARCH_MANIFEST_VERSION,
+            "config": search_config,
+            "sections": {},
+        }
+
+        self.shard_dir.mkdir(parents=True, exist_ok=True)
+        written = set()
+        with self.metrics.phase("search_shards"), AtomicFileWriter(fsync=False) as writer:
+            for section, docs in sorted(sections.items()):
+                shard = {"config": search_config, "docs": docs}
+                data = json.dumps(shard, separators=(',', ':')).encode('utf-8')
+
+                name = f"{section}.json"
+                variants = {name: data, f"{name}.gz": gzip.compress(data, 9, mtime=0)}
+                if brotli is not None:
+                    variants[f"{name}.br"] = brotli.compress(data)
+                for file_name, content in variants.items():
+                    writer.write_bytes(self.shard_dir / file_name, content)
+                    written.add(file_name)
+
+                manifest["sections"][section] = {
+                    "path": posixpath.join(posixpath.basename(SEARCH_SHARD_DIR), name),
+                    "docs": len(docs),
+                    "bytes": {file_name[len(name):].lstrip('.') or "json": len(content)
+                              for file_name, content in variants.items()},
+                }
+            writer.write_text(self.manifest_file,
+                              json.dumps(manifest, separators=(',', ':'), ensure_ascii=False))
+
+        # Sections that no longer exist
+        for stale in self.shard_dir.iterdir():
+            if stale.is_file() and stale.name not in written:
+                stale.unlink()
+
+        self.metrics.count("search_docs", sum(len(docs) for docs in sections.values()))
+        self.metrics.count("search_shards", len(sections))
+        largest = max((entry["bytes"] for entry in manifest["sections"].values()),
+                      key=lambda sizes: sizes["json"], default={"json": 0, "gz": 0})
+        print(f"Sharded {self.index_file.stat().st_size / 1024:.1f} KB search index into "
+              f"{len(sections)} sections: manifest {self.manifest_file.stat().st_size / 1024:.1f} KB, "
+              f"largest shard {largest['json'] / 1024:.1f} KB ({largest['gz'] / 1024:.1f} KB gzip)")
+        return manifest
+
+
+def _settings(config) -> Optional[Dict]:
+    settings = config.extra.get(CONFIG_KEY)
+    if settings is None or settings is False:
+        return None
+    return {} if settings is True else settings
+
+
+def on_files(files, config):
+    if _settings(config) is None:
+        return files
+    existing = files.get_file_from_path(LOADER_URI)
+    if existing is not None:
+        files.remove(existing)
+    files.append(File.generated(config, LOADER_URI, abs_src_path=str(LOADER_FILE)))
+    return files
+
+
+def on_post_page(output, page, config):
+    if _settings(config) is None:
+        return output
+    match = BUNDLE_SCRIPT.search(output)
+    if match is None:
+        return output
+    src = get_relative_url(LOADER_URI, page.url)
+    start = match.start()
+    indent = output[output.rfind('\n', 0, start) + 1:start]
+    return f'{output[:start]}<script src="{src}"></script>\n{indent}{output[start:]}'
+
+
+def on_post_build(config):
+    if _settings(config) is None:
+        return
+
+    sharder = SearchIndexSharder(config.site_dir)
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        sharder.shard()
+    for line in output.getvalue().splitlines():
+        log.info(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Split the search index of a built site into per-section, compressed shards")
+    parser.add_argument("site_dir", nargs="?", default="site",
+                        help="Built MkDocs site directory (default: site)")
+    args = parser.parse_args()
+
+    SearchIndexSharder(args.site_dir).shard()
+
+
+if __name__ == "__main__":
+    main()
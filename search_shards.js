@@ -0,0 +1,101 @@
+/*
+ * Loads the search index from the per-section shards written by
+ * search_index_hook.py.
+ *
+ * Material requests search/search_index.json with an XMLHttpRequest as soon
+ * as a page loads. This script runs before Material's bundle and holds that
+ * request back until the search is first used. It then fetches
+ * search/manifest.json and every shard it lists in parallel, and answers the
+ * request with their merged documents. If anything fails, the original
+ * request is sent and the monolithic index is loaded instead.
+ */
+(function () {
+  "use strict"
+
+  var INDEX_PATH = /\/search\/search_index\.json$/
+  var SEARCH_QUERY = "[data-md-component=search-query]"
+
+  /* Resolves once the search is opened or focused, or the URL holds a query */
+  var searchUsed = new Promise(function (resolve) {
+    if (new URLSearchParams(location.search).has("q"))
+      return resolve()
+    function onUse(ev) {
+      var target = ev.target
+      if (target.id === "__search" || (target.matches && target.matches(SEARCH_QUERY)))
+        resolve()
+    }
+    document.addEventListener("focusin", onUse, true)
+    document.addEventListener("change", onUse, true)
+  })
+
+  function fetchJSON(url) {
+    return fetch(url).then(function (response) {
+      if (!response.ok)
+        throw new Error(response.status + " " + url)
+      return response.json()
+    })
+  }
+
+  /* Merge the documents of all shards */
+  function loadShards(indexUrl) {
+    var manifestUrl = new URL("manifest.json", indexUrl)
+    return fetchJSON(manifestUrl).then(function (manifest) {
+      var sections = Object.keys(manifest.sections)
+      return Promise.all(sections.map(function (section) {
+        return fetchJSON(new URL(manifest.sections[section].path, manifestUrl))
+      })).then(function (shards) {
+        var docs = []
+        shards.forEach(function (shard) {
+          docs.push.apply(docs, shard.docs)
+        })
+        return { config: manifest.config, docs: docs }
+      })
+    })
+  }
+
+  /* Complete an unsent request as if the server had answered with the index */
+  function respond(xhr, index) {
+    var text = JSON.stringify(index)
+    var response = text
+    if (xhr.responseType === "blob")
+      response = new Blob([text], { type: "application/json" })
+    else if (xhr.responseType === "json")
+      response = index
+    Object.defineProperty(xhr, "readyState", { value: XMLHttpRequest.DONE })
+    Object.defineProperty(xhr, "status", { value: 200 })
+    Object.defineProperty(xhr, "statusText", { value: "OK" })
+    Object.defineProperty(xhr, "response", { value: response })
+    if (!xhr.responseType || xhr.responseType === "text")
+      Object.defineProperty(xhr, "responseText", { value: text })
+    xhr.dispatchEvent(new Event("readystatechange"))
+    xhr.dispatchEvent(new Event("load"))
+    xhr.dispatchEvent(new Event("loadend"))
+  }
+
+  var open = XMLHttpRequest.prototype.open
+  var send = XMLHttpRequest.prototype.send
+
+  XMLHttpRequest.prototype.open = function (method, url) {
+    var target = new URL(url, location.href)
+    this.searchIndexUrl = String(method).toUpperCase() === "GET" && INDEX_PATH.test(target.pathname)
+      ? target
+      : null
+    return open.apply(this, arguments)
+  }
+
+  XMLHttpRequest.prototype.send = function () {
+    var xhr = this
+    var args = arguments
+    if (!xhr.searchIndexUrl)
+      return send.apply(xhr, args)
+    searchUsed
+      .then(function () {
+        return loadShards(xhr.searchIndexUrl)
+      })
+      .then(function (index) {
+        respond(xhr, index)
+      }, function () {
+        send.apply(xhr, args)
+      })
+  }
+})()
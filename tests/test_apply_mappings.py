@@ -0,0 +1,50 @@
+"""Regression tests for MarkdownImageMapper.apply_mappings."""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from extract_images import MarkdownImageMapper  # noqa: E402
+
+
+def write_page(tmp_path: Path) -> Path:
+    page = tmp_path / "docs" / "install.md"
+    page.parent.mkdir()
+    page.write_text("# Install\n\n![EW Agent Files](old.png)\n", encoding="utf-8")
+    return page
+
+
+def test_apply_without_placeholder_map_rescans(tmp_path):
+    page = write_page(tmp_path)
+    mapper = MarkdownImageMapper(str(page.parent), {"img_x.png": "img/x.png"})
+
+    mapper.apply_mappings({f"{page}:EW Agent Files": "img_x.png"}, backup=False)
+
+    assert "![EW Agent Files](img/x.png)" in page.read_text(encoding="utf-8")
+    assert mapper.metrics.counters["markdown_files_updated"] == 1
+    assert mapper.metrics.counters["placeholders_replaced"] == 1
+
+
+def test_apply_differently_spelled_key_rescans(tmp_path):
+    page = write_page(tmp_path)
+    mapper = MarkdownImageMapper(str(page.parent), {"img_x.png": "img/x.png"})
+    # Locations were recorded under another spelling of the same path
+    placeholder_map = {f"{page.parent}/./install.md": [("EW Agent Files", 11, 36)]}
+
+    mapper.apply_mappings({f"{page}:EW Agent Files": "img_x.png"}, backup=False,
+                          placeholder_map=placeholder_map)
+
+    assert "![EW Agent Files](img/x.png)" in page.read_text(encoding="utf-8")
+
+
+def test_file_without_mapped_placeholders_is_left_alone(tmp_path):
+    page = write_page(tmp_path)
+    mtime = page.stat().st_mtime_ns
+    mapper = MarkdownImageMapper(str(page.parent), {"img_x.png": "img/x.png"})
+
+    mapper.apply_mappings({f"{page}:Missing": "img_x.png"}, backup=True)
+
+    assert page.stat().st_mtime_ns == mtime
+    assert not page.with_suffix(".md.bak").exists()
+    assert mapper.metrics.counters.get("markdown_files_updated", 0) == 0